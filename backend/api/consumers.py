@@ -2,15 +2,21 @@
 WebSocket consumers for real-time messaging and notifications.
 """
 
+import asyncio
 import json
 import uuid
-from datetime import datetime
 from typing import Dict, Any
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from .models import Conversation, Message, Notification
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Conversation, MessageConversation, SystemNotification
+from .services import messaging_counters, presence, read_cursors
+from .services import ws_delivery
+from .services.ws_delivery import BatchedSendMixin
 
 User = get_user_model()
 
@@ -31,9 +37,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
             
-        # Verify user has access to this conversation
-        has_access = await self.verify_conversation_access()
-        if not has_access:
+        # Verify user has access to this conversation (participant set cached per connection)
+        await self.load_participants()
+        if str(self.user.id) not in self.participants:
             await self.close()
             return
         
@@ -45,36 +51,72 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Send user online status
-        await self.channel_layer.group_send(
-            self.conversation_group_name,
-            {
-                'type': 'user_status',
-                'user_id': str(self.user.id),
-                'status': 'online',
-                'timestamp': datetime.now().isoformat()
+        # Presence: watch the other participants, announce only real transitions
+        watched = sorted(self.participants - {str(self.user.id)})
+        watched = watched[:getattr(settings, 'MESSAGING_PRESENCE_MAX_WATCHED', 50)]
+        self.presence_groups = [presence.GROUP.format(user_id=user_id) for user_id in watched]
+        for group in self.presence_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        
+        if await presence.connect(self.user.id, self.channel_name):
+            await self.channel_layer.group_send(
+                presence.GROUP.format(user_id=self.user.id),
+                presence.status_event(self.user.id, 'online')
+            )
+        self.heartbeat_task = asyncio.ensure_future(self.presence_heartbeat())
+        
+        # Typing debounce state (per connection)
+        self.typing_pending = False
+        self.typing_sent = False
+        self.typing_sent_at = 0.0
+        self.typing_flush = None
+        
+        # Snapshot instead of replaying status events
+        await self.send(text_data=json.dumps({
+            'type': 'presence_snapshot',
+            'data': {
+                'online': await presence.online_users(watched),
+                'timestamp': timezone.now().isoformat()
             }
-        )
+        }))
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
         if hasattr(self, 'conversation_group_name'):
-            # Send user offline status
-            await self.channel_layer.group_send(
-                self.conversation_group_name,
-                {
-                    'type': 'user_status',
-                    'user_id': str(self.user.id),
-                    'status': 'offline',
-                    'timestamp': datetime.now().isoformat()
-                }
-            )
-            
             # Leave conversation group
             await self.channel_layer.group_discard(
                 self.conversation_group_name,
                 self.channel_name
             )
+        
+        if hasattr(self, 'heartbeat_task'):
+            self.heartbeat_task.cancel()
+            if self.typing_flush and not self.typing_flush.done():
+                self.typing_flush.cancel()
+            if self.typing_sent:
+                await self.send_typing(False)
+            
+            for group in self.presence_groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            await presence.disconnect(self.user.id, self.channel_name)
+            
+            # Offline is announced only if no connection reappears within the grace period
+            asyncio.ensure_future(self.settle_offline(self.channel_layer, self.user.id))
+
+    async def presence_heartbeat(self):
+        """Refresh this connection's presence entry until disconnect."""
+        while True:
+            await asyncio.sleep(presence.heartbeat_interval())
+            await presence.heartbeat(self.user.id, self.channel_name)
+
+    @staticmethod
+    async def settle_offline(channel_layer, user_id):
+        await asyncio.sleep(presence.offline_grace())
+        if await presence.settle_offline(user_id):
+            await channel_layer.group_send(
+                presence.GROUP.format(user_id=user_id),
+                presence.status_event(user_id, 'offline')
+            )
 
     async def receive(self, text_data):
         """Process received WebSocket message."""
@@ -107,33 +149,52 @@ class ChatConsumer(AsyncWebsocketConsumer):
         content = data.get('content', '').strip()
         if not content:
             return
+        if str(self.user.id) not in self.participants:
+            await self.close()
+            return
             
         # Save message to database
         message = await self.save_message(content)
         if not message:
             return
             
-        # Broadcast message to conversation group
+        # Broadcast message to conversation group (frame serialized once for all subscribers)
         await self.channel_layer.group_send(
             self.conversation_group_name,
-            {
-                'type': 'chat_message_broadcast',
-                'message': {
-                    'id': str(message.id),
-                    'content': message.content,
-                    'sender': {
-                        'id': str(message.sender.id),
-                        'name': message.sender.get_full_name() or message.sender.username,
-                        'avatar': getattr(message.sender, 'avatar_url', None)
-                    },
-                    'timestamp': message.created_at.isoformat(),
-                    'message_type': message.message_type
-                }
-            }
+            ws_delivery.group_event('chat_message_broadcast', 'new_message', {
+                'id': str(message.id),
+                'content': message.content,
+                'sender': {
+                    'id': str(self.user.id),
+                    'name': self.user.get_full_name() or self.user.username,
+                    'avatar': getattr(self.user, 'avatar_url', None)
+                },
+                'timestamp': message.created_at.isoformat(),
+                'message_type': message.message_type,
+                'conversation_id': str(self.conversation_id)
+            })
         )
 
     async def handle_typing_status(self, data: Dict[str, Any], is_typing: bool):
-        """Handle typing indicator status."""
+        """
+        Debounce typing indicators: at most one broadcast per
+        MESSAGING_TYPING_DEBOUNCE_MS, always ending on the latest state.
+        """
+        self.typing_pending = is_typing
+        if self.typing_flush is None or self.typing_flush.done():
+            debounce = getattr(settings, 'MESSAGING_TYPING_DEBOUNCE_MS', 1000) / 1000
+            delay = max(self.typing_sent_at + debounce - asyncio.get_running_loop().time(), 0)
+            self.typing_flush = asyncio.ensure_future(self.flush_typing(delay))
+
+    async def flush_typing(self, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        if self.typing_pending != self.typing_sent:
+            await self.send_typing(self.typing_pending)
+
+    async def send_typing(self, is_typing: bool):
+        self.typing_sent = is_typing
+        self.typing_sent_at = asyncio.get_running_loop().time()
         await self.channel_layer.group_send(
             self.conversation_group_name,
             {
@@ -141,7 +202,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'user_id': str(self.user.id),
                 'user_name': self.user.get_full_name() or self.user.username,
                 'is_typing': is_typing,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timezone.now().isoformat()
             }
         )
 
@@ -149,15 +210,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Mark messages as read."""
         message_ids = data.get('message_ids', [])
         if message_ids:
-            await self.mark_messages_read(message_ids)
+            cursor = await self.mark_messages_read(message_ids)
+            if cursor:
+                # Um evento de cursor para o grupo, não um por mensagem
+                await self.channel_layer.group_send(
+                    self.conversation_group_name,
+                    read_cursors.cursor_event(cursor)
+                )
 
     # Event handlers for group messages
     async def chat_message_broadcast(self, event):
-        """Send message to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'new_message',
-            'data': event['message']
-        }))
+        """Send message to WebSocket, forwarding the producer's pre-serialized payload."""
+        payload = event.get('payload')
+        if payload is None:
+            payload = ws_delivery.frame('new_message', event['message'])
+        await self.send(text_data=payload)
 
     async def typing_status(self, event):
         """Send typing status to WebSocket."""
@@ -172,6 +239,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             }))
 
+    async def read_cursor(self, event):
+        """Send a participant's read cursor (read receipts)."""
+        await self.send(text_data=json.dumps({
+            'type': 'read_cursor',
+            'data': event['cursor']
+        }))
+
     async def user_status(self, event):
         """Send user online/offline status."""
         if event['user_id'] != str(self.user.id):  # Don't send own status
@@ -184,52 +258,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             }))
 
+    async def participants_changed(self, event):
+        """Participants were added/removed: refresh the cached set, drop removed users."""
+        await self.load_participants()
+        if str(self.user.id) not in self.participants:
+            await self.close()
+
     # Database operations
-    @database_sync_to_async
-    def verify_conversation_access(self) -> bool:
-        """Verify user has access to the conversation."""
+    async def load_participants(self):
+        """Load the participant set once per connection (async ORM, stays on the event loop)."""
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return self.user in conversation.participants.all()
-        except (ObjectDoesNotExist, ValueError):
-            return False
+            self.participants = {
+                str(user_id) async for user_id in
+                Conversation.participants.through.objects.filter(
+                    conversation_id=self.conversation_id
+                ).values_list('user_id', flat=True)
+            }
+        except (ValueError, ValidationError):
+            self.participants = set()
 
     @database_sync_to_async
     def save_message(self, content: str):
-        """Save message to database."""
+        """
+        Save message in a single thread hop and transaction: the INSERT plus the
+        conditional UPDATE of the conversation's last_message_* (post_save signals).
+        """
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=self.user,
-                content=content,
-                message_type='text'
-            )
-            
-            # Update conversation last_message_at
-            conversation.last_message_at = datetime.now()
-            conversation.save()
-            
+            with transaction.atomic():
+                message = MessageConversation.objects.create(
+                    conversation_id=self.conversation_id,
+                    sender=self.user,
+                    content=content,
+                    message_type='text'
+                )
+                message_id = str(message.id)
+                transaction.on_commit(lambda: self._schedule_notifications(message_id))
             return message
         except Exception:
             return None
 
-    @database_sync_to_async
-    def mark_messages_read(self, message_ids: list):
-        """Mark multiple messages as read by current user."""
+    @staticmethod
+    def _schedule_notifications(message_id):
+        from .tasks_messaging import fan_out_message_notifications
+        fan_out_message_notifications.delay(message_id)
+
+    async def mark_messages_read(self, message_ids: list):
+        """Advance the user's read cursor to the newest of the given messages."""
         try:
-            messages = Message.objects.filter(
+            latest = await MessageConversation.objects.filter(
                 id__in=message_ids,
                 conversation_id=self.conversation_id
+            ).order_by('-created_at', '-id').only('id', 'created_at').afirst()
+            if latest is None:
+                return None
+            return await database_sync_to_async(read_cursors.mark_read)(
+                self.user, self.conversation_id, up_to=latest
             )
-            for message in messages:
-                message.read_by[str(self.user.id)] = datetime.now().isoformat()
-                message.save()
         except Exception:
-            pass
+            return None
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(BatchedSendMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling real-time notifications.
     """
@@ -245,6 +334,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             return
             
         self.notification_group_name = f'notifications_{self.user_id}'
+        self.setup_batching()
         
         # Join notification group
         await self.channel_layer.group_add(
@@ -257,6 +347,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
         if hasattr(self, 'notification_group_name'):
+            await self.stop_batching()
             await self.channel_layer.group_discard(
                 self.notification_group_name,
                 self.channel_name
@@ -276,27 +367,24 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     # Event handlers
     async def notification_broadcast(self, event):
-        """Send notification to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'data': event['notification']
-        }))
+        """Send notification to WebSocket (pre-serialized payload when the producer sent one)."""
+        await self.send_event(event, 'notification', 'notification')
 
     @database_sync_to_async
     def mark_notification_read(self, notification_id: str):
         """Mark notification as read."""
         try:
-            notification = Notification.objects.get(
+            notification = SystemNotification.objects.get(
                 id=notification_id,
                 user=self.user
             )
-            notification.read = True
-            notification.save()
-        except ObjectDoesNotExist:
+            if notification.mark_as_read():
+                messaging_counters.notifications_read(self.user.id)
+        except (ObjectDoesNotExist, ValueError):
             pass
 
 
-class UpdateConsumer(AsyncWebsocketConsumer):
+class UpdateConsumer(BatchedSendMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling general system updates (project status, etc).
     """
@@ -312,6 +400,7 @@ class UpdateConsumer(AsyncWebsocketConsumer):
             return
             
         self.updates_group_name = f'updates_{self.user_id}'
+        self.setup_batching()
         
         # Join updates group
         await self.channel_layer.group_add(
@@ -324,6 +413,7 @@ class UpdateConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
         if hasattr(self, 'updates_group_name'):
+            await self.stop_batching()
             await self.channel_layer.group_discard(
                 self.updates_group_name,
                 self.channel_name
@@ -332,23 +422,14 @@ class UpdateConsumer(AsyncWebsocketConsumer):
     # Event handlers
     async def project_update(self, event):
         """Send project update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'project_update',
-            'data': event['update']
-        }))
+        await self.send_event(event, 'project_update', 'update')
 
     async def payment_update(self, event):
         """Send payment update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'payment_update',
-            'data': event['update']
-        }))
+        await self.send_event(event, 'payment_update', 'update')
 
     async def system_update(self, event):
         """Send system update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'system_update',
-            'data': event['update']
-        }))
+        await self.send_event(event, 'system_update', 'update')
 
 
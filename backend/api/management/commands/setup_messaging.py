@@ -23,6 +23,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Cria preferências padrão para usuários existentes',
         )
+        parser.add_argument(
+            '--backfill-last-message',
+            action='store_true',
+            help='Preenche a última mensagem desnormalizada das conversas existentes',
+        )
 
     def handle(self, *args, **options):
         if options['create_test_data']:
@@ -31,6 +36,9 @@ class Command(BaseCommand):
         if options['setup_preferences']:
             self.setup_preferences()
         
+        if options['backfill_last_message']:
+            self.backfill_last_message()
+        
         self.stdout.write(
             self.style.SUCCESS('Sistema de mensageria configurado com sucesso!')
         )
@@ -184,4 +192,17 @@ class Command(BaseCommand):
         self.stdout.write(f'Total de notificações: {total_notifications}')
         self.stdout.write('='*50)
 
-
+    def backfill_last_message(self):
+        """Preenche last_message/preview de conversas anteriores à desnormalização."""
+        self.stdout.write('Preenchendo última mensagem das conversas...')
+        
+        updated = 0
+        pending = Conversation.objects.filter(last_message__isnull=True).values_list('id', flat=True)
+        for conversation_id in pending.iterator(chunk_size=500):
+            message = MessageConversation.objects.filter(
+                conversation_id=conversation_id
+            ).order_by('-created_at', '-id').first()
+            if message:
+                updated += Conversation.record_message(message)
+        
+        self.stdout.write(f'Última mensagem preenchida em {updated} conversas')
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_payments_system"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="kycdocument",
+            name="lease_token",
+            field=models.UUIDField(
+                blank=True,
+                help_text="Token do worker que detém o processamento",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="kycdocument",
+            name="lease_expires_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Expiração do lease; após isso o documento pode ser reclamado",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="biometricverification",
+            name="lease_token",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="biometricverification",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="kycdocument",
+            index=models.Index(
+                fields=["status", "lease_expires_at"], name="api_kycdoc_status_lease_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="biometricverification",
+            index=models.Index(
+                fields=["status", "lease_expires_at"], name="api_biometr_status_lease_idx"
+            ),
+        ),
+    ]
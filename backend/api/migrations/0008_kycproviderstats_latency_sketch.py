@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_verification_leases"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="kycproviderstats",
+            name="latency_sketch",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Buckets logarítmicos de latência (services.kyc_metrics), com decaimento",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="kycproviderstats",
+            name="last_ms_p95",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Latência P95 em milissegundos (derivada do latency_sketch)",
+            ),
+        ),
+    ]
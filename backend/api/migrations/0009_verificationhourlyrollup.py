@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_kycproviderstats_latency_sketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VerificationHourlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(help_text="Início da hora (UTC)")),
+                ("verification_type", models.CharField(max_length=50)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("successes", models.PositiveIntegerField(default=0)),
+                (
+                    "total_cost",
+                    models.DecimalField(decimal_places=4, default=0, max_digits=14),
+                ),
+                (
+                    "total_response_time",
+                    models.FloatField(
+                        default=0.0, help_text="Soma dos tempos de resposta (s)"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hourly_rollups",
+                        to="api.verificationprovider",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-hour"],
+                "indexes": [
+                    models.Index(fields=["hour"], name="api_verif_rollup_hour_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("hour", "provider", "verification_type"),
+                        name="uniq_verif_rollup_hour",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_verificationhourlyrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="verificationhourlyrollup",
+            name="total_response_time_sq",
+            field=models.FloatField(
+                default=0.0,
+                help_text="Soma dos quadrados dos tempos de resposta (s²)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="verificationhourlyrollup",
+            name="latency_sketch",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Buckets logarítmicos de latência em ms (services.kyc_metrics)",
+            ),
+        ),
+    ]
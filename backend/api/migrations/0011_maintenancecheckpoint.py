@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_rollup_variance_and_sketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MaintenanceCheckpoint",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("last_pk", models.CharField(blank=True, max_length=64)),
+                ("processed", models.PositiveIntegerField(default=0)),
+                (
+                    "started_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
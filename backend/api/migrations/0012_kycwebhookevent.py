@@ -0,0 +1,92 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:00
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_maintenancecheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KYCWebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("provider", models.CharField(max_length=20)),
+                (
+                    "event_id",
+                    models.CharField(
+                        help_text="ID do evento no provedor (ou hash do corpo)",
+                        max_length=255,
+                    ),
+                ),
+                ("event_type", models.CharField(blank=True, max_length=100)),
+                (
+                    "reference",
+                    models.CharField(
+                        blank=True,
+                        help_text="Referência do documento no provedor",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "partition",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Fila de processamento (hash da referência)",
+                    ),
+                ),
+                ("payload", models.JSONField(default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("received", "Recebido"),
+                            ("processed", "Processado"),
+                            ("failed", "Falhou"),
+                        ],
+                        default="received",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                (
+                    "available_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="Próxima tentativa (backoff)",
+                    ),
+                ),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["received_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["partition", "status", "available_at"],
+                        name="api_kycwh_partition_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("provider", "event_id"), name="uniq_kyc_webhook_event"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_kycwebhookevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="kycdocument",
+            name="file_path",
+            field=models.CharField(
+                blank=True,
+                help_text="Caminho no storage (URLs pré-assinadas para o provedor)",
+                max_length=500,
+            ),
+        ),
+        migrations.AddField(
+            model_name="biometricverification",
+            name="selfie_path",
+            field=models.CharField(
+                blank=True, help_text="Caminho da selfie no storage", max_length=500
+            ),
+        ),
+        migrations.AddField(
+            model_name="biometricverification",
+            name="liveness_video_path",
+            field=models.CharField(
+                blank=True, help_text="Caminho do vídeo no storage", max_length=500
+            ),
+        ),
+    ]
@@ -1291,6 +1291,7 @@ class KYCDocument(models.Model):
     # Dados do documento
     document_type = models.CharField(max_length=20, choices=DocumentType.choices)
     file_url = models.URLField(max_length=1000, help_text="URL do arquivo no S3/storage")
+    file_path = models.CharField(max_length=500, blank=True, help_text="Caminho no storage (URLs pré-assinadas para o provedor)")
     file_name = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(help_text="Tamanho do arquivo em bytes")
     file_hash = models.CharField(max_length=64, help_text="Hash SHA-256 do arquivo")
@@ -1305,6 +1306,10 @@ class KYCDocument(models.Model):
     verification_provider = models.CharField(max_length=50, blank=True, help_text="Provedor KYC usado")
     provider_response = models.JSONField(default=dict, blank=True, help_text="Resposta completa do provedor")
     
+    # Lease de processamento (claim atômico pending→processing)
+    lease_token = models.UUIDField(null=True, blank=True, help_text="Token do worker que detém o processamento")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="Expiração do lease; após isso o documento pode ser reclamado")
+    
     # Auditoria e controle
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
@@ -1321,6 +1326,7 @@ class KYCDocument(models.Model):
             models.Index(fields=['user', 'document_type']),
             models.Index(fields=['status']),
             models.Index(fields=['uploaded_at']),
+            models.Index(fields=['status', 'lease_expires_at'], name='api_kycdoc_status_lease_idx'),
         ]
     
     def __str__(self):
@@ -1357,6 +1363,8 @@ class BiometricVerification(models.Model):
     # Arquivos biométricos
     selfie_url = models.URLField(max_length=1000, help_text="URL da selfie")
     liveness_video_url = models.URLField(max_length=1000, blank=True, help_text="URL do vídeo de liveness")
+    selfie_path = models.CharField(max_length=500, blank=True, help_text="Caminho da selfie no storage")
+    liveness_video_path = models.CharField(max_length=500, blank=True, help_text="Caminho do vídeo no storage")
     
     # Dados da verificação
     liveness_score = models.FloatField(default=0.0, help_text="Score de liveness (0-1)")
@@ -1373,6 +1381,10 @@ class BiometricVerification(models.Model):
     verification_provider = models.CharField(max_length=50, blank=True)
     provider_response = models.JSONField(default=dict, blank=True)
     
+    # Lease de processamento (claim atômico pending→processing)
+    lease_token = models.UUIDField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
     # Auditoria
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
@@ -1383,6 +1395,7 @@ class BiometricVerification(models.Model):
             models.Index(fields=['user']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'lease_expires_at'], name='api_biometr_status_lease_idx'),
         ]
     
     def __str__(self):
@@ -1513,6 +1526,89 @@ class VerificationLog(models.Model):
         return f"{self.user.email} - {self.verification_type} ({self.provider.name})"
 
 
+class KYCWebhookEvent(models.Model):
+    """
+    Evento bruto de webhook de provedor KYC
+    Persistido antes do ACK; (provider, event_id) único para deduplicar retries
+    """
+    
+    STATUS_RECEIVED = 'received'
+    STATUS_PROCESSED = 'processed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RECEIVED, 'Recebido'),
+        (STATUS_PROCESSED, 'Processado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    provider = models.CharField(max_length=20)
+    event_id = models.CharField(max_length=255, help_text="ID do evento no provedor (ou hash do corpo)")
+    event_type = models.CharField(max_length=100, blank=True)
+    reference = models.CharField(max_length=255, blank=True, help_text="Referência do documento no provedor")
+    partition = models.PositiveSmallIntegerField(default=0, help_text="Fila de processamento (hash da referência)")
+    payload = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RECEIVED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Próxima tentativa (backoff)")
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='uniq_kyc_webhook_event'),
+        ]
+        indexes = [
+            models.Index(fields=['partition', 'status', 'available_at'], name='api_kycwh_partition_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider}:{self.event_id} ({self.status})"
+
+
+class VerificationHourlyRollup(models.Model):
+    """
+    Pré-agregado de VerificationLog por hora / provedor / tipo de verificação
+    Recalculado de forma idempotente por services.kyc_analytics (dashboards KYC)
+    """
+    
+    hour = models.DateTimeField(help_text="Início da hora (UTC)")
+    provider = models.ForeignKey(VerificationProvider, on_delete=models.CASCADE, related_name='hourly_rollups')
+    verification_type = models.CharField(max_length=50)
+    
+    count = models.PositiveIntegerField(default=0)
+    successes = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    total_response_time = models.FloatField(default=0.0, help_text="Soma dos tempos de resposta (s)")
+    total_response_time_sq = models.FloatField(default=0.0, help_text="Soma dos quadrados dos tempos de resposta (s²)")
+    latency_sketch = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Buckets logarítmicos de latência em ms (services.kyc_metrics)"
+    )
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hour', 'provider', 'verification_type'],
+                name='uniq_verif_rollup_hour'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='api_verif_rollup_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}h - {self.verification_type}: {self.count}"
+
+
 # ============================================================================
 # KYC Multi-Provider Intelligence Models
 # ============================================================================
@@ -1520,7 +1616,7 @@ class VerificationLog(models.Model):
 class KYCProviderStats(models.Model):
     """
     Estatísticas em tempo real para roteamento inteligente de provedores KYC
-    Implementa epsilon-greedy multi-armed bandit para otimização automática
+    Alimenta o Thompson sampling do KYCRouter (via snapshot em memória)
     """
     name = models.CharField(
         max_length=30, 
@@ -1561,7 +1657,12 @@ class KYCProviderStats(models.Model):
     # Métricas de performance
     last_ms_p95 = models.PositiveIntegerField(
         default=0,
-        help_text="Latência P95 em milissegundos"
+        help_text="Latência P95 em milissegundos (derivada do latency_sketch)"
+    )
+    latency_sketch = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Buckets logarítmicos de latência (services.kyc_metrics), com decaimento"
     )
     pep_hits = models.PositiveIntegerField(
         default=0,
@@ -1608,7 +1709,7 @@ class KYCProviderStats(models.Model):
     @property
     def utility_score(self) -> float:
         """
-        Score de utilidade para algoritmo epsilon-greedy
+        Score de utilidade para recomendações do dashboard
         Combina taxa de sucesso (40%) com eficiência de custo (60%)
         """
         u_success = self.success_rate
@@ -1633,35 +1734,44 @@ class KYCProviderStats(models.Model):
         today = date.today()
         return (today.year, today.month) != (self.reset_month.year, self.reset_month.month)
     
-    def reset_monthly_metrics(self):
-        """Reset mensal das métricas de custo e volume"""
+    def reset_monthly_metrics(self) -> bool:
+        """
+        Reset mensal das métricas de custo e volume
+        UPDATE condicional ao reset_month lido: idempotente e sem sobrescrever
+        incrementos concorrentes de outras colunas
+        """
         from datetime import date
-        self.monthly_spent = 0
-        self.attempts = 0
-        self.successes = 0
-        self.reset_month = date.today()
-        self.save()
-    
-    def update_metrics(self, success: bool, cost: float, latency_ms: int, pep_found: bool = False):
+        today = date.today()
+        updated = KYCProviderStats.objects.filter(
+            pk=self.pk, reset_month=self.reset_month
+        ).update(monthly_spent=0, attempts=0, successes=0, reset_month=today)
+        if updated:
+            self.monthly_spent = 0
+            self.attempts = 0
+            self.successes = 0
+            self.reset_month = today
+        return bool(updated)
+    
+    @classmethod
+    def record_verification(cls, name: str, success: bool, cost: float, pep_found: bool = False) -> bool:
         """
-        Atualiza métricas após uma verificação
-        Thread-safe com select_for_update
+        Registra uma verificação com incrementos F() num único UPDATE
+        Sem select_for_update: verificações concorrentes do mesmo provedor não serializam
+        A latência vai para o sketch (services.kyc_metrics), não para esta linha
         """
-        self.attempts += 1
-        if success:
-            self.successes += 1
-        
-        self.total_cost += cost
-        self.monthly_spent += cost
-        
-        if pep_found:
-            self.pep_hits += 1
+        from decimal import Decimal
+        from django.db.models import F
         
-        # Atualização da latência com EWMA (Exponentially Weighted Moving Average)
-        alpha = 0.1  # Fator de suavização
-        self.last_ms_p95 = int((1 - alpha) * self.last_ms_p95 + alpha * latency_ms)
-        
-        self.save()
+        cost = Decimal(str(cost))
+        updated = cls.objects.filter(name=name).update(
+            attempts=F('attempts') + 1,
+            successes=F('successes') + (1 if success else 0),
+            total_cost=F('total_cost') + cost,
+            monthly_spent=F('monthly_spent') + cost,
+            pep_hits=F('pep_hits') + (1 if pep_found else 0),
+            updated_at=timezone.now(),
+        )
+        return bool(updated)
 
 
 class KYCProviderConfig(models.Model):
@@ -2471,6 +2581,25 @@ class AutoReleaseRule(models.Model):
         return True
 
 
+# ============================================================================
+# Manutenção em lotes
+# ============================================================================
+
+class MaintenanceCheckpoint(models.Model):
+    """
+    Progresso de uma tarefa de manutenção em lotes (services.chunked_maintenance)
+    Permite retomar do último PK processado se a task for interrompida
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_pk = models.CharField(max_length=64, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_pk or '-'} ({self.processed})"
+
+
 # ===== SISTEMA DE MENSAGERIA E NOTIFICAÇÕES =====
 
 class Conversation(models.Model):
@@ -2497,14 +2626,27 @@ class Conversation(models.Model):
     is_active = models.BooleanField(default=True)
     last_message_at = models.DateTimeField(null=True, blank=True)
     
+    # Última mensagem desnormalizada (mantida por record_message), para a caixa de entrada
+    last_message = models.ForeignKey(
+        'MessageConversation', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_preview = models.CharField(max_length=255, blank=True)
+    last_message_type = models.CharField(max_length=10, blank=True)
+    last_message_sender = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
     # Auditoria
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    PREVIEW_LENGTH = 255
+    
     class Meta:
         ordering = ['-last_message_at', '-created_at']
         indexes = [
             models.Index(fields=['-last_message_at']),
+            models.Index(fields=['-last_message_at', '-id']),
             models.Index(fields=['is_active', '-last_message_at']),
             models.Index(fields=['conversation_type', '-last_message_at']),
         ]
@@ -2514,14 +2656,33 @@ class Conversation(models.Model):
         return f"Conversa: {participant_names} ({self.conversation_type})"
     
     def get_unread_count_for_user(self, user):
-        """Retorna quantidade de mensagens não lidas para um usuário específico."""
-        return self.message_conversations.filter(
-            read_by__isnull=True
-        ).exclude(sender=user).count()
+        """Retorna quantidade de mensagens não lidas para um usuário específico (contador mantido)."""
+        return self.read_states.filter(user=user).values_list('unread_count', flat=True).first() or 0
     
     def get_other_participant(self, user):
         """Retorna o outro participante da conversa (para conversas 1:1)."""
-        return self.participants.exclude(id=user.id).first()
+        # Itera participants.all() para aproveitar o prefetch da listagem
+        return next((p for p in self.participants.all() if p.id != user.id), None)
+    
+    @classmethod
+    def record_message(cls, message):
+        """
+        Atualiza a última mensagem desnormalizada num UPDATE condicional
+        (mensagens fora de ordem não sobrescrevem uma mais recente).
+        """
+        content = message.content or message.attachment_name or ''
+        if len(content) > cls.PREVIEW_LENGTH:
+            content = content[:cls.PREVIEW_LENGTH - 3] + "..."
+        return cls.objects.filter(pk=message.conversation_id).filter(
+            models.Q(last_message_at__isnull=True) | models.Q(last_message_at__lte=message.created_at)
+        ).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            last_message_preview=content,
+            last_message_type=message.message_type,
+            last_message_sender_id=message.sender_id,
+            updated_at=timezone.now(),
+        )
 
 
 class MessageConversation(models.Model):
@@ -2548,7 +2709,7 @@ class MessageConversation(models.Model):
     attachment_name = models.CharField(max_length=255, blank=True)
     attachment_size = models.PositiveIntegerField(null=True, blank=True)
     
-    # Status de leitura - JSONField para armazenar timestamps de leitura por usuário
+    # Legado: leitura agora vem do cursor em ConversationReadState (não é mais gravado)
     read_by = models.JSONField(default=dict, blank=True)
     
     # Metadados
@@ -2562,7 +2723,8 @@ class MessageConversation(models.Model):
     class Meta:
         ordering = ['created_at']
         indexes = [
-            models.Index(fields=['conversation', 'created_at']),
+            # Chave do histórico paginado por cursor (conversation, created_at, id)
+            models.Index(fields=['conversation', 'created_at', 'id']),
             models.Index(fields=['sender', '-created_at']),
             models.Index(fields=['message_type', '-created_at']),
         ]
@@ -2572,14 +2734,45 @@ class MessageConversation(models.Model):
         return f"{self.sender.get_full_name()}: {content_preview}"
     
     def mark_as_read_by(self, user):
-        """Marca mensagem como lida por um usuário específico."""
-        if str(user.id) not in self.read_by:
-            self.read_by[str(user.id)] = timezone.now().isoformat()
-            self.save(update_fields=['read_by'])
+        """Marca mensagem (e as anteriores) como lida avançando o cursor do usuário."""
+        from .services import read_cursors
+        return read_cursors.mark_read(user, self.conversation_id, up_to=self)
     
     def is_read_by(self, user):
-        """Verifica se a mensagem foi lida por um usuário específico."""
-        return str(user.id) in self.read_by
+        """Verifica se a mensagem foi lida por um usuário específico (via cursor)."""
+        if self.sender_id == user.id:
+            return True
+        last_read_at = ConversationReadState.objects.filter(
+            conversation_id=self.conversation_id, user=user
+        ).values_list('last_read_at', flat=True).first()
+        return bool(last_read_at and self.created_at <= last_read_at)
+
+
+class ConversationReadState(models.Model):
+    """
+    Estado de leitura de um participante numa conversa.
+    unread_count é incrementado na criação de mensagens (services/messaging_counters.py)
+    e recalculado quando o cursor de leitura avança (services/read_cursors.py).
+    Uma mensagem está lida por um usuário se created_at <= last_read_at dele.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_read_states')
+    
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True, help_text="created_at da última mensagem lida (cursor)")
+    last_read_message = models.ForeignKey(
+        'MessageConversation', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='uniq_conversation_read_state'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} em {self.conversation_id}: {self.unread_count} não lidas"
 
 
 class SystemNotification(models.Model):
@@ -2653,11 +2846,13 @@ class SystemNotification(models.Model):
         return f"{self.title} para {self.user.get_full_name()}"
     
     def mark_as_read(self):
-        """Marca notificação como lida."""
+        """Marca notificação como lida. Retorna True se ainda não estava lida."""
         if not self.read:
             self.read = True
             self.read_at = timezone.now()
             self.save(update_fields=['read', 'read_at'])
+            return True
+        return False
 
 
 class NotificationPreferences(models.Model):
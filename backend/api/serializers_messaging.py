@@ -10,6 +10,7 @@ from .models import (
     SystemNotification, 
     NotificationPreferences
 )
+from .services import conversation_access, read_cursors
 
 User = get_user_model()
 
@@ -55,21 +56,25 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'last_message_at']
     
     def get_unread_count(self, obj):
+        # Anotado por ConversationViewSet.get_queryset para o usuário da requisição
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.get_unread_count_for_user(request.user)
         return 0
     
     def get_last_message(self, obj):
-        last_message = obj.message_conversations.first()
-        if last_message:
+        # Colunas desnormalizadas (Conversation.record_message), sem consultar mensagens
+        if obj.last_message_id:
+            sender = obj.last_message_sender
             return {
-                'id': str(last_message.id),
-                'content': last_message.content,
-                'sender': last_message.sender.get_full_name() or last_message.sender.username,
-                'sender_id': str(last_message.sender.id),
-                'message_type': last_message.message_type,
-                'created_at': last_message.created_at.isoformat()
+                'id': str(obj.last_message_id),
+                'content': obj.last_message_preview,
+                'sender': (sender.get_full_name() or sender.username) if sender else None,
+                'sender_id': str(obj.last_message_sender_id) if obj.last_message_sender_id else None,
+                'message_type': obj.last_message_type or 'text',
+                'created_at': obj.last_message_at.isoformat() if obj.last_message_at else None
             }
         return None
     
@@ -101,6 +106,7 @@ class ConversationSerializer(serializers.ModelSerializer):
 class MessageConversationSerializer(serializers.ModelSerializer):
     """Serializer para mensagens."""
     sender = UserBasicSerializer(read_only=True)
+    read_by = serializers.SerializerMethodField()
     is_read_by_current_user = serializers.SerializerMethodField()
     reply_to_message = serializers.SerializerMethodField()
     attachment_url = serializers.SerializerMethodField()
@@ -115,10 +121,20 @@ class MessageConversationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'sender', 'read_by', 'created_at', 'updated_at']
     
+    def _read_cursors(self):
+        # O contexto é compartilhado pela lista: um SELECT de cursores por conversa
+        return self.context.setdefault('read_cursors', read_cursors.CursorMap())
+    
+    def get_read_by(self, obj):
+        return {
+            str(user_id): last_read_at.isoformat()
+            for user_id, last_read_at in self._read_cursors().readers(obj).items()
+        }
+    
     def get_is_read_by_current_user(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.is_read_by(request.user)
+            return self._read_cursors().is_read_by(obj, request.user)
         return False
     
     def get_reply_to_message(self, obj):
@@ -158,7 +174,7 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         """Valida se o usuário tem acesso à conversa."""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            if not value.participants.filter(id=request.user.id).exists():
+            if not conversation_access.is_participant(request.user, value.pk):
                 raise serializers.ValidationError("Você não tem acesso a esta conversa.")
         return value
     
@@ -208,17 +224,32 @@ class NotificationPreferencesSerializer(serializers.ModelSerializer):
 
 class ConversationListSerializer(serializers.ModelSerializer):
     """Serializer otimizado para listagem de conversas."""
-    other_participant = UserBasicSerializer(read_only=True)
-    unread_count = serializers.IntegerField()
-    last_message_preview = serializers.CharField()
-    last_message_time = serializers.DateTimeField()
+    other_participant = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True, default=0)
+    last_message_time = serializers.DateTimeField(source='last_message_at', read_only=True)
+    last_message_sender = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
         fields = [
             'id', 'conversation_type', 'title', 'other_participant',
-            'unread_count', 'last_message_preview', 'last_message_time',
-            'is_active'
+            'unread_count', 'last_message_id', 'last_message_preview',
+            'last_message_sender', 'last_message_time', 'is_active'
         ]
+    
+    def get_other_participant(self, obj):
+        # participants vem do prefetch da view
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            other = obj.get_other_participant(request.user)
+            if other:
+                return UserBasicSerializer(other).data
+        return None
+    
+    def get_last_message_sender(self, obj):
+        sender = obj.last_message_sender
+        if sender:
+            return {'id': str(sender.id), 'name': sender.get_full_name() or sender.username}
+        return None
 
 
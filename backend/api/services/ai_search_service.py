@@ -1,8 +1,11 @@
 """
 Serviço de integração com o sistema de busca inteligente marketplace_ai
 """
+import base64
 import requests
 import logging
+import numpy as np
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional, TYPE_CHECKING
 from django.conf import settings
 from django.core.cache import cache
@@ -12,6 +15,40 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# dtypes aceitos pelo endpoint /embed/ do marketplace_ai (little-endian)
+EMBEDDING_DTYPES = {'float32': '<f4', 'float16': '<f2'}
+
+_session: Optional[requests.Session] = None
+
+
+def get_ai_session() -> requests.Session:
+    """
+    Sessão HTTP keep-alive compartilhada com o marketplace_ai.
+
+    Reaproveita conexões TCP entre chamadas em vez de abrir uma nova
+    a cada busca/embedding.
+    """
+    global _session
+    if _session is None:
+        pool_size = getattr(settings, 'AI_SEARCH_POOL_MAXSIZE', 20)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def decode_embedding(payload: bytes, dtype: str = 'float32') -> np.ndarray:
+    """
+    Decodifica o buffer binário do /embed/ sem copiar (numpy.frombuffer).
+
+    O array resultante é somente-leitura, pois aponta para o próprio `bytes`.
+    """
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"dtype de embedding não suportado: {dtype}")
+    return np.frombuffer(payload, dtype=EMBEDDING_DTYPES[dtype])
+
 
 class AISearchService:
     """
@@ -108,7 +145,7 @@ class AISearchService:
                 return cached_result
             
             # Fazer requisição para o sistema de IA
-            response = requests.get(
+            response = get_ai_session().get(
                 f"{cls.AI_SEARCH_BASE_URL}/api/search/",
                 params=params,
                 timeout=cls.AI_SEARCH_TIMEOUT,
@@ -128,6 +165,41 @@ class AISearchService:
             logger.warning(f"Erro na requisição para API IA: {str(e)}")
             return None
     
+    @classmethod
+    def get_query_embedding(cls, query: str, timeout: float = 2) -> np.ndarray:
+        """
+        Obtém o embedding da consulta via /embed/ em formato binário.
+
+        Pede o buffer cru (encoding "raw"); o Accept inclui application/json
+        para o servidor conseguir responder erros e versões antigas do
+        endpoint, e nesse caso decodifica o JSON (base64 ou lista legada).
+        """
+        dtype = getattr(settings, 'AI_SEARCH_EMBED_DTYPE', 'float32')
+
+        response = get_ai_session().post(
+            f"{cls.AI_SEARCH_BASE_URL}/embed/",
+            json={'text': query, 'dtype': dtype, 'encoding': 'raw'},
+            timeout=timeout,
+            headers={'Accept': 'application/octet-stream, application/json'}
+        )
+
+        if response.status_code != 200:
+            raise requests.RequestException(f"AI service returned {response.status_code}")
+
+        if response.headers.get('Content-Type', '').startswith('application/octet-stream'):
+            return decode_embedding(
+                response.content,
+                response.headers.get('X-Embedding-Dtype', dtype)
+            )
+
+        data = response.json()
+        if 'embedding_b64' in data:
+            return decode_embedding(
+                base64.b64decode(data['embedding_b64']),
+                data.get('dtype', dtype)
+            )
+        return np.asarray(data['embedding'], dtype=np.float32)
+    
     @classmethod
     def _enrich_ai_results(cls, ai_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
@@ -362,7 +434,7 @@ class AISearchService:
                 'data': data
             }
             
-            response = requests.post(
+            response = get_ai_session().post(
                 sync_url,
                 json=payload,
                 timeout=cls.AI_SEARCH_TIMEOUT,
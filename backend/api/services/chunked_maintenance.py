@@ -0,0 +1,117 @@
+"""
+Executor de manutenção em lotes
+
+Percorre um queryset por keyset (pk > último pk processado), aplica um
+UPDATE/DELETE ... WHERE pk IN (...) por lote numa transação curta, dorme
+entre lotes para aliviar o primário e grava o progresso em
+MaintenanceCheckpoint. Se o orçamento de tempo acabar, retorna
+completed=False e a task se reenfileira, retomando do checkpoint.
+
+O orçamento padrão (MAINTENANCE_TIME_BUDGET_SECONDS) fica abaixo do
+task_soft_time_limit global (300s, galax_ia_project/celery.py) com folga
+para o lote em andamento: passando do soft limit o Celery levanta
+SoftTimeLimitExceeded e a task morre sem se reenfileirar.
+
+    result = run_chunked('kyc.expire_documents', qs, update={'status': 'expired'})
+    if not result['completed']:
+        minha_task.delay()
+"""
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+
+from ..models import MaintenanceCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+def run_chunked(
+    name: str,
+    queryset: QuerySet,
+    update: Optional[Dict] = None,
+    delete: bool = False,
+    action: Optional[Callable[[QuerySet], int]] = None,
+    chunk_size: Optional[int] = None,
+    sleep_seconds: Optional[float] = None,
+    time_budget: Optional[float] = None,
+) -> Dict:
+    """
+    Aplica update / delete / action ao queryset em lotes de chunk_size
+
+    O filtro do queryset é reaplicado em cada lote (queryset.filter(pk__in=...)),
+    então linhas alteradas por outro processo entre a leitura e a escrita são puladas.
+
+    Args:
+        name: Identificador do checkpoint (único por tarefa)
+        queryset: Linhas-alvo
+        update: Campos para queryset.update(**update)
+        delete: Deleta as linhas do lote
+        action: Callable(queryset_do_lote) -> linhas afetadas, para casos específicos
+        chunk_size: MAINTENANCE_CHUNK_SIZE por padrão
+        sleep_seconds: MAINTENANCE_CHUNK_SLEEP_SECONDS por padrão
+        time_budget: MAINTENANCE_TIME_BUDGET_SECONDS por padrão
+
+    Returns:
+        Dict com processed, chunks e completed
+    """
+    if sum(bool(x) for x in (update, delete, action)) != 1:
+        raise ValueError("run_chunked requires exactly one of update, delete or action")
+
+    chunk_size = chunk_size or getattr(settings, 'MAINTENANCE_CHUNK_SIZE', 1000)
+    if sleep_seconds is None:
+        sleep_seconds = getattr(settings, 'MAINTENANCE_CHUNK_SLEEP_SECONDS', 0.05)
+    time_budget = time_budget or getattr(settings, 'MAINTENANCE_TIME_BUDGET_SECONDS', 240)
+
+    model = queryset.model
+    pk_field = model._meta.pk
+    deadline = time.monotonic() + time_budget
+
+    checkpoint, _ = MaintenanceCheckpoint.objects.get_or_create(name=name)
+    last_pk = pk_field.to_python(checkpoint.last_pk) if checkpoint.last_pk else None
+    if last_pk is not None:
+        logger.info(f"Maintenance {name}: resuming after pk {last_pk}")
+
+    processed = 0
+    chunks = 0
+
+    while True:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        pks: List = list(page.values_list('pk', flat=True)[:chunk_size])
+
+        if not pks:
+            MaintenanceCheckpoint.objects.filter(name=name).delete()
+            logger.info(f"Maintenance {name}: completed ({processed} rows, {chunks} chunks)")
+            return {'name': name, 'processed': processed, 'chunks': chunks, 'completed': True}
+
+        with transaction.atomic():
+            batch = queryset.filter(pk__in=pks)
+            if update:
+                affected = batch.update(**update)
+            elif delete:
+                affected = batch.delete()[1].get(model._meta.label, 0)
+            else:
+                affected = action(batch)
+
+        last_pk = pks[-1]
+        processed += affected
+        chunks += 1
+        MaintenanceCheckpoint.objects.filter(name=name).update(
+            last_pk=str(last_pk),
+            processed=F('processed') + affected,
+        )
+
+        if time.monotonic() >= deadline:
+            logger.warning(
+                f"Maintenance {name}: time budget exhausted after {chunks} chunks, "
+                f"checkpoint at pk {last_pk}"
+            )
+            return {'name': name, 'processed': processed, 'chunks': chunks, 'completed': False}
+
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
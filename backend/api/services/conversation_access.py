@@ -0,0 +1,94 @@
+"""
+Conjunto de participantes por conversa, cacheado no Redis
+
+A autorização de leitura/escrita numa conversa vira um SISMEMBER em vez de
+um JOIN em api_conversation_participants a cada requisição (REST e websocket).
+
+* chave conversation:participants:<id> com os ids dos participantes mais um
+  marcador ('-'), para que conversas sem participantes também fiquem cacheadas
+* invalidada após o commit por m2m_changed (signals.py), em qualquer direção;
+  os ChatConsumer conectados recebem 'participants_changed' e recarregam
+* TTL de MESSAGING_PARTICIPANTS_CACHE_TTL limita divergências; com o Redis
+  fora do ar a consulta cai no banco
+"""
+import logging
+from typing import Iterable, Set
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from ..models import Conversation
+from .messaging_counters import counters_client
+
+logger = logging.getLogger(__name__)
+
+PARTICIPANTS_KEY = "conversation:participants:{conversation_id}"
+_LOADED_MARKER = '-'
+
+
+def _cache_ttl() -> int:
+    return getattr(settings, 'MESSAGING_PARTICIPANTS_CACHE_TTL', 600)
+
+
+def _load(conversation_id) -> Set[str]:
+    return {
+        str(user_id) for user_id in
+        Conversation.participants.through.objects.filter(
+            conversation_id=conversation_id
+        ).values_list('user_id', flat=True)
+    }
+
+
+def participant_ids(conversation_id) -> Set[str]:
+    """Ids (str) dos participantes; vazio se a conversa não existir"""
+    key = PARTICIPANTS_KEY.format(conversation_id=conversation_id)
+    try:
+        members = counters_client().smembers(key)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read participants of conversation {conversation_id}: {e}")
+        return _load(conversation_id)
+
+    if members:
+        return {m.decode() if isinstance(m, bytes) else m for m in members} - {_LOADED_MARKER}
+
+    participants = _load(conversation_id)
+    try:
+        pipe = counters_client().pipeline(transaction=True)
+        pipe.sadd(key, _LOADED_MARKER, *participants)
+        pipe.expire(key, _cache_ttl())
+        pipe.execute()
+    except redis.RedisError:
+        pass
+    return participants
+
+
+def is_participant(user, conversation_id) -> bool:
+    return str(user.id) in participant_ids(conversation_id)
+
+
+def invalidate(conversation_ids: Iterable) -> None:
+    """
+    Remove os conjuntos cacheados após o commit e avisa os ChatConsumer
+    conectados (que mantêm o conjunto em memória por conexão)
+    """
+    conversation_ids = list(conversation_ids)
+    keys = [PARTICIPANTS_KEY.format(conversation_id=cid) for cid in conversation_ids]
+    if not keys:
+        return
+
+    def delete():
+        try:
+            counters_client().delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate conversation participants: {e}")
+
+        from .notification_fanout import group_send_many
+        try:
+            group_send_many([
+                (f'chat_{cid}', {'type': 'participants_changed'}) for cid in conversation_ids
+            ])
+        except Exception as e:
+            logger.warning(f"Failed to broadcast participant changes: {e}")
+
+    transaction.on_commit(delete)
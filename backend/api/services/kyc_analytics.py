@@ -0,0 +1,355 @@
+"""
+Analytics do roteamento KYC sobre o rollup horário de VerificationLog
+
+Os dashboards, a volatilidade do roteador e as métricas de webhook leem
+VerificationHourlyRollup (O(horas) linhas) em uma query agrupada por breakdown.
+O rollup (contagem, sucessos, custo, soma/soma² do tempo de resposta e sketch
+de latência) é recalculado de forma idempotente a partir dos logs brutos pelo
+beat (refresh_rollups), sempre reabrindo a última hora já consolidada, já que
+ela pode ter sido fechada parcialmente. Logs brutos já consolidados e mais
+antigos que a retenção são podados (prune_raw_logs).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Max, Min, Sum, Value, When
+from django.db.models.functions import ExtractHour, Floor, Greatest, Ln, TruncDay, TruncHour
+from django.utils import timezone
+
+from ..models import KYCProviderStats, VerificationHourlyRollup, VerificationLog
+from . import kyc_metrics
+from .chunked_maintenance import run_chunked
+
+logger = logging.getLogger(__name__)
+
+
+def _hour_floor(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+# aliases distintos dos nomes de campo do rollup (o ORM não aceita colisão)
+_SUMS = {
+    'n': Sum('count'),
+    'ok': Sum('successes'),
+    'cost_sum': Sum('total_cost'),
+    'rt_sum': Sum('total_response_time'),
+}
+
+
+def _rates(row: Dict) -> Dict:
+    """Converte somas do rollup em taxas/médias"""
+    count = row.get('n') or 0
+    total_cost = float(row.get('cost_sum') or 0)
+    return {
+        'count': count,
+        'successes': row.get('ok') or 0,
+        'success_rate': (row.get('ok') or 0) / count if count else 0,
+        'total_cost': total_cost,
+        'avg_cost': total_cost / count if count else 0,
+        'avg_response_time': (row.get('rt_sum') or 0) / count if count else 0,
+    }
+
+
+class KYCAnalyticsService:
+    """Rollup horário e breakdowns dos dashboards KYC"""
+
+    # ------------------------------------------------------------------
+    # Manutenção do rollup
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def rollup_range(cls, start: datetime, end: datetime) -> int:
+        """
+        Recalcula o rollup das horas em [start, end) a partir dos logs brutos
+        Uma query agrupada + delete/bulk_create na mesma transação (idempotente)
+
+        Returns:
+            Número de linhas de rollup gravadas
+        """
+        start = _hour_floor(start)
+        logs = VerificationLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        group = ('bucket', 'provider_id', 'verification_type')
+        
+        rows = (
+            logs
+            .annotate(bucket=TruncHour('created_at'))
+            .values(*group)
+            .annotate(
+                count=Count('id'),
+                successes=Sum(Case(When(success=True, then=1), default=0, output_field=IntegerField())),
+                total_cost=Sum('cost'),
+                total_response_time=Sum('response_time'),
+                total_response_time_sq=Sum(F('response_time') * F('response_time')),
+            )
+        )
+
+        # Sketch de latência: mesma indexação de kyc_metrics, agrupada no banco
+        latency_ms = Greatest(F('response_time') * Value(1000.0), Value(1.0), output_field=FloatField())
+        sketch_rows = (
+            logs
+            .annotate(
+                bucket=TruncHour('created_at'),
+                latency_bucket=Floor(Ln(latency_ms) / Value(kyc_metrics.log_gamma())),
+            )
+            .values(*group, 'latency_bucket')
+            .annotate(n=Count('id'))
+        )
+        sketches: Dict[tuple, Dict[str, int]] = {}
+        for row in sketch_rows:
+            key = (row['bucket'], row['provider_id'], row['verification_type'])
+            sketches.setdefault(key, {})[str(int(row['latency_bucket']))] = row['n']
+
+        objs = [
+            VerificationHourlyRollup(
+                hour=row['bucket'],
+                provider_id=row['provider_id'],
+                verification_type=row['verification_type'],
+                count=row['count'],
+                successes=row['successes'] or 0,
+                total_cost=row['total_cost'] or 0,
+                total_response_time=row['total_response_time'] or 0.0,
+                total_response_time_sq=row['total_response_time_sq'] or 0.0,
+                latency_sketch=sketches.get((row['bucket'], row['provider_id'], row['verification_type']), {}),
+            )
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            VerificationHourlyRollup.objects.filter(hour__gte=start, hour__lt=end).delete()
+            VerificationHourlyRollup.objects.bulk_create(objs, batch_size=500)
+
+        return len(objs)
+
+    @classmethod
+    def refresh_rollups(cls, max_days: Optional[int] = None) -> Dict:
+        """
+        Catch-up incremental: da última hora consolidada (inclusive) até agora,
+        em janelas de um dia. Primeira execução começa no log mais antigo,
+        limitada a max_days (KYC_ROLLUP_BACKFILL_DAYS).
+        """
+        now = timezone.now()
+        max_days = max_days or getattr(settings, 'KYC_ROLLUP_BACKFILL_DAYS', 90)
+
+        last_hour = VerificationHourlyRollup.objects.aggregate(last=Max('hour'))['last']
+        if last_hour is None:
+            first_log = VerificationLog.objects.aggregate(first=Min('created_at'))['first']
+            if first_log is None:
+                return {'rows': 0, 'from': None}
+            start = first_log
+        else:
+            start = last_hour
+        start = _hour_floor(max(start, now - timedelta(days=max_days)))
+
+        rows = 0
+        window_start = start
+        while window_start < now:
+            window_end = min(window_start + timedelta(days=1), now + timedelta(hours=1))
+            rows += cls.rollup_range(window_start, _hour_floor(window_end))
+            window_start = _hour_floor(window_end)
+
+        return {'rows': rows, 'from': start.isoformat()}
+
+    @classmethod
+    def prune_raw_logs(cls, retention_days: Optional[int] = None, batch_size: int = 5000) -> int:
+        """
+        Remove VerificationLog mais antigos que a retenção
+        (KYC_VERIFICATION_LOG_RETENTION_DAYS), nunca além da última hora já
+        consolidada no rollup. Deleta em lotes via run_chunked.
+
+        Returns:
+            Número de logs removidos
+        """
+        retention_days = retention_days or getattr(settings, 'KYC_VERIFICATION_LOG_RETENTION_DAYS', 180)
+        last_hour = VerificationHourlyRollup.objects.aggregate(last=Max('hour'))['last']
+        if last_hour is None:
+            return 0
+
+        cutoff = min(timezone.now() - timedelta(days=retention_days), last_hour)
+        result = run_chunked(
+            'kyc.prune_verification_logs',
+            VerificationLog.objects.filter(created_at__lt=cutoff),
+            delete=True,
+            chunk_size=batch_size
+        )
+
+        if result['processed']:
+            logger.info(f"Pruned {result['processed']} verification logs older than {cutoff.isoformat()}")
+        return result['processed']
+
+    # ------------------------------------------------------------------
+    # Breakdowns (uma query agrupada cada)
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _rollups_since(cls, since: datetime):
+        return VerificationHourlyRollup.objects.filter(hour__gte=_hour_floor(since))
+
+    @classmethod
+    def daily_routing(cls, since: datetime) -> List[Dict]:
+        rows = (
+            cls._rollups_since(since)
+            .annotate(day=TruncDay('hour'))
+            .values('day', 'provider__name')
+            .annotate(**_SUMS)
+            .order_by('day', 'provider__name')
+        )
+        days: Dict[str, List[Dict]] = {}
+        for row in rows:
+            rates = _rates(row)
+            days.setdefault(row['day'].date().isoformat(), []).append({
+                'provider__name': row['provider__name'],
+                'count': rates['count'],
+                'success_rate': rates['success_rate'],
+                'avg_cost': rates['avg_cost'],
+                'avg_response_time': rates['avg_response_time'],
+            })
+        return [{'date': day, 'providers': providers} for day, providers in days.items()]
+
+    @classmethod
+    def hourly_costs(cls, since: datetime) -> List[Dict]:
+        rows = (
+            cls._rollups_since(since)
+            .annotate(hour_of_day=ExtractHour('hour'))
+            .values('hour_of_day')
+            .annotate(**_SUMS)
+            .order_by('hour_of_day')
+        )
+        result = []
+        for row in rows:
+            rates = _rates(row)
+            result.append({
+                'hour': row['hour_of_day'],
+                'total_cost': rates['total_cost'],
+                'avg_response_time': rates['avg_response_time'],
+            })
+        return result
+
+    @classmethod
+    def verification_types(cls, since: datetime) -> List[Dict]:
+        rows = (
+            cls._rollups_since(since)
+            .values('verification_type')
+            .annotate(**_SUMS)
+            .order_by('verification_type')
+        )
+        result = []
+        for row in rows:
+            rates = _rates(row)
+            result.append({
+                'verification_type': row['verification_type'],
+                'count': rates['count'],
+                'success_rate': rates['success_rate'],
+                'avg_cost': rates['avg_cost'],
+            })
+        return result
+
+    @classmethod
+    def by_provider(cls, since: datetime) -> List[Dict]:
+        rows = (
+            cls._rollups_since(since)
+            .values('provider__name')
+            .annotate(**_SUMS)
+            .order_by('-n')
+        )
+        return [
+            {
+                'provider__name': row['provider__name'],
+                'count': row['n'],
+                'success_rate': _rates(row)['success_rate'],
+            }
+            for row in rows
+        ]
+
+    @classmethod
+    def totals(cls, since: datetime) -> Dict:
+        return _rates(cls._rollups_since(since).aggregate(**_SUMS))
+
+    @classmethod
+    def latency_percentiles(cls, since: datetime) -> Dict[str, Dict[str, int]]:
+        """p50/p95/p99 (ms) por provedor, mesclando os sketches horários"""
+        merged: Dict[str, Dict] = {}
+        for name, sketch in cls._rollups_since(since).values_list('provider__name', 'latency_sketch'):
+            merged[name] = kyc_metrics.merge(merged.get(name, {}), {int(k): v for k, v in (sketch or {}).items()})
+        return {
+            name: {
+                'p50': kyc_metrics.quantile(sketch, 0.50),
+                'p95': kyc_metrics.quantile(sketch, 0.95),
+                'p99': kyc_metrics.quantile(sketch, 0.99),
+            }
+            for name, sketch in merged.items()
+        }
+
+    # ------------------------------------------------------------------
+    # Indicadores derivados
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def market_volatility(cls, since: datetime) -> Optional[float]:
+        """
+        Média, entre provedores, do coeficiente de variação do tempo de resposta
+        (desvio padrão populacional a partir de soma e soma² do rollup)
+
+        Returns:
+            Volatilidade (0-1) ou None sem dados
+        """
+        rows = (
+            cls._rollups_since(since)
+            .values('provider__name')
+            .annotate(n=Sum('count'), rt_sum=Sum('total_response_time'), rt_sq=Sum('total_response_time_sq'))
+        )
+        volatilities = []
+        for row in rows:
+            if not row['n'] or not row['rt_sum']:
+                continue
+            mean = row['rt_sum'] / row['n']
+            variance = max(row['rt_sq'] / row['n'] - mean * mean, 0.0)
+            volatilities.append(min(variance ** 0.5 / mean, 1.0))
+        return sum(volatilities) / len(volatilities) if volatilities else None
+
+    @classmethod
+    def routing_efficiency(cls, totals: Dict) -> Dict:
+        """Eficiência do roteamento a partir dos totais do período"""
+        if not totals['count']:
+            return {'efficiency': 0, 'note': 'No data available'}
+
+        cost_efficiency = totals['successes'] / max(totals['total_cost'], 0.01)
+        time_efficiency = 1 / max(totals['avg_response_time'], 1)
+        efficiency_score = (cost_efficiency * 0.7 + time_efficiency * 0.3)
+
+        return {
+            'efficiency_score': min(efficiency_score, 1.0),
+            'total_cost': totals['total_cost'],
+            'total_successes': totals['successes'],
+            'avg_response_time': totals['avg_response_time'],
+        }
+
+    @classmethod
+    def cost_savings(cls, totals: Dict) -> Dict:
+        """
+        Economia vs. usar sempre o provedor de maior custo por aprovação
+        (cost_per_ok é property: o máximo é calculado em Python sobre poucas linhas)
+        """
+        if not totals['count']:
+            return {'savings': 0}
+
+        stats = list(KYCProviderStats.objects.all())
+        actual_cost = totals['total_cost']
+        if stats:
+            highest_cost_per_ok = max(s.cost_per_ok for s in stats)
+            simulated_cost = totals['count'] * highest_cost_per_ok
+            savings = max(0, simulated_cost - actual_cost)
+            savings_percentage = (savings / max(simulated_cost, 0.01)) * 100
+        else:
+            simulated_cost = 0
+            savings = 0
+            savings_percentage = 0
+
+        return {
+            'actual_cost': actual_cost,
+            'simulated_cost': simulated_cost,
+            'savings_amount': savings,
+            'savings_percentage': savings_percentage,
+        }
@@ -0,0 +1,115 @@
+"""
+Reserva atômica de orçamento mensal e free tier dos provedores KYC
+
+O snapshot do roteador (kyc_router) é local ao processo e recarregado a cada
+KYC_ROUTER_SNAPSHOT_TTL: serve para ranquear, não para contar gasto. Antes de
+rotear uma verificação, o worker reserva no Redis, num script Lua
+(check-and-increment), uma unidade do free tier ou o custo estimado contra o
+orçamento do mês. Com N workers o limite não é ultrapassado entre recargas.
+
+* kyc:budget:free:<provedor>:<AAAAMM>  - verificações gratuitas reservadas
+* kyc:budget:spent:<provedor>:<AAAAMM> - gasto reservado, em centavos
+* chaves por mês: a virada de mês começa de contadores novos; o seed inicial
+  vem de KYCProviderStats (attempts / monthly_spent) se o reset_month da
+  linha for o mês corrente
+* o gasto real continua em KYCProviderStats.record_verification; a reserva
+  usa o custo estimado (cost_per_document + cost_per_biometric)
+"""
+import logging
+from datetime import date
+from typing import Dict, Optional
+
+import redis
+
+from .kyc_metrics import metrics_client
+
+logger = logging.getLogger(__name__)
+
+FREE_KEY = "kyc:budget:free:{provider}:{month}"
+SPENT_KEY = "kyc:budget:spent:{provider}:{month}"
+KEY_TTL = 40 * 24 * 3600
+
+FREE = 'free'
+PAID = 'paid'
+
+# KEYS: free, spent; ARGV: limite free, orçamento (centavos), custo (centavos),
+# seed free, seed gasto (centavos), ttl
+# Retorna 1 (free tier), 2 (pago) ou 0 (sem free tier nem orçamento)
+_RESERVE = """
+redis.call('SET', KEYS[1], ARGV[4], 'NX', 'EX', ARGV[6])
+redis.call('SET', KEYS[2], ARGV[5], 'NX', 'EX', ARGV[6])
+if tonumber(ARGV[1]) > 0 and tonumber(redis.call('GET', KEYS[1])) < tonumber(ARGV[1]) then
+    redis.call('INCR', KEYS[1])
+    return 1
+end
+local cost = tonumber(ARGV[3])
+if tonumber(redis.call('GET', KEYS[2])) + cost <= tonumber(ARGV[2]) then
+    redis.call('INCRBY', KEYS[2], cost)
+    return 2
+end
+return 0
+"""
+
+
+def _month(today: Optional[date] = None) -> str:
+    return (today or date.today()).strftime('%Y%m')
+
+
+def _cents(value: float) -> int:
+    return int(round(float(value) * 100))
+
+
+def reserve(provider: str, entry: Dict, estimated_cost: float) -> Optional[Dict]:
+    """
+    Reserva uma verificação no provedor
+
+    Args:
+        provider: Nome do provedor
+        entry: Linha do snapshot do roteador (free_tier_limit, monthly_budget,
+            monthly_spent, attempts, reset_month)
+        estimated_cost: Custo estimado em BRL se o free tier acabou
+
+    Returns:
+        Reserva ({'provider', 'kind', 'cost_cents', 'month'}) ou None se não houver
+        free tier nem orçamento. Com o Redis fora do ar, decide pelo snapshot.
+    """
+    today = date.today()
+    month = _month(today)
+    reset_month = entry.get('reset_month')
+    current = reset_month is not None and (reset_month.year, reset_month.month) == (today.year, today.month)
+    cost_cents = _cents(estimated_cost)
+
+    try:
+        granted = int(metrics_client().eval(
+            _RESERVE, 2,
+            FREE_KEY.format(provider=provider, month=month),
+            SPENT_KEY.format(provider=provider, month=month),
+            entry['free_tier_limit'] or 0,
+            _cents(entry['monthly_budget']),
+            cost_cents,
+            entry['attempts'] if current else 0,
+            _cents(entry['monthly_spent']) if current else 0,
+            KEY_TTL,
+        ))
+    except redis.RedisError as e:
+        logger.warning(f"KYC budget store unavailable, using snapshot for {provider}: {e}")
+        return {'provider': provider, 'kind': None, 'cost_cents': 0, 'month': month}
+
+    if granted == 1:
+        return {'provider': provider, 'kind': FREE, 'cost_cents': 0, 'month': month}
+    if granted == 2:
+        return {'provider': provider, 'kind': PAID, 'cost_cents': cost_cents, 'month': month}
+    return None
+
+
+def release(reservation: Optional[Dict]) -> None:
+    """Devolve uma reserva cuja chamada ao provedor não chegou a acontecer"""
+    if not reservation or reservation['kind'] is None:
+        return
+    try:
+        if reservation['kind'] == FREE:
+            metrics_client().decr(FREE_KEY.format(**reservation))
+        else:
+            metrics_client().decrby(SPENT_KEY.format(**reservation), reservation['cost_cents'])
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release KYC budget reservation for {reservation['provider']}: {e}")
@@ -0,0 +1,165 @@
+"""
+Health probes dos provedores KYC
+
+probe_all() chama health_check() de todos os provedores em paralelo, cada um
+com seu próprio timeout: um provedor lento não atrasa os demais. O resultado
+vai para um hash no Redis (kyc:health), compartilhado entre web e workers:
+
+* KYCRouter lê o hash a cada recarga do snapshot e pula provedores com
+  routable=False, sem escrita no banco
+* o dashboard mostra status, latência e contadores por provedor
+
+Histerese: um provedor só sai do roteamento após KYC_HEALTH_FAILURE_THRESHOLD
+falhas seguidas e só volta após KYC_HEALTH_RECOVERY_THRESHOLD sucessos seguidos.
+KYCProviderStats.is_active continua sendo o interruptor manual.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from .kyc_metrics import metrics_client
+
+logger = logging.getLogger(__name__)
+
+HEALTH_KEY = "kyc:health"
+
+# 'degraded' responde, mas com status inesperado: conta como sucesso
+HEALTHY_STATUSES = frozenset({'healthy', 'degraded'})
+
+
+def probe_timeout(provider: str) -> float:
+    timeouts = getattr(settings, 'KYC_HEALTH_CHECK_TIMEOUTS', {})
+    return timeouts.get(provider, timeouts.get('default', 5))
+
+
+def _timed_check(provider) -> Dict:
+    start = time.perf_counter()
+    result = provider.health_check()
+    result.setdefault('response_time_ms', (time.perf_counter() - start) * 1000)
+    return result
+
+
+def probe_all(providers: Dict) -> Dict[str, Dict]:
+    """
+    Executa os health checks concorrentemente
+
+    Args:
+        providers: {nome: instância do provedor}
+
+    Returns:
+        {nome: {'status', 'response_time_ms', ...}}; timeout vira status 'timeout'
+    """
+    results = {}
+    probes = {name: p for name, p in providers.items() if hasattr(p, 'health_check')}
+    for name in providers.keys() - probes.keys():
+        results[name] = {'status': 'unknown', 'note': 'No health check available'}
+    if not probes:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix='kyc-health')
+    try:
+        start = time.monotonic()
+        futures = {name: executor.submit(_timed_check, p) for name, p in probes.items()}
+        for name, future in futures.items():
+            timeout = probe_timeout(name)
+            remaining = max(start + timeout - time.monotonic(), 0)
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeout:
+                results[name] = {
+                    'status': 'timeout',
+                    'error': f'No response within {timeout}s',
+                    'response_time_ms': timeout * 1000,
+                }
+            except Exception as e:
+                results[name] = {'status': 'unhealthy', 'error': str(e)}
+    finally:
+        # Não espera probes travados; a thread termina quando o HTTP desistir
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+def _next_state(previous: Dict, result: Dict) -> Dict:
+    """Aplica a histerese sobre o estado anterior do provedor"""
+    failure_threshold = getattr(settings, 'KYC_HEALTH_FAILURE_THRESHOLD', 3)
+    recovery_threshold = getattr(settings, 'KYC_HEALTH_RECOVERY_THRESHOLD', 2)
+
+    routable = previous.get('routable', True)
+    failures = previous.get('consecutive_failures', 0)
+    successes = previous.get('consecutive_successes', 0)
+
+    status = result.get('status', 'unknown')
+    if status in HEALTHY_STATUSES:
+        failures, successes = 0, successes + 1
+        if not routable and successes >= recovery_threshold:
+            routable = True
+    elif status != 'unknown':
+        failures, successes = failures + 1, 0
+        if routable and failures >= failure_threshold:
+            routable = False
+
+    return {
+        'status': status,
+        'routable': routable,
+        'consecutive_failures': failures,
+        'consecutive_successes': successes,
+        'response_time_ms': round(result.get('response_time_ms') or 0, 1),
+        'error': result.get('error', ''),
+        'last_check': timezone.now().isoformat(),
+        'changed': routable != previous.get('routable', True),
+    }
+
+
+def record(results: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Grava os resultados no hash compartilhado (único escritor: o beat de health)
+
+    Returns:
+        Estado novo por provedor
+    """
+    client = metrics_client()
+    previous = health_snapshot()
+    states = {}
+
+    for name, result in results.items():
+        state = _next_state(previous.get(name, {}), result)
+        states[name] = state
+        if state['changed']:
+            if state['routable']:
+                logger.info(f"KYC provider {name} recovered, back in routing")
+            else:
+                logger.warning(
+                    f"KYC provider {name} removed from routing after "
+                    f"{state['consecutive_failures']} failed health checks"
+                )
+
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(HEALTH_KEY, mapping={name: json.dumps(state) for name, state in states.items()})
+    # Sem beat de health, o estado expira e os provedores voltam a ser roteáveis
+    pipe.expire(HEALTH_KEY, getattr(settings, 'KYC_HEALTH_STATE_TTL', 900))
+    pipe.execute()
+    return states
+
+
+def health_snapshot() -> Dict[str, Dict]:
+    """Estado de saúde de todos os provedores; {} se o Redis estiver indisponível"""
+    try:
+        raw = metrics_client().hgetall(HEALTH_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read KYC provider health: {e}")
+        return {}
+    return {
+        (k.decode() if isinstance(k, bytes) else k): json.loads(v)
+        for k, v in raw.items()
+    }
+
+
+def get_health(provider: str) -> Dict:
+    return health_snapshot().get(provider) or {'status': 'unknown', 'last_check': 'never'}
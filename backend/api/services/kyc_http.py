@@ -0,0 +1,348 @@
+"""
+Camada HTTP compartilhada dos provedores KYC
+
+* um requests.Session por provedor (keep-alive, pool dimensionado)
+* teto de concorrência por provedor, alinhado ao rate limit contratado
+* retries em 429/503 (e erros de conexão) respeitando Retry-After
+* variante asyncio (httpx) para manter dezenas de chamadas lentas em voo
+  num único worker
+* histograma de latência por provedor/endpoint (Prometheus); a latência de
+  cada verificação segue em KYCResult.latency_ms para o KYCProviderStats
+* before_each_attempt(): callbacks (síncronos) rodados pelo cliente síncrono
+  ao obter o slot e antes de cada retry (ex.: renovar o lease da verificação)
+
+Configuração: KYC_PROVIDER_HTTP_DEFAULTS, sobrescrita por provedor em
+KYC_PROVIDERS[<nome>]['http'].
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+if PROMETHEUS_AVAILABLE:
+    KYC_PROVIDER_REQUEST_SECONDS = Histogram(
+        'kyc_provider_request_seconds',
+        'Latência das chamadas HTTP aos provedores KYC',
+        ['provider', 'endpoint', 'outcome'],
+        buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+    )
+    KYC_PROVIDER_RETRIES = Counter(
+        'kyc_provider_retries_total',
+        'Retries de chamadas aos provedores KYC',
+        ['provider', 'reason'],
+    )
+
+# 429/503: o provedor recusou a requisição, então reenviar um POST é seguro.
+# 502/504 só são repetidos em métodos idempotentes (o POST pode ter sido processado).
+RETRY_STATUSES = frozenset({429, 503})
+IDEMPOTENT_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+DEFAULT_HTTP_CONFIG = {
+    'pool_maxsize': 10,
+    'max_concurrency': 10,
+    'max_retries': 2,
+    'backoff_seconds': 0.5,
+    'max_retry_after': 30,
+    'acquire_timeout': 30,
+}
+
+if HTTPX_AVAILABLE:
+    TIMEOUT_ERRORS = (requests.exceptions.Timeout, httpx.TimeoutException)
+else:
+    TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
+
+
+class ProviderSaturated(Exception):
+    """Nenhum slot de concorrência livre para o provedor dentro do acquire_timeout"""
+    pass
+
+
+_attempt_hooks: contextvars.ContextVar = contextvars.ContextVar('kyc_http_attempt_hooks', default=())
+
+
+@contextlib.contextmanager
+def before_each_attempt(hook: Callable[[], None]) -> Iterator[None]:
+    """
+    Registra `hook` para as chamadas feitas dentro do bloco. Uma exceção do
+    hook aborta a chamada antes de a requisição sair.
+    """
+    token = _attempt_hooks.set(_attempt_hooks.get() + (hook,))
+    try:
+        yield
+    finally:
+        _attempt_hooks.reset(token)
+
+
+def _run_attempt_hooks():
+    for hook in _attempt_hooks.get():
+        hook()
+
+
+def provider_http_config(provider: str, settings_key: str = None) -> Dict:
+    """
+    Defaults globais + overrides de KYC_PROVIDERS[settings_key]['http'].
+    O pool nunca fica menor que max_concurrency: com pool_block=True os
+    slots excedentes só esperariam conexão, limitando a concorrência real.
+    """
+    config = dict(DEFAULT_HTTP_CONFIG)
+    config.update(getattr(settings, 'KYC_PROVIDER_HTTP_DEFAULTS', {}))
+    providers = getattr(settings, 'KYC_PROVIDERS', {})
+    config.update(providers.get(settings_key or provider, {}).get('http', {}))
+    if config['pool_maxsize'] < config['max_concurrency']:
+        logger.info(
+            f"{provider}: pool_maxsize {config['pool_maxsize']} < max_concurrency "
+            f"{config['max_concurrency']}; using {config['max_concurrency']}"
+        )
+        config['pool_maxsize'] = config['max_concurrency']
+    return config
+
+
+def retry_delay(attempt: int, headers, config: Dict) -> float:
+    """
+    Espera antes do próximo retry: Retry-After (segundos ou HTTP-date) quando
+    presente, senão backoff exponencial. Sempre limitado a max_retry_after.
+    """
+    value = headers.get('Retry-After') if headers is not None else None
+    delay = None
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+    if delay is None:
+        delay = config['backoff_seconds'] * (2 ** attempt)
+    return min(max(delay, 0.0), config['max_retry_after'])
+
+
+def _should_retry_status(method: str, status_code: int) -> bool:
+    if method.upper() in IDEMPOTENT_METHODS:
+        return status_code in IDEMPOTENT_RETRY_STATUSES
+    return status_code in RETRY_STATUSES
+
+
+def _observe(provider: str, endpoint: str, outcome: str, elapsed: float):
+    if PROMETHEUS_AVAILABLE:
+        KYC_PROVIDER_REQUEST_SECONDS.labels(provider, endpoint, outcome).observe(elapsed)
+
+
+def _count_retry(provider: str, reason: str):
+    if PROMETHEUS_AVAILABLE:
+        KYC_PROVIDER_RETRIES.labels(provider, reason).inc()
+
+
+class ProviderHTTPClient:
+    """
+    Cliente síncrono de um provedor (um por processo)
+
+    Uso:
+        http = provider_client('idwall')
+        response = http.post(url, endpoint='kyc/verify', json=data, timeout=30)
+    """
+
+    def __init__(self, provider: str, config: Dict):
+        self.provider = provider
+        self.config = config
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=config['pool_maxsize'],
+            pool_block=True,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._slots = threading.BoundedSemaphore(config['max_concurrency'])
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Reserva um slot de concorrência do provedor"""
+        if not self._slots.acquire(timeout=self.config['acquire_timeout']):
+            raise ProviderSaturated(f"{self.provider}: max_concurrency atingido")
+        try:
+            _run_attempt_hooks()
+            yield
+        finally:
+            self._slots.release()
+
+    def observe(self, endpoint: str, outcome: str, elapsed: float):
+        """Registra latência de chamadas feitas fora do cliente (ex.: SDKs)"""
+        _observe(self.provider, endpoint, outcome, elapsed)
+
+    def request(self, method: str, url: str, endpoint: str = None, max_retries: int = None,
+                **kwargs) -> requests.Response:
+        """
+        max_retries=0 para corpos em streaming, que não podem ser reenviados
+        """
+        endpoint = endpoint or url
+        if max_retries is None:
+            max_retries = self.config['max_retries']
+        attempt = 0
+        with self.slot():
+            while True:
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.exceptions.ConnectionError:
+                    _observe(self.provider, endpoint, 'connection_error', time.perf_counter() - start)
+                    if attempt >= max_retries:
+                        raise
+                    _count_retry(self.provider, 'connection_error')
+                    time.sleep(retry_delay(attempt, None, self.config))
+                    _run_attempt_hooks()
+                    attempt += 1
+                    continue
+                except requests.exceptions.Timeout:
+                    _observe(self.provider, endpoint, 'timeout', time.perf_counter() - start)
+                    raise
+
+                _observe(self.provider, endpoint, str(response.status_code), time.perf_counter() - start)
+                if attempt < max_retries and _should_retry_status(method, response.status_code):
+                    delay = retry_delay(attempt, response.headers, self.config)
+                    logger.warning(
+                        f"{self.provider} {endpoint} returned {response.status_code}, "
+                        f"retrying in {delay:.1f}s"
+                    )
+                    _count_retry(self.provider, str(response.status_code))
+                    response.close()
+                    time.sleep(delay)
+                    _run_attempt_hooks()
+                    attempt += 1
+                    continue
+                return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+
+class AsyncProviderHTTPClient:
+    """
+    Cliente asyncio (httpx) de um provedor, preso ao event loop que o criou
+    """
+
+    def __init__(self, provider: str, config: Dict):
+        self.provider = provider
+        self.config = config
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config['pool_maxsize'],
+                max_keepalive_connections=config['pool_maxsize'],
+            ),
+        )
+        self._slots = asyncio.Semaphore(config['max_concurrency'])
+
+    async def request(self, method: str, url: str, endpoint: str = None, **kwargs) -> 'httpx.Response':
+        endpoint = endpoint or url
+        attempt = 0
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.config['acquire_timeout'])
+        except asyncio.TimeoutError:
+            raise ProviderSaturated(f"{self.provider}: max_concurrency atingido")
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.ConnectError:
+                    _observe(self.provider, endpoint, 'connection_error', time.perf_counter() - start)
+                    if attempt >= self.config['max_retries']:
+                        raise
+                    _count_retry(self.provider, 'connection_error')
+                    await asyncio.sleep(retry_delay(attempt, None, self.config))
+                    attempt += 1
+                    continue
+                except httpx.TimeoutException:
+                    _observe(self.provider, endpoint, 'timeout', time.perf_counter() - start)
+                    raise
+
+                _observe(self.provider, endpoint, str(response.status_code), time.perf_counter() - start)
+                if attempt < self.config['max_retries'] and _should_retry_status(method, response.status_code):
+                    delay = retry_delay(attempt, response.headers, self.config)
+                    logger.warning(
+                        f"{self.provider} {endpoint} returned {response.status_code}, "
+                        f"retrying in {delay:.1f}s"
+                    )
+                    _count_retry(self.provider, str(response.status_code))
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                return response
+        finally:
+            self._slots.release()
+
+    async def get(self, url: str, **kwargs) -> 'httpx.Response':
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> 'httpx.Response':
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients: Dict[str, ProviderHTTPClient] = {}
+_clients_lock = threading.Lock()
+_async_clients: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+
+def provider_client(provider: str, settings_key: str = None) -> ProviderHTTPClient:
+    """Cliente síncrono do provedor (singleton por processo)"""
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = ProviderHTTPClient(provider, provider_http_config(provider, settings_key))
+                _clients[provider] = client
+    return client
+
+
+def async_provider_client(provider: str, settings_key: str = None) -> Optional[AsyncProviderHTTPClient]:
+    """
+    Cliente asyncio do provedor para o event loop corrente.
+    Retorna None se httpx não estiver instalado.
+    """
+    if not HTTPX_AVAILABLE:
+        return None
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    if provider not in clients:
+        clients[provider] = AsyncProviderHTTPClient(provider, provider_http_config(provider, settings_key))
+    return clients[provider]
+
+
+async def aclose_async_clients():
+    """Fecha os clientes asyncio do loop corrente (chamar ao fim do lote)"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.pop(loop, {})
+    for client in clients.values():
+        await client.aclose()
@@ -0,0 +1,215 @@
+"""
+Pipeline de mídia KYC (documentos, selfies e vídeos de liveness)
+
+* store_stream(): grava o upload no storage em chunks, calculando sha256 e
+  tamanho na mesma passada; nenhum arquivo é lido inteiro para a memória
+* presigned_url(): URL temporária gerada na hora do envio ao provedor
+  (S3Boto3Storage assina; FileSystemStorage devolve a URL local)
+* normalize_image(): rotação EXIF, RGB e redução para KYC_MEDIA_MAX_DIMENSION
+  num ProcessPoolExecutor (inline dentro de workers Celery, que são daemon)
+* multipart_stream(): corpo multipart lido sob demanda do storage, para
+  provedores configurados com media_delivery='multipart'
+
+Uploads acima de FILE_UPLOAD_MAX_MEMORY_SIZE já chegam num arquivo temporário.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    from requests_toolbelt import MultipartEncoder
+    TOOLBELT_AVAILABLE = True
+except ImportError:
+    TOOLBELT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+NORMALIZABLE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+
+
+class StoredMedia(NamedTuple):
+    path: str
+    url: str
+    size: int
+    sha256: str
+
+
+class HashingFile(File):
+    """
+    File que acumula sha256/tamanho conforme o storage lê os chunks.
+    Um seek(0) (storages fazem antes de ler) reinicia a contagem.
+    """
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self._reset()
+
+    def _reset(self):
+        self.hasher = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.hasher.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.file.seek(offset, whence)
+        if offset == 0 and whence == os.SEEK_SET:
+            self._reset()
+        return position
+
+
+def chunk_size() -> int:
+    return getattr(settings, 'KYC_MEDIA_CHUNK_SIZE', 1024 * 1024)
+
+
+def store_stream(file, name: str) -> StoredMedia:
+    """
+    Grava o upload no storage em streaming
+
+    Args:
+        file: UploadedFile (ou qualquer objeto file-like)
+        name: Caminho desejado no storage
+
+    Returns:
+        StoredMedia com caminho final, URL, tamanho e sha256
+    """
+    source = HashingFile(file, name=name)
+    source.DEFAULT_CHUNK_SIZE = chunk_size()
+    path = default_storage.save(name, source)
+    return StoredMedia(
+        path=path,
+        url=default_storage.url(path),
+        size=source.bytes_read,
+        sha256=source.hasher.hexdigest(),
+    )
+
+
+def presigned_url(path: str, expire: Optional[int] = None) -> str:
+    """URL temporária para o provedor baixar a mídia"""
+    expire = expire or getattr(settings, 'KYC_MEDIA_URL_EXPIRE_SECONDS', 900)
+    try:
+        return default_storage.url(path, expire=expire)
+    except TypeError:
+        # Storage sem assinatura (FileSystemStorage)
+        return default_storage.url(path)
+
+
+def _normalize_local(src: str, dst: str, max_dimension: int, quality: int) -> None:
+    """Roda no processo do pool: recebe caminhos, nunca bytes (nada grande é serializado)"""
+    with Image.open(src) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+        image.thumbnail((max_dimension, max_dimension))
+        image.save(dst, 'JPEG', quality=quality, optimize=True)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool de processos do web; None em processos daemon (workers Celery prefork)"""
+    global _pool
+    if multiprocessing.current_process().daemon:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'KYC_MEDIA_PROCESS_WORKERS', 2)
+                )
+    return _pool
+
+
+def normalized_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.normalized.jpg"
+
+
+def normalize_image(path: str) -> str:
+    """
+    Versão normalizada da imagem no storage (gerada uma vez, reutilizada em retries).
+
+    Returns:
+        Caminho a enviar ao provedor; o original se não for imagem ou se falhar
+    """
+    if not PIL_AVAILABLE or os.path.splitext(path)[1].lower() not in NORMALIZABLE_EXTENSIONS:
+        return path
+
+    target = normalized_path(path)
+    if default_storage.exists(target):
+        return target
+
+    max_dimension = getattr(settings, 'KYC_MEDIA_MAX_DIMENSION', 2000)
+    quality = getattr(settings, 'KYC_MEDIA_JPEG_QUALITY', 85)
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='kyc-media-') as tmp:
+            try:
+                src = default_storage.path(path)
+            except NotImplementedError:
+                # Storage remoto: baixa em streaming para um arquivo local
+                src = os.path.join(tmp, 'source')
+                with default_storage.open(path, 'rb') as remote, open(src, 'wb') as local:
+                    shutil.copyfileobj(remote, local, chunk_size())
+            dst = os.path.join(tmp, 'normalized.jpg')
+
+            pool = _process_pool()
+            if pool is None:
+                _normalize_local(src, dst, max_dimension, quality)
+            else:
+                pool.submit(_normalize_local, src, dst, max_dimension, quality).result(
+                    timeout=getattr(settings, 'KYC_MEDIA_NORMALIZE_TIMEOUT', 30)
+                )
+
+            with open(dst, 'rb') as normalized:
+                return default_storage.save(target, File(normalized))
+
+    except Exception as e:
+        logger.warning(f"Image normalization failed for {path}, sending original: {e}")
+        return path
+
+
+@contextlib.contextmanager
+def multipart_stream(fields: Dict, files: Dict[str, str]) -> Iterator['MultipartEncoder']:
+    """
+    Corpo multipart que lê as mídias do storage sob demanda
+
+    Args:
+        fields: Campos simples (dicts/listas viram JSON)
+        files: {campo: caminho no storage}
+    """
+    handles = []
+    try:
+        parts = {
+            key: value if isinstance(value, str) else json.dumps(value, default=str)
+            for key, value in fields.items() if value is not None
+        }
+        for field, path in files.items():
+            handle = default_storage.open(path, 'rb')
+            handles.append(handle)
+            parts[field] = (os.path.basename(path), handle, 'application/octet-stream')
+        yield MultipartEncoder(fields=parts)
+    finally:
+        for handle in handles:
+            handle.close()
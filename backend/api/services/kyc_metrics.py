@@ -0,0 +1,94 @@
+"""
+Sketch de latência por provedor KYC (quantis em streaming)
+
+Histograma com buckets logarítmicos (estilo DDSketch/HDR): cada latência
+cai no bucket floor(log(ms) / log(gamma)), com erro relativo <= KYC_LATENCY_SKETCH_ERROR
+em qualquer quantil. As verificações só fazem HINCRBY no Redis (sem lock de linha);
+o beat drena os buckets, mescla no KYCProviderStats.latency_sketch com decaimento
+e grava o p95 real em last_ms_p95.
+"""
+import logging
+import math
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SKETCH_KEY = "kyc:latency:{provider}"
+
+_redis: Optional[redis.Redis] = None
+
+
+def _gamma() -> float:
+    alpha = getattr(settings, 'KYC_LATENCY_SKETCH_ERROR', 0.02)
+    return (1 + alpha) / (1 - alpha)
+
+
+def metrics_client() -> redis.Redis:
+    """Singleton do cliente Redis das métricas KYC"""
+    global _redis
+    if _redis is None:
+        url = getattr(settings, 'KYC_METRICS_REDIS_URL', settings.CELERY_BROKER_URL)
+        _redis = redis.Redis.from_url(url)
+    return _redis
+
+
+def log_gamma() -> float:
+    """Divisor do índice de bucket (também usado em SQL pelo rollup horário)"""
+    return math.log(_gamma())
+
+
+def bucket_index(latency_ms: float) -> int:
+    return int(math.floor(math.log(max(latency_ms, 1.0)) / log_gamma()))
+
+
+def bucket_value(index: int) -> float:
+    """Valor representativo do bucket (média harmônica das bordas)"""
+    gamma = _gamma()
+    return 2 * gamma ** (index + 1) / (gamma + 1)
+
+
+def record_latency(provider: str, latency_ms: int):
+    """Registra uma latência (O(1), atômico no Redis). Falhas só são logadas."""
+    try:
+        metrics_client().hincrby(SKETCH_KEY.format(provider=provider), bucket_index(latency_ms), 1)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record KYC latency for {provider}: {e}")
+
+
+def drain(provider: str) -> Dict[int, float]:
+    """Lê e zera os buckets acumulados desde o último flush (MULTI/EXEC)"""
+    key = SKETCH_KEY.format(provider=provider)
+    pipe = metrics_client().pipeline(transaction=True)
+    pipe.hgetall(key)
+    pipe.delete(key)
+    raw, _ = pipe.execute()
+    return {int(k): float(v) for k, v in raw.items()}
+
+
+def merge(sketch: Dict, fresh: Dict[int, float], decay: float = 1.0) -> Dict[str, float]:
+    """
+    Mescla buckets novos num sketch persistido (chaves str, vindas do JSONField).
+    decay < 1 envelhece o histórico a cada flush; buckets desprezíveis são podados.
+    """
+    merged = {int(k): float(v) * decay for k, v in (sketch or {}).items()}
+    for index, count in fresh.items():
+        merged[index] = merged.get(index, 0.0) + count
+    return {str(k): round(v, 4) for k, v in merged.items() if v >= 0.01}
+
+
+def quantile(sketch: Dict, q: float) -> int:
+    """Quantil q (0-1) do sketch em ms; 0 se vazio"""
+    buckets = sorted((int(k), float(v)) for k, v in (sketch or {}).items())
+    total = sum(count for _, count in buckets)
+    if total <= 0:
+        return 0
+    rank = q * total
+    seen = 0.0
+    for index, count in buckets:
+        seen += count
+        if seen >= rank:
+            return int(round(bucket_value(index)))
+    return int(round(bucket_value(buckets[-1][0])))
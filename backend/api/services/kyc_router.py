@@ -1,16 +1,16 @@
 """
 Sistema de Roteamento Inteligente para Provedores KYC
-Implementa epsilon-greedy multi-armed bandit para otimização automática de custo-benefício
+Implementa Thompson sampling (multi-armed bandit) para otimização automática de custo-benefício
 """
 
+import asyncio
 import random
+import threading
 import time
 import logging
 from typing import Dict, Optional, List, Tuple, TYPE_CHECKING
 from datetime import date, datetime
-from django.db import transaction
 from django.conf import settings
-from django.core.cache import cache
 
 if TYPE_CHECKING:
     from ..models import KYCProviderStats, User
@@ -24,13 +24,27 @@ class KYCRouter:
     - Custo-benefício em tempo real
     - Taxa de sucesso histórica
     - Orçamentos e limites free tier
-    - Algoritmo epsilon-greedy para exploração vs exploração
+    - Thompson sampling (Beta) penalizado por custo e latência
+    
+    A seleção é puramente em memória: um snapshot local ao processo de
+    KYCProviderConfig + KYCProviderStats (+ saúde, de services/kyc_health.py)
+    é recarregado a cada KYC_ROUTER_SNAPSHOT_TTL segundos. Reset mensal fica só no beat.
+    Quem vai de fato chamar o provedor usa reserve_provider(): orçamento e
+    free tier são reservados atomicamente no Redis (services/kyc_budget.py).
     """
     
     def __init__(self):
-        self.epsilon = getattr(settings, 'KYC_ROUTER_EPSILON', 0.1)  # 10% exploração
-        self.cache_ttl = 300  # 5 minutos cache
+        # Piso de exploração uniforme além do próprio Thompson sampling
+        self.epsilon = getattr(settings, 'KYC_ROUTER_EPSILON', 0.02)
+        self.cost_weight = getattr(settings, 'KYC_ROUTER_COST_WEIGHT', 0.3)
+        self.latency_weight = getattr(settings, 'KYC_ROUTER_LATENCY_WEIGHT', 0.1)
+        self.snapshot_ttl = getattr(settings, 'KYC_ROUTER_SNAPSHOT_TTL', 30)
+        self.cache_ttl = 60  # escolha fixa por usuário por minuto
         self._last_choice_cache = {}
+        self._choice_minute = None
+        self._snapshot: Dict[str, Dict] = {}
+        self._snapshot_loaded_at = 0.0
+        self._snapshot_lock = threading.Lock()
         
     def choose_provider(
         self, 
@@ -40,7 +54,7 @@ class KYCRouter:
         force_provider: Optional[str] = None
     ) -> str:
         """
-        Seleciona o melhor provedor baseado em algoritmo epsilon-greedy
+        Seleciona o melhor provedor via Thompson sampling sobre o snapshot
         
         Args:
             user: Usuário solicitando verificação
@@ -54,120 +68,234 @@ class KYCRouter:
         if force_provider:
             return force_provider
         
-        # Cache para evitar múltiplas seleções simultâneas
-        cache_key = f"kyc_provider_choice_{user.id}_{int(time.time() // 60)}"  # Cache por minuto
-        cached_choice = cache.get(cache_key)
-        if cached_choice:
-            logger.debug(f"Using cached provider choice: {cached_choice}")
-            return cached_choice
+        # Mesma escolha para o mesmo usuário dentro do minuto (local ao processo)
+        minute = int(time.time() // self.cache_ttl)
+        choice_key = (user.id, needs_biometric, needs_pep)
+        cached = self._last_choice_cache.get(choice_key)
+        if cached and cached[0] == minute:
+            logger.debug(f"Using cached provider choice: {cached[1]}")
+            return cached[1]
         
         try:
-            # Filtrar provedores elegíveis
-            eligible_providers = self._get_eligible_providers(
-                needs_biometric=needs_biometric,
-                needs_pep=needs_pep,
-                user=user
-            )
-            
-            if not eligible_providers:
+            ranked = self._ranked_providers(needs_biometric, needs_pep, user)
+            if not ranked:
                 logger.warning("No eligible KYC providers found, falling back to stripe")
                 return 'stripe'
             
-            # Verificar reset mensal
-            self._check_monthly_reset(eligible_providers)
-            
-            # Algoritmo epsilon-greedy
-            if random.random() < self.epsilon:
-                # Exploração: escolha aleatória
-                chosen = random.choice(list(eligible_providers.keys()))
-                logger.info(f"KYC Router: Exploration mode selected {chosen}")
-            else:
-                # Exploração: melhor utility score
-                chosen = max(eligible_providers.keys(), 
-                           key=lambda p: eligible_providers[p].utility_score)
-                logger.info(f"KYC Router: Exploitation mode selected {chosen} "
-                           f"(utility: {eligible_providers[chosen].utility_score:.3f})")
-            
-            # Cache a escolha
-            cache.set(cache_key, chosen, self.cache_ttl)
-            
+            chosen = ranked[0][0]
+            self._cache_choice(minute, choice_key, chosen)
             return chosen
             
         except Exception as e:
             logger.error(f"Error in KYC provider selection: {str(e)}")
             return 'stripe'  # Fallback seguro
     
-    def _get_eligible_providers(
-        self, 
+    def reserve_provider(
+        self,
+        user: 'User',
+        needs_biometric: bool = False,
+        needs_pep: bool = False
+    ) -> Tuple[str, Optional[Dict]]:
+        """
+        Como choose_provider, mas reserva free tier / orçamento no Redis antes
+        de devolver o provedor: tenta os candidatos na ordem do ranking até
+        um aceitar a reserva
+        
+        Returns:
+            (provedor, reserva); devolver a reserva com kyc_budget.release()
+            se a chamada ao provedor não acontecer
+        """
+        from . import kyc_budget
+        
+        minute = int(time.time() // self.cache_ttl)
+        choice_key = (user.id, needs_biometric, needs_pep)
+        
+        try:
+            ranked = self._ranked_providers(needs_biometric, needs_pep, user)
+            cached = self._last_choice_cache.get(choice_key)
+            if cached and cached[0] == minute:
+                # A escolha do minuto vai primeiro, se ainda for elegível
+                ranked.sort(key=lambda item: item[0] != cached[1])
+            
+            for name, entry in ranked:
+                reservation = kyc_budget.reserve(name, entry, entry['estimated_cost'])
+                if reservation is not None:
+                    self._cache_choice(minute, choice_key, name)
+                    return name, reservation
+                logger.info(f"KYC Router: {name} has no free tier or budget left")
+            
+        except Exception as e:
+            logger.error(f"Error in KYC provider reservation: {str(e)}")
+        
+        logger.warning("No KYC provider accepted a reservation, falling back to stripe")
+        return 'stripe', None
+    
+    def _ranked_providers(
+        self,
         needs_biometric: bool,
         needs_pep: bool,
         user: 'User'
-    ) -> Dict[str, 'KYCProviderStats']:
+    ) -> List[Tuple[str, Dict]]:
+        """Elegíveis em ordem de preferência (piso de exploração ou Thompson sampling)"""
+        eligible_providers = self._get_eligible_providers(
+            needs_biometric=needs_biometric,
+            needs_pep=needs_pep,
+            user=user
+        )
+        if not eligible_providers:
+            return []
+        
+        if random.random() < self.epsilon:
+            names = list(eligible_providers)
+            random.shuffle(names)
+            logger.info(f"KYC Router: Exploration floor selected {names[0]}")
+        else:
+            samples = self._thompson_scores(eligible_providers)
+            names = sorted(samples, key=samples.get, reverse=True)
+            logger.info(f"KYC Router: Thompson sampling selected {names[0]} "
+                       f"(score: {samples[names[0]]:.3f})")
+        return [(name, eligible_providers[name]) for name in names]
+    
+    def _cache_choice(self, minute: int, choice_key: Tuple, chosen: str):
+        if minute != self._choice_minute:
+            self._last_choice_cache.clear()
+            self._choice_minute = minute
+        self._last_choice_cache[choice_key] = (minute, chosen)
+    
+    def _thompson_scores(self, providers: Dict[str, Dict]) -> Dict[str, float]:
         """
-        Filtra provedores elegíveis baseado em requisitos e orçamentos
+        Amostra θ ~ Beta(sucessos+1, falhas+1) por provedor e penaliza por
+        custo esperado e latência p95 (normalizados pelo maior entre os elegíveis)
         """
-        from ..models import KYCProviderStats, KYCProviderConfig
+        max_cost = max(p['expected_cost'] for p in providers.values()) or 1.0
+        max_latency = max(p['last_ms_p95'] for p in providers.values()) or 1
         
-        eligible = {}
+        scores = {}
+        for name, p in providers.items():
+            failures = max(p['attempts'] - p['successes'], 0)
+            theta = random.betavariate(p['successes'] + 1, failures + 1)
+            scores[name] = (
+                theta
+                - self.cost_weight * (p['expected_cost'] / max_cost)
+                - self.latency_weight * (p['last_ms_p95'] / max_latency)
+            )
+        return scores
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Tabela de roteamento local ao processo (recarregada após snapshot_ttl)
+        Duas queries + um HGETALL por recarga; nada entre recargas
+        """
+        if time.monotonic() - self._snapshot_loaded_at < self.snapshot_ttl:
+            return self._snapshot
+        
+        with self._snapshot_lock:
+            if time.monotonic() - self._snapshot_loaded_at >= self.snapshot_ttl:
+                try:
+                    self._snapshot = self._load_snapshot()
+                except Exception as e:
+                    # Mantém o snapshot anterior; tenta de novo no próximo TTL
+                    logger.error(f"Error loading KYC routing snapshot: {str(e)}")
+                self._snapshot_loaded_at = time.monotonic()
+        return self._snapshot
+    
+    def invalidate_snapshot(self):
+        """Força recarga na próxima seleção (ex.: após ajuste de orçamento)"""
+        self._snapshot_loaded_at = 0.0
+    
+    def _load_snapshot(self) -> Dict[str, Dict]:
+        from ..models import KYCProviderStats, KYCProviderConfig
+        from .kyc_health import health_snapshot
         
-        # Buscar configurações ativas
+        health = health_snapshot()
         configs = {
             config.name: config 
             for config in KYCProviderConfig.objects.filter(enabled=True)
         }
         
-        # Buscar estatísticas
-        stats_queryset = KYCProviderStats.objects.filter(is_active=True)
+        snapshot = {}
+        for stats in KYCProviderStats.objects.filter(is_active=True, name__in=list(configs)):
+            config = configs[stats.name]
+            snapshot[stats.name] = {
+                'supports_biometric': config.supports_biometric,
+                'supports_pep': config.supports_pep,
+                'beta_only': config.beta_only,
+                'cost_per_document': float(config.cost_per_document),
+                'cost_per_biometric': float(config.cost_per_biometric),
+                'attempts': stats.attempts,
+                'successes': stats.successes,
+                'monthly_budget': float(stats.monthly_budget),
+                'monthly_spent': float(stats.monthly_spent),
+                'free_tier_limit': stats.free_tier_limit,
+                'reset_month': stats.reset_month,
+                'last_ms_p95': stats.last_ms_p95,
+                'routable': health.get(stats.name, {}).get('routable', True),
+            }
+        return snapshot
+    
+    def _get_eligible_providers(
+        self, 
+        needs_biometric: bool,
+        needs_pep: bool,
+        user: 'User'
+    ) -> Dict[str, Dict]:
+        """
+        Filtra provedores elegíveis (capacidades, beta, orçamento, free tier)
+        sobre o snapshot em memória
+        """
+        eligible = {}
         
-        for stats in stats_queryset:
-            config = configs.get(stats.name)
-            if not config:
+        for name, p in self.snapshot().items():
+            # Fora do roteamento por health checks seguidos com falha
+            if not p['routable']:
+                logger.debug(f"Provider {name} skipped: unhealthy")
                 continue
             
             # Verificar capacidades técnicas
-            if needs_biometric and not config.supports_biometric:
-                logger.debug(f"Provider {stats.name} skipped: no biometric support")
+            if needs_biometric and not p['supports_biometric']:
+                logger.debug(f"Provider {name} skipped: no biometric support")
                 continue
                 
-            if needs_pep and not config.supports_pep:
-                logger.debug(f"Provider {stats.name} skipped: no PEP support")
+            if needs_pep and not p['supports_pep']:
+                logger.debug(f"Provider {name} skipped: no PEP support")
                 continue
             
             # Verificar se é beta-only e usuário não é beta
-            if config.beta_only and not getattr(user, 'is_beta_user', False):
-                logger.debug(f"Provider {stats.name} skipped: beta only")
+            if p['beta_only'] and not getattr(user, 'is_beta_user', False):
+                logger.debug(f"Provider {name} skipped: beta only")
                 continue
             
-            # Verificar orçamento mensal
-            if stats.budget_remaining <= 0:
-                logger.debug(f"Provider {stats.name} skipped: budget exhausted")
-                continue
+            budget_remaining = p['monthly_budget'] - p['monthly_spent']
+            free_tier_remaining = max(0, p['free_tier_limit'] - p['attempts']) if p['free_tier_limit'] else 0
             
-            # Verificar free tier
-            estimated_cost = config.cost_per_document
+            estimated_cost = p['cost_per_document']
             if needs_biometric:
-                estimated_cost += config.cost_per_biometric
+                estimated_cost += p['cost_per_biometric']
             
-            if stats.free_tier_remaining > 0:
+            if free_tier_remaining > 0:
                 # Tem free tier disponível
-                eligible[stats.name] = stats
-            elif stats.budget_remaining >= estimated_cost:
+                eligible[name] = dict(p, expected_cost=0.0, estimated_cost=estimated_cost)
+            elif budget_remaining > 0 and budget_remaining >= estimated_cost:
                 # Tem orçamento para pagar
-                eligible[stats.name] = stats
+                eligible[name] = dict(p, expected_cost=estimated_cost, estimated_cost=estimated_cost)
             else:
-                logger.debug(f"Provider {stats.name} skipped: insufficient budget")
+                logger.debug(f"Provider {name} skipped: insufficient budget")
         
-        logger.info(f"Eligible KYC providers: {list(eligible.keys())}")
+        logger.debug(f"Eligible KYC providers: {list(eligible.keys())}")
         return eligible
     
-    def _check_monthly_reset(self, providers: Dict[str, 'KYCProviderStats']):
+    def _record_local(self, provider_name: str, success: bool, cost: float):
         """
-        Verifica e executa reset mensal das métricas se necessário
+        Aplica a verificação no snapshot local para que o bandit e os
+        limites de orçamento/free tier reajam antes da próxima recarga
         """
-        for stats in providers.values():
-            if stats.should_reset_monthly():
-                logger.info(f"Resetting monthly metrics for provider {stats.name}")
-                stats.reset_monthly_metrics()
+        entry = self._snapshot.get(provider_name)
+        if entry is None:
+            return
+        entry['attempts'] += 1
+        if success:
+            entry['successes'] += 1
+        entry['monthly_spent'] += float(cost)
     
     def update_provider_performance(
         self,
@@ -178,7 +306,10 @@ class KYCRouter:
         pep_found: bool = False
     ):
         """
-        Atualiza métricas de performance de um provedor de forma thread-safe
+        Atualiza métricas de performance de um provedor
+        
+        Contadores via UPDATE com F() (sem select_for_update na linha do provedor);
+        latência vai para o sketch no Redis, consolidado pelo beat em last_ms_p95
         
         Args:
             provider_name: Nome do provedor
@@ -188,24 +319,21 @@ class KYCRouter:
             pep_found: Se foi encontrado hit PEP/sanções
         """
         from ..models import KYCProviderStats
+        from . import kyc_metrics
         
         try:
-            with transaction.atomic():
-                stats = KYCProviderStats.objects.select_for_update().get(
-                    name=provider_name
-                )
-                stats.update_metrics(
-                    success=success,
-                    cost=cost,
-                    latency_ms=latency_ms,
-                    pep_found=pep_found
-                )
-                
-                logger.info(
-                    f"Updated KYC metrics for {provider_name}: "
-                    f"success={success}, cost=R${cost:.2f}, "
-                    f"latency={latency_ms}ms, utility={stats.utility_score:.3f}"
-                )
+            if not KYCProviderStats.record_verification(
+                provider_name, success=success, cost=cost, pep_found=pep_found
+            ):
+                logger.warning(f"No KYCProviderStats row for provider {provider_name}")
+            
+            kyc_metrics.record_latency(provider_name, latency_ms)
+            self._record_local(provider_name, success, cost)
+            
+            logger.debug(
+                f"Updated KYC metrics for {provider_name}: "
+                f"success={success}, cost=R${cost:.2f}, latency={latency_ms}ms"
+            )
                 
         except Exception as e:
             logger.error(f"Error updating provider metrics: {str(e)}")
@@ -245,32 +373,20 @@ class KYCRouter:
     
     def adjust_epsilon(self, market_volatility: float = 0.1):
         """
-        Ajusta o parâmetro epsilon baseado na volatilidade do mercado
+        Ajusta o piso de exploração uniforme baseado na volatilidade do mercado
+        (o Thompson sampling já explora sozinho; o piso só cobre mudanças bruscas)
         
         Args:
             market_volatility: Volatilidade atual (0-1), 
                              alta volatilidade = mais exploração
         """
-        from ..models import KYCProviderStats
+        base_epsilon = 0.01
+        volatility_adjustment = market_volatility * 0.05
         
-        # Calcular diferença entre top performers
-        stats = list(KYCProviderStats.objects.filter(is_active=True))
-        if len(stats) < 2:
-            return
-        
-        top_utilities = sorted([s.utility_score for s in stats], reverse=True)
-        performance_gap = top_utilities[0] - top_utilities[1] if len(top_utilities) > 1 else 0
-        
-        # Ajustar epsilon
-        base_epsilon = 0.05
-        volatility_adjustment = market_volatility * 0.1
-        performance_adjustment = max(0, 0.1 - performance_gap * 2)
+        self.epsilon = min(0.1, max(0.0, base_epsilon + volatility_adjustment))  # Limitado entre 0% e 10%
         
-        new_epsilon = base_epsilon + volatility_adjustment + performance_adjustment
-        self.epsilon = min(0.25, max(0.02, new_epsilon))  # Limitado entre 2% e 25%
-        
-        logger.info(f"Adjusted KYC epsilon to {self.epsilon:.3f} "
-                   f"(gap: {performance_gap:.3f}, volatility: {market_volatility:.3f})")
+        logger.info(f"Adjusted KYC exploration floor to {self.epsilon:.3f} "
+                   f"(volatility: {market_volatility:.3f})")
 
 
 # Singleton global
@@ -324,6 +440,13 @@ class BaseKYCProvider(ABC):
     def name(self) -> str:
         """Nome do provedor"""
         pass
+    
+    async def averify(self, user_id: int, payload: KYCPayload) -> KYCResult:
+        """
+        Variante asyncio de verify(). Provedores com cliente HTTP assíncrono
+        sobrescrevem; o padrão roda verify() numa thread.
+        """
+        return await asyncio.to_thread(self.verify, user_id, payload)
 
 
 def get_kyc_provider(provider_name: str) -> BaseKYCProvider:
@@ -345,4 +468,31 @@ def get_kyc_provider(provider_name: str) -> BaseKYCProvider:
     module = import_module(module_path)
     provider_class = getattr(module, class_name)
     
-    return provider_class()
\ No newline at end of file
+    return provider_class()
+
+
+def verify_many(provider_name: str, jobs: List[Tuple[int, KYCPayload]]) -> List[KYCResult]:
+    """
+    Executa várias verificações no mesmo provedor concorrentemente num único
+    worker (asyncio), respeitando o max_concurrency do provedor
+    
+    Args:
+        provider_name: Nome do provedor
+        jobs: Lista de (user_id, payload)
+        
+    Returns:
+        Resultados na mesma ordem de jobs
+    """
+    from .kyc_http import aclose_async_clients
+    
+    provider = get_kyc_provider(provider_name)
+    
+    async def _run():
+        try:
+            return await asyncio.gather(
+                *(provider.averify(user_id, payload) for user_id, payload in jobs)
+            )
+        finally:
+            await aclose_async_clients()
+    
+    return list(asyncio.run(_run()))
\ No newline at end of file
@@ -3,7 +3,6 @@ Serviço de KYC (Know Your Customer) - GalaxIA Marketplace
 Integração com provedores externos para verificação de identidade
 """
 
-import hashlib
 import requests
 import logging
 from typing import Dict, List, Optional, Tuple
@@ -14,6 +13,8 @@ from django.core.files.storage import default_storage
 from django.utils import timezone
 from django.db import transaction
 
+from . import kyc_media
+from .kyc_http import provider_client
 from ..models import (
     KYCDocument, BiometricVerification, KYCProfile, 
     VerificationProvider, VerificationLog, DocumentType, 
@@ -35,6 +36,12 @@ class BaseKYCProvider:
         self.provider = provider_config
         self.api_key = settings.KYC_PROVIDERS.get(provider_config.slug, {}).get('api_key')
         self.base_url = provider_config.api_endpoint
+        self.http = provider_client(provider_config.slug)
+        # 'url' (pré-assinada) ou 'multipart' (corpo em streaming, requer requests-toolbelt)
+        self.media_delivery = settings.KYC_PROVIDERS.get(provider_config.slug, {}).get('media_delivery', 'url')
+        if self.media_delivery == 'multipart' and not kyc_media.TOOLBELT_AVAILABLE:
+            logger.warning(f"requests-toolbelt not installed, {provider_config.slug} falls back to pre-signed URLs")
+            self.media_delivery = 'url'
         
     def verify_document(self, document: KYCDocument) -> Dict:
         """Verifica um documento via API do provedor"""
@@ -44,19 +51,42 @@ class BaseKYCProvider:
         """Verifica dados biométricos via API do provedor"""
         raise NotImplementedError("Subclasses must implement verify_biometric")
     
-    def _make_request(self, endpoint: str, data: Dict, timeout: int = 30) -> Dict:
-        """Faz requisição HTTP para o provedor"""
+    def _media(self, path: str, normalize: bool = False) -> Optional[str]:
+        """Caminho da mídia a enviar (normalizado se imagem); None para registros sem caminho"""
+        if not path:
+            return None
+        return kyc_media.normalize_image(path) if normalize else path
+    
+    def _make_request(self, endpoint: str, data: Dict, timeout: int = 30, media: Dict[str, str] = None) -> Dict:
+        """
+        Faz requisição HTTP para o provedor (pool/concorrência/retries de kyc_http)
+        
+        Args:
+            media: {campo: caminho no storage}; vira URL pré-assinada no JSON ou
+                parte do corpo multipart em streaming, conforme media_delivery
+        """
         url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json',
             'User-Agent': 'GalaxIA-KYC/1.0'
         }
+        media = {field: path for field, path in (media or {}).items() if path}
         
         start_time = datetime.now()
         
         try:
-            response = requests.post(url, json=data, headers=headers, timeout=timeout)
+            if media and self.media_delivery == 'multipart':
+                with kyc_media.multipart_stream(data, media) as body:
+                    headers['Content-Type'] = body.content_type
+                    # Corpo em streaming não pode ser reenviado
+                    response = self.http.post(
+                        url, endpoint=endpoint, data=body, headers=headers, timeout=timeout, max_retries=0
+                    )
+            else:
+                if media:
+                    data = dict(data, **{field: kyc_media.presigned_url(path) for field, path in media.items()})
+                response = self.http.post(url, endpoint=endpoint, json=data, headers=headers, timeout=timeout)
             response_time = (datetime.now() - start_time).total_seconds()
             
             if response.status_code == 200:
@@ -105,7 +135,10 @@ class UnicoKYCProvider(BaseKYCProvider):
             }
         }
         
-        result = self._make_request('document/verify', data)
+        result = self._make_request(
+            'document/verify', data,
+            media={'image_url': self._media(document.file_path, normalize=True)}
+        )
         
         if result['success']:
             api_response = result['data']
@@ -140,7 +173,10 @@ class UnicoKYCProvider(BaseKYCProvider):
             'timestamp': biometric.timestamp_capture.isoformat()
         }
         
-        result = self._make_request('biometric/verify', data)
+        result = self._make_request('biometric/verify', data, media={
+            'selfie_url': self._media(biometric.selfie_path, normalize=True),
+            'liveness_video_url': self._media(biometric.liveness_video_path),
+        })
         
         if result['success']:
             api_response = result['data']
@@ -180,7 +216,10 @@ class IDWallKYCProvider(BaseKYCProvider):
             }
         }
         
-        result = self._make_request('validations', data)
+        result = self._make_request(
+            'validations', data,
+            media={'image': self._media(document.file_path, normalize=True)}
+        )
         
         if result['success']:
             api_response = result['data']
@@ -239,37 +278,38 @@ class KYCService:
         return providers
     
     def upload_document(self, user, document_type: str, file, metadata: Dict = None) -> KYCDocument:
-        """Upload e processamento inicial de documento"""
+        """
+        Upload e processamento inicial de documento
+        
+        O arquivo vai para o storage em chunks com sha256 calculado na mesma
+        passada; duplicatas são detectadas depois e o objeto recém-gravado é removido.
+        """
         
-        # Gerar hash do arquivo
-        file_content = file.read()
-        file_hash = hashlib.sha256(file_content).hexdigest()
-        file.seek(0)  # Reset file pointer
+        # Upload em streaming para storage (S3)
+        file_name = f"kyc/{user.id}/{document_type}_{timezone.now().strftime('%Y%m%d_%H%M%S')}_{file.name}"
+        stored = kyc_media.store_stream(file, file_name)
         
         # Verificar se já existe documento com mesmo hash
         existing = KYCDocument.objects.filter(
             user=user,
             document_type=document_type,
-            file_hash=file_hash
+            file_hash=stored.sha256
         ).first()
         
         if existing:
+            default_storage.delete(stored.path)
             logger.info(f"Document already exists for user {user.id}: {existing.id}")
             return existing
         
-        # Upload para storage (S3)
-        file_name = f"kyc/{user.id}/{document_type}_{timezone.now().strftime('%Y%m%d_%H%M%S')}_{file.name}"
-        file_path = default_storage.save(file_name, file)
-        file_url = default_storage.url(file_path)
-        
         # Criar registro do documento
         document = KYCDocument.objects.create(
             user=user,
             document_type=document_type,
-            file_url=file_url,
+            file_url=stored.url,
+            file_path=stored.path,
             file_name=file.name,
-            file_size=len(file_content),
-            file_hash=file_hash,
+            file_size=stored.size,
+            file_hash=stored.sha256,
             status=VerificationStatus.PENDING
         )
         
@@ -280,16 +320,93 @@ class KYCService:
         """
         Inicia verificação assíncrona de documento
         
+        A task só é publicada após o commit da transação corrente, para que o
+        worker encontre o documento ao tentar o claim.
+        
         Returns:
             Task ID da verificação assíncrona
         """
+        from celery import uuid as celery_uuid
         from ..tasks.kyc_tasks import process_document_verification
         
-        # Disparar task assíncrona
-        task = process_document_verification.delay(str(document.id), provider_name)
+        task_id = celery_uuid()
+        transaction.on_commit(
+            lambda: process_document_verification.apply_async(
+                args=(str(document.id), provider_name), task_id=task_id
+            )
+        )
+        
+        logger.info(f"Async verification scheduled for document {document.id}, task: {task_id}")
+        return task_id
+    
+    def get_document_provider(self, provider_name: str = None) -> Optional[BaseKYCProvider]:
+        """Provedor solicitado ou, na falta dele, o primeiro disponível"""
+        if provider_name and provider_name in self.providers:
+            return self.providers[provider_name]
+        return next(iter(self.providers.values())) if self.providers else None
+    
+    def get_biometric_provider(self) -> Optional[BaseKYCProvider]:
+        """Primeiro provedor ativo que suporta biometria"""
+        for p in self.providers.values():
+            if p.provider.supports_biometric:
+                return p
+        return None
+    
+    def call_document_provider(self, document: KYCDocument, provider: BaseKYCProvider) -> Dict:
+        """
+        Fase externa da verificação: só a chamada HTTP ao provedor.
+        Não toca no banco — deve rodar fora de qualquer transação/lock.
+        """
+        try:
+            return provider.verify_document(document)
+        except Exception as e:
+            logger.error(f"Error calling provider for document {document.id}: {str(e)}")
+            return {
+                'success': False,
+                'error': f"System error: {str(e)}",
+                'status': VerificationStatus.REJECTED,
+            }
+    
+    def apply_document_result(self, document: KYCDocument, provider: BaseKYCProvider, result: Dict) -> bool:
+        """
+        Fase de escrita: registra log e grava o resultado do provedor.
+        Pensada para rodar numa transação curta.
+        """
+        VerificationLog.objects.create(
+            user=document.user,
+            provider=provider.provider,
+            verification_type=f"document_{document.document_type}",
+            request_data={'document_id': str(document.id)},
+            response_data=result.get('provider_response', {}),
+            success=result['success'],
+            error_message=result.get('error', ''),
+            confidence_score=result.get('confidence_score', 0.0),
+            response_time=result.get('response_time', 0.0),
+            cost=provider.provider.cost_per_verification
+        )
+        
+        if result['success']:
+            # Atualizar documento com resultado
+            document.confidence_score = result['confidence_score']
+            document.ocr_data = result['ocr_data']
+            document.verification_provider = provider.provider.name
+            document.mark_as_processed(
+                result['status'],
+                result['provider_response']
+            )
+            
+            # Atualizar perfil KYC se aprovado
+            if result['status'] == VerificationStatus.APPROVED:
+                self._update_kyc_profile_from_document(document)
+            
+            logger.info(f"Document verified successfully: {document.id}")
+            return True
         
-        logger.info(f"Async verification started for document {document.id}, task: {task.id}")
-        return task.id
+        document.rejection_reason = result.get('error', 'Verification failed')
+        document.mark_as_processed(VerificationStatus.REJECTED)
+        
+        logger.warning(f"Document verification failed: {document.id} - {result.get('error')}")
+        return False
     
     def verify_document(self, document: KYCDocument, provider_name: str = None) -> bool:
         """
@@ -297,12 +414,7 @@ class KYCService:
         
         NOTA: Esta versão é mantida para compatibilidade mas recomenda-se usar verify_document_async
         """
-        
-        if provider_name and provider_name in self.providers:
-            provider = self.providers[provider_name]
-        else:
-            # Usar provedor padrão ou primeiro disponível
-            provider = next(iter(self.providers.values())) if self.providers else None
+        provider = self.get_document_provider(provider_name)
         
         if not provider:
             logger.error("No KYC provider available")
@@ -314,45 +426,10 @@ class KYCService:
             document.status = VerificationStatus.PROCESSING
             document.save()
             
-            # Chamar API do provedor
-            result = provider.verify_document(document)
+            result = self.call_document_provider(document, provider)
             
-            # Log da verificação
-            log_entry = VerificationLog.objects.create(
-                user=document.user,
-                provider=provider.provider,
-                verification_type=f"document_{document.document_type}",
-                request_data={'document_id': str(document.id)},
-                response_data=result.get('provider_response', {}),
-                success=result['success'],
-                error_message=result.get('error', ''),
-                confidence_score=result.get('confidence_score', 0.0),
-                response_time=result.get('response_time', 0.0),
-                cost=provider.provider.cost_per_verification
-            )
-            
-            if result['success']:
-                # Atualizar documento com resultado
-                document.confidence_score = result['confidence_score']
-                document.ocr_data = result['ocr_data']
-                document.verification_provider = provider.provider.name
-                document.mark_as_processed(
-                    result['status'],
-                    result['provider_response']
-                )
-                
-                # Atualizar perfil KYC se aprovado
-                if result['status'] == VerificationStatus.APPROVED:
-                    self._update_kyc_profile_from_document(document)
-                
-                logger.info(f"Document verified successfully: {document.id}")
-                return True
-            else:
-                document.rejection_reason = result.get('error', 'Verification failed')
-                document.mark_as_processed(VerificationStatus.REJECTED)
-                
-                logger.warning(f"Document verification failed: {document.id} - {result.get('error')}")
-                return False
+            with transaction.atomic():
+                return self.apply_document_result(document, provider, result)
                 
         except Exception as e:
             logger.error(f"Error verifying document {document.id}: {str(e)}")
@@ -360,36 +437,81 @@ class KYCService:
             document.mark_as_processed(VerificationStatus.REJECTED)
             return False
     
+    def call_biometric_provider(self, biometric: BiometricVerification, provider: BaseKYCProvider) -> Dict:
+        """Fase externa da verificação biométrica (sem acesso ao banco)"""
+        try:
+            return provider.verify_biometric(biometric)
+        except Exception as e:
+            logger.error(f"Error calling provider for biometric {biometric.id}: {str(e)}")
+            return {
+                'success': False,
+                'error': f"System error: {str(e)}",
+                'status': VerificationStatus.REJECTED,
+            }
+    
+    def apply_biometric_result(self, biometric: BiometricVerification, provider: BaseKYCProvider, result: Dict) -> bool:
+        """Fase de escrita da verificação biométrica (transação curta)"""
+        VerificationLog.objects.create(
+            user=biometric.user,
+            provider=provider.provider,
+            verification_type="biometric",
+            request_data={'biometric_id': str(biometric.id)},
+            response_data=result.get('provider_response', {}),
+            success=result['success'],
+            error_message=result.get('error', ''),
+            confidence_score=result.get('liveness_score', 0.0),
+            response_time=result.get('response_time', 0.0),
+            cost=provider.provider.cost_per_verification
+        )
+        
+        if result['success']:
+            biometric.liveness_score = result.get('liveness_score', 0.0)
+            biometric.quality_score = result.get('quality_score', 0.0)
+            biometric.verification_provider = provider.provider.name
+            biometric.status = result['status']
+            biometric.provider_response = result.get('provider_response', {})
+            biometric.processed_at = timezone.now()
+            biometric.save()
+            
+            # Atualizar perfil KYC se aprovado
+            if result['status'] == VerificationStatus.APPROVED:
+                self._update_kyc_profile_from_biometric(biometric)
+            
+            logger.info(f"Biometric verified successfully: {biometric.id}")
+            return True
+        
+        biometric.status = VerificationStatus.REJECTED
+        biometric.processed_at = timezone.now()
+        biometric.save()
+        logger.warning(f"Biometric verification failed: {biometric.id}")
+        return False
+    
     def verify_biometric(self, user, selfie_file, liveness_video_file=None, device_info=None) -> BiometricVerification:
         """Verifica dados biométricos"""
         
-        # Upload dos arquivos
+        # Upload dos arquivos em streaming (vídeos nunca passam inteiros pela memória)
         selfie_name = f"kyc/{user.id}/biometric/selfie_{timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        selfie_path = default_storage.save(selfie_name, selfie_file)
-        selfie_url = default_storage.url(selfie_path)
+        selfie = kyc_media.store_stream(selfie_file, selfie_name)
         
-        liveness_video_url = ""
+        video = None
         if liveness_video_file:
             video_name = f"kyc/{user.id}/biometric/liveness_{timezone.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-            video_path = default_storage.save(video_name, liveness_video_file)
-            liveness_video_url = default_storage.url(video_path)
+            video = kyc_media.store_stream(liveness_video_file, video_name)
         
         # Criar registro biométrico
         biometric = BiometricVerification.objects.create(
             user=user,
-            selfie_url=selfie_url,
-            liveness_video_url=liveness_video_url,
+            selfie_url=selfie.url,
+            selfie_path=selfie.path,
+            liveness_video_url=video.url if video else "",
+            liveness_video_path=video.path if video else "",
             device_info=device_info or {},
             timestamp_capture=timezone.now(),
             status=VerificationStatus.PENDING
         )
         
         # Encontrar provedor que suporta biometria
-        provider = None
-        for p in self.providers.values():
-            if p.provider.supports_biometric:
-                provider = p
-                break
+        provider = self.get_biometric_provider()
         
         if not provider:
             logger.error("No biometric provider available")
@@ -402,40 +524,10 @@ class KYCService:
             biometric.status = VerificationStatus.PROCESSING
             biometric.save()
             
-            result = provider.verify_biometric(biometric)
+            result = self.call_biometric_provider(biometric, provider)
             
-            # Log da verificação
-            VerificationLog.objects.create(
-                user=user,
-                provider=provider.provider,
-                verification_type="biometric",
-                request_data={'biometric_id': str(biometric.id)},
-                response_data=result.get('provider_response', {}),
-                success=result['success'],
-                error_message=result.get('error', ''),
-                confidence_score=result.get('liveness_score', 0.0),
-                response_time=result.get('response_time', 0.0),
-                cost=provider.provider.cost_per_verification
-            )
-            
-            if result['success']:
-                biometric.liveness_score = result.get('liveness_score', 0.0)
-                biometric.quality_score = result.get('quality_score', 0.0)
-                biometric.verification_provider = provider.provider.name
-                biometric.status = result['status']
-                biometric.provider_response = result.get('provider_response', {})
-                biometric.processed_at = timezone.now()
-                biometric.save()
-                
-                # Atualizar perfil KYC se aprovado
-                if result['status'] == VerificationStatus.APPROVED:
-                    self._update_kyc_profile_from_biometric(biometric)
-                
-                logger.info(f"Biometric verified successfully: {biometric.id}")
-            else:
-                biometric.status = VerificationStatus.REJECTED
-                biometric.save()
-                logger.warning(f"Biometric verification failed: {biometric.id}")
+            with transaction.atomic():
+                self.apply_biometric_result(biometric, provider, result)
             
         except Exception as e:
             logger.error(f"Error verifying biometric {biometric.id}: {str(e)}")
@@ -0,0 +1,227 @@
+"""
+Ingestão idempotente de webhooks dos provedores KYC
+
+1. a view valida a assinatura e chama ingest(): o evento bruto é gravado em
+   KYCWebhookEvent com (provider, event_id) único; retries do provedor caem
+   no IntegrityError e são respondidos com 200 sem reprocessar
+2. a view responde 200 na hora; após o commit a partição do evento é agendada
+   na fila kyc_webhooks.<n>, onde n = crc32(referência do documento) % partições
+3. process_kyc_webhook_partition drena a partição em lotes: bursts do provedor
+   viram um único SELECT de eventos + um SELECT de documentos por provedor
+
+Cada fila kyc_webhooks.<n> deve ter um único consumidor (concurrency=1) para
+manter a ordem dos eventos de um mesmo documento.
+"""
+import hashlib
+import logging
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import KYCDocument, KYCWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+PARTITION_QUEUE = "kyc_webhooks.{partition}"
+
+# Campo de provider_response que guarda a referência do provedor
+REFERENCE_LOOKUPS = {
+    'idwall': 'provider_response__verification_id',
+    'stripe': 'provider_response__session_id',
+}
+
+
+def partition_count() -> int:
+    return getattr(settings, 'KYC_WEBHOOK_PARTITIONS', 8)
+
+
+def partition_for(reference: str) -> int:
+    """Partição estável por documento (crc32, igual em todos os processos)"""
+    return zlib.crc32(reference.encode('utf-8')) % partition_count()
+
+
+def partition_queue(partition: int) -> str:
+    return PARTITION_QUEUE.format(partition=partition)
+
+
+def extract_event(provider: str, payload: bytes, data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Identificação do evento: event_id, event_type e referência do documento.
+    Sem ID do provedor, o event_id é o sha256 do corpo (retries idênticos deduplicam).
+    """
+    if provider == 'stripe':
+        event_id = data.get('id')
+        event_type = data.get('type', '')
+        reference = data.get('data', {}).get('object', {}).get('id')
+    elif provider == 'idwall':
+        event_id = data.get('event_id') or data.get('id')
+        event_type = data.get('event_type', '')
+        reference = data.get('verification_id')
+    else:
+        event_id = data.get('event_id') or data.get('id')
+        event_type = data.get('event', '')
+        reference = data.get('verification_id') or data.get('id')
+
+    if not event_id:
+        event_id = f"sha256:{hashlib.sha256(payload).hexdigest()}"
+
+    return {
+        'event_id': str(event_id)[:255],
+        'event_type': str(event_type)[:100],
+        'reference': str(reference or event_id)[:255],
+    }
+
+
+def ingest(provider: str, payload: bytes, data: Dict[str, Any]) -> Tuple[KYCWebhookEvent, bool]:
+    """
+    Persiste o evento bruto e agenda sua partição após o commit.
+
+    Returns:
+        (evento, created); created=False para retries/duplicatas
+    """
+    info = extract_event(provider, payload, data)
+    partition = partition_for(info['reference'])
+
+    try:
+        with transaction.atomic():
+            event = KYCWebhookEvent.objects.create(
+                provider=provider,
+                partition=partition,
+                payload=data,
+                **info
+            )
+    except IntegrityError:
+        event = KYCWebhookEvent.objects.get(provider=provider, event_id=info['event_id'])
+        logger.info(f"Duplicate {provider} webhook {info['event_id']} ({event.status}), skipping")
+        return event, False
+
+    transaction.on_commit(lambda: schedule_partition(partition))
+    return event, True
+
+
+def schedule_partition(partition: int, countdown: Optional[float] = None):
+    """
+    Enfileira o dreno da partição. A janela padrão agrupa eventos de um burst;
+    execuções que encontram a partição vazia custam um SELECT indexado.
+    """
+    from ..tasks.kyc_tasks import process_kyc_webhook_partition
+
+    if countdown is None:
+        countdown = getattr(settings, 'KYC_WEBHOOK_BATCH_WINDOW_SECONDS', 1)
+    try:
+        process_kyc_webhook_partition.apply_async(
+            args=[partition],
+            queue=partition_queue(partition),
+            countdown=countdown,
+        )
+    except Exception as e:
+        # O evento já está persistido; o sweep periódico reagenda a partição
+        logger.error(f"Failed to schedule webhook partition {partition}: {e}")
+
+
+def load_documents(events: List[KYCWebhookEvent]) -> Dict[Tuple[str, str], KYCDocument]:
+    """Um SELECT por provedor para todas as referências do lote"""
+    references: Dict[str, set] = {}
+    for event in events:
+        if event.provider in REFERENCE_LOOKUPS:
+            references.setdefault(event.provider, set()).add(event.reference)
+
+    documents = {}
+    for provider, refs in references.items():
+        lookup = REFERENCE_LOOKUPS[provider]
+        queryset = KYCDocument.objects.select_related('user').filter(**{f"{lookup}__in": list(refs)})
+        key = lookup.split('__', 1)[1]
+        for document in queryset:
+            documents[(provider, str(document.provider_response.get(key)))] = document
+    return documents
+
+
+def process_batch(partition: int, handlers: Dict, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    Processa até batch_size eventos pendentes da partição, em ordem de chegada.
+
+    Cada evento roda num savepoint: uma falha incrementa attempts, agenda a
+    próxima tentativa com backoff (5min, 10min, 20min...) e adia junto os
+    eventos seguintes do mesmo documento no lote (preserva a ordem).
+
+    Args:
+        partition: Partição a drenar
+        handlers: {provider: callable(payload, document=None) -> dict}
+        batch_size: KYC_WEBHOOK_BATCH_SIZE por padrão
+
+    Returns:
+        Dict com fetched, processed, failed e deferred
+    """
+    batch_size = batch_size or getattr(settings, 'KYC_WEBHOOK_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'KYC_WEBHOOK_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    counts = {'fetched': 0, 'processed': 0, 'failed': 0, 'deferred': 0}
+
+    with transaction.atomic():
+        events = list(
+            KYCWebhookEvent.objects.select_for_update(skip_locked=True).filter(
+                partition=partition,
+                status=KYCWebhookEvent.STATUS_RECEIVED,
+                available_at__lte=now,
+            ).order_by('received_at')[:batch_size]
+        )
+        counts['fetched'] = len(events)
+        if not events:
+            return counts
+
+        documents = load_documents(events)
+        blocked = {}
+
+        for event in events:
+            key = (event.provider, event.reference)
+            if key in blocked:
+                # Fica atrás do evento que falhou, no mesmo backoff
+                event.available_at = blocked[key]
+                event.save(update_fields=['available_at'])
+                counts['deferred'] += 1
+                continue
+
+            handler = handlers.get(event.provider)
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown webhook provider: {event.provider}")
+                with transaction.atomic():
+                    handler(event.payload, document=documents.get(key))
+            except Exception as exc:
+                event.attempts += 1
+                event.error = str(exc)[:2000]
+                if event.attempts >= max_attempts:
+                    event.status = KYCWebhookEvent.STATUS_FAILED
+                    logger.error(f"{event.provider} webhook {event.event_id} failed permanently: {exc}")
+                else:
+                    event.available_at = now + timedelta(seconds=300 * (2 ** (event.attempts - 1)))
+                    blocked[key] = event.available_at
+                    logger.warning(
+                        f"{event.provider} webhook {event.event_id} failed "
+                        f"(attempt {event.attempts}), retry at {event.available_at}: {exc}"
+                    )
+                event.save(update_fields=['attempts', 'error', 'status', 'available_at'])
+                counts['failed'] += 1
+                continue
+
+            event.status = KYCWebhookEvent.STATUS_PROCESSED
+            event.processed_at = timezone.now()
+            event.save(update_fields=['status', 'processed_at'])
+            counts['processed'] += 1
+
+    return counts
+
+
+def pending_partitions() -> List[int]:
+    """Partições com eventos vencidos (agendamento perdido ou retry com backoff)"""
+    return sorted(set(
+        KYCWebhookEvent.objects.filter(
+            status=KYCWebhookEvent.STATUS_RECEIVED,
+            available_at__lte=timezone.now(),
+        ).values_list('partition', flat=True)
+    ))
+
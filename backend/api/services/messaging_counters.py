@@ -0,0 +1,188 @@
+"""
+Contadores de não lidas (conversas e notificações)
+
+* por conversa: ConversationReadState.unread_count, +1 por mensagem recebida
+  (UPDATE ... SET unread_count = unread_count + 1) e recalculado quando o
+  cursor de leitura avança (services/read_cursors.py)
+* total por usuário: chaves no Redis (unread:conversations:<id>,
+  unread:notifications:<id>), ajustadas após o commit e lidas em O(1)
+  pelos endpoints de badge
+
+Os ajustes só são aplicados se a chave já existir (script Lua); na falta
+dela o total é recalculado do banco e cacheado com TTL, o que também corrige
+qualquer divergência (Redis fora do ar, bulk_create sem signals) em até
+MESSAGING_UNREAD_CACHE_TTL segundos.
+"""
+import logging
+from typing import Callable, Dict, Iterable, Optional
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from ..models import ConversationReadState, SystemNotification
+
+logger = logging.getLogger(__name__)
+
+CONVERSATIONS_KEY = "unread:conversations:{user_id}"
+NOTIFICATIONS_KEY = "unread:notifications:{user_id}"
+
+# INCRBY apenas em chaves existentes; valor negativo invalida a chave
+_ADJUST_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('DEL', KEYS[1])
+    return nil
+end
+return value
+"""
+
+_redis: Optional[redis.Redis] = None
+_adjust_script = None
+
+
+def counters_client() -> redis.Redis:
+    """Singleton do cliente Redis dos contadores de mensageria"""
+    global _redis, _adjust_script
+    if _redis is None:
+        url = getattr(settings, 'MESSAGING_REDIS_URL', settings.CELERY_BROKER_URL)
+        _redis = redis.Redis.from_url(url)
+        _adjust_script = _redis.register_script(_ADJUST_IF_EXISTS)
+    return _redis
+
+
+def _cache_ttl() -> int:
+    return getattr(settings, 'MESSAGING_UNREAD_CACHE_TTL', 3600)
+
+
+def _adjust(key_template: str, deltas: Dict) -> None:
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    try:
+        pipe = counters_client().pipeline(transaction=False)
+        for user_id, delta in deltas.items():
+            _adjust_script(keys=[key_template.format(user_id=user_id)], args=[delta], client=pipe)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to adjust unread counters: {e}")
+
+
+def _adjust_on_commit(key_template: str, deltas: Dict) -> None:
+    transaction.on_commit(lambda: _adjust(key_template, deltas))
+
+
+def _invalidate(key_template: str, user_ids: Iterable) -> None:
+    keys = [key_template.format(user_id=user_id) for user_id in user_ids]
+    if not keys:
+        return
+    try:
+        counters_client().delete(*keys)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to invalidate unread counters: {e}")
+
+
+def _cached_total(key: str, compute: Callable[[], int]) -> int:
+    try:
+        cached = counters_client().get(key)
+        if cached is not None:
+            return max(int(cached), 0)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read unread counter {key}: {e}")
+        return compute()
+
+    value = compute()
+    try:
+        counters_client().set(key, value, ex=_cache_ttl(), nx=True)
+    except redis.RedisError:
+        pass
+    return value
+
+
+# ===== Conversas =====
+
+def message_created(message) -> None:
+    """
+    +1 não lida para cada participante além do remetente.
+    Conversas anteriores aos contadores ganham o estado na primeira mensagem.
+    """
+    conversation_id = message.conversation_id
+    recipients = set(
+        message.conversation.participants.exclude(id=message.sender_id).values_list('id', flat=True)
+    )
+    if not recipients:
+        return
+
+    updated = ConversationReadState.objects.filter(
+        conversation_id=conversation_id, user_id__in=recipients
+    ).update(unread_count=F('unread_count') + 1)
+
+    if updated < len(recipients):
+        existing = set(ConversationReadState.objects.filter(
+            conversation_id=conversation_id, user_id__in=recipients
+        ).values_list('user_id', flat=True))
+        ConversationReadState.objects.bulk_create(
+            [
+                ConversationReadState(conversation_id=conversation_id, user_id=user_id, unread_count=1)
+                for user_id in recipients - existing
+            ],
+            ignore_conflicts=True
+        )
+
+    _adjust_on_commit(CONVERSATIONS_KEY, {user_id: 1 for user_id in recipients})
+
+
+def conversation_read(user_id) -> None:
+    """
+    O cursor avançou (services/read_cursors.py): invalida o total do usuário.
+    O UPSERT do cursor não devolve o contador anterior, então o total é
+    recalculado na próxima leitura do badge em vez de decrementado.
+    """
+    transaction.on_commit(lambda: _invalidate(CONVERSATIONS_KEY, [user_id]))
+
+
+def participants_removed(conversation_id, user_ids: Iterable) -> None:
+    """Remove os estados de quem saiu da conversa e invalida seus totais"""
+    user_ids = list(user_ids)
+    ConversationReadState.objects.filter(conversation_id=conversation_id, user_id__in=user_ids).delete()
+    transaction.on_commit(lambda: _invalidate(CONVERSATIONS_KEY, user_ids))
+
+
+def conversation_unread_total(user) -> int:
+    """Total de mensagens não lidas do usuário (badge)"""
+    return _cached_total(
+        CONVERSATIONS_KEY.format(user_id=user.id),
+        lambda: ConversationReadState.objects.filter(user=user).aggregate(
+            total=Sum('unread_count')
+        )['total'] or 0
+    )
+
+
+# ===== Notificações =====
+
+def notifications_created(user_ids: Iterable) -> None:
+    """+1 por notificação criada (aceita ids repetidos)"""
+    deltas: Dict = {}
+    for user_id in user_ids:
+        deltas[user_id] = deltas.get(user_id, 0) + 1
+    _adjust_on_commit(NOTIFICATIONS_KEY, deltas)
+
+
+def notifications_read(user_id, count: int = 1) -> None:
+    _adjust_on_commit(NOTIFICATIONS_KEY, {user_id: -count})
+
+
+def all_notifications_read(user_id) -> None:
+    transaction.on_commit(lambda: _invalidate(NOTIFICATIONS_KEY, [user_id]))
+
+
+def notification_unread_total(user) -> int:
+    """Total de notificações não lidas do usuário (badge)"""
+    return _cached_total(
+        NOTIFICATIONS_KEY.format(user_id=user.id),
+        lambda: SystemNotification.objects.filter(user=user, read=False).count()
+    )
@@ -0,0 +1,206 @@
+"""
+Resumos de notificações por email (diário e semanal)
+
+* uma consulta por shard: notificações não lidas da janela, de usuários com
+  email_frequency igual à do resumo, ordenadas por usuário e lidas em
+  streaming (iterator); o resumo de cada usuário é montado incrementalmente
+  e emitido quando o user_id muda
+* templates (emails/digest.{html,txt}) compilados uma vez por processo
+* emails enviados em lotes por uma única conexão SMTP por shard
+* shards por user_id % NOTIFICATION_DIGEST_SHARDS, cada um numa subtask
+* checkpoint (MaintenanceCheckpoint 'digest:<frequência>:<janela>:<shard>')
+  com o último user_id enviado, gravado após cada lote: uma subtask que
+  estoura o orçamento de tempo retoma sem reenviar nem pular usuários
+* orçamento (MAINTENANCE_TIME_BUDGET_SECONDS) abaixo do soft_time_limit da
+  subtask; se um lote lento passar do soft limit, SoftTimeLimitExceeded é
+  tratado como orçamento esgotado e o shard retoma do último lote enviado
+"""
+import functools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models.functions import Mod
+from django.template.loader import get_template
+from django.utils import timezone
+
+from ..models import MaintenanceCheckpoint, SystemNotification
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+}
+SUBJECTS = {
+    'daily': "GalaxIA - Resumo diário ({count} notificações)",
+    'weekly': "GalaxIA - Resumo semanal ({count} notificações)",
+}
+# Um template para as duas frequências; o texto varia por `frequency`
+TEMPLATES = ('emails/digest.html', 'emails/digest.txt')
+CHECKPOINT_PREFIX = "digest:"
+DONE = '*'
+
+TYPE_LABELS = dict(SystemNotification.NOTIFICATION_TYPE_CHOICES)
+
+NOTIFICATION_FIELDS = (
+    'id', 'user_id', 'notification_type', 'title', 'message', 'priority',
+    'action_url', 'created_at',
+    'user__email', 'user__username', 'user__first_name', 'user__last_name',
+)
+
+
+def shard_count() -> int:
+    return getattr(settings, 'NOTIFICATION_DIGEST_SHARDS', 8)
+
+
+def window(frequency: str, now: Optional[datetime] = None) -> Dict:
+    """Janela do resumo, terminando na hora cheia da execução"""
+    end = (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    return {'start': end - PERIODS[frequency], 'end': end}
+
+
+def checkpoint_name(frequency: str, window_end: datetime, shard: int) -> str:
+    return f"{CHECKPOINT_PREFIX}{frequency}:{window_end:%Y%m%d%H}:{shard}"
+
+
+@functools.lru_cache(maxsize=None)
+def _template(name: str):
+    return get_template(name)
+
+
+def stream_digests(frequency: str, start: datetime, end: datetime, shard: int,
+                   after_user_id: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Um resumo por usuário do shard, em ordem de user_id, a partir de uma
+    única consulta em streaming
+    """
+    max_items = getattr(settings, 'NOTIFICATION_DIGEST_MAX_ITEMS', 50)
+    queryset = SystemNotification.objects.filter(
+        read=False,
+        created_at__gte=start,
+        created_at__lt=end,
+        user__notification_preferences__email_frequency=frequency,
+    ).exclude(user__email='').annotate(
+        shard=Mod('user_id', shard_count())
+    ).filter(shard=shard)
+    if after_user_id is not None:
+        queryset = queryset.filter(user_id__gt=after_user_id)
+
+    rows = queryset.order_by('user_id', '-created_at').values(*NOTIFICATION_FIELDS)
+
+    digest = None
+    for row in rows.iterator(chunk_size=2000):
+        if digest is None or row['user_id'] != digest['user']['id']:
+            if digest:
+                yield digest
+            digest = {
+                'user': {
+                    'id': row['user_id'],
+                    'email': row['user__email'],
+                    'username': row['user__username'],
+                    'first_name': row['user__first_name'],
+                    'last_name': row['user__last_name'],
+                },
+                'notifications_by_type': {},
+                'total_count': 0,
+            }
+        digest['total_count'] += 1
+        if digest['total_count'] <= max_items:
+            label = TYPE_LABELS.get(row['notification_type'], row['notification_type'])
+            digest['notifications_by_type'].setdefault(label, []).append({
+                'id': row['id'],
+                'title': row['title'],
+                'message': row['message'],
+                'priority': row['priority'],
+                'action_url': row['action_url'],
+                'created_at': row['created_at'],
+            })
+    if digest:
+        yield digest
+
+
+def build_email(frequency: str, digest: Dict) -> EmailMultiAlternatives:
+    html_name, text_name = TEMPLATES
+    context = {
+        **digest,
+        'frequency': frequency,
+        'site_url': getattr(settings, 'FRONTEND_URL', 'http://localhost:3000'),
+    }
+    email = EmailMultiAlternatives(
+        subject=SUBJECTS[frequency].format(count=digest['total_count']),
+        body=_template(text_name).render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[digest['user']['email']],
+    )
+    email.attach_alternative(_template(html_name).render(context), 'text/html')
+    return email
+
+
+def send_shard(frequency: str, window_end: datetime, shard: int,
+               time_budget: Optional[float] = None) -> Dict:
+    """
+    Envia os resumos de um shard, retomando do checkpoint
+
+    Returns:
+        Dict com sent, completed e last_user_id
+    """
+    batch_size = getattr(settings, 'NOTIFICATION_DIGEST_BATCH_SIZE', 100)
+    time_budget = time_budget or getattr(settings, 'MAINTENANCE_TIME_BUDGET_SECONDS', 240)
+    deadline = time.monotonic() + time_budget
+
+    name = checkpoint_name(frequency, window_end, shard)
+    checkpoint, _ = MaintenanceCheckpoint.objects.get_or_create(name=name)
+    if checkpoint.last_pk == DONE:
+        return {'sent': 0, 'completed': True, 'last_user_id': None}
+    after = int(checkpoint.last_pk) if checkpoint.last_pk else None
+
+    sent = 0
+    batch: List[EmailMultiAlternatives] = []
+    last_user_id = after
+    checkpointed = after
+
+    def flush(connection):
+        nonlocal sent, checkpointed
+        if not batch:
+            return
+        connection.send_messages(batch)
+        sent += len(batch)
+        MaintenanceCheckpoint.objects.filter(name=name).update(
+            last_pk=str(last_user_id), processed=checkpoint.processed + sent
+        )
+        checkpointed = last_user_id
+        batch.clear()
+
+    try:
+        with get_connection(fail_silently=False) as connection:
+            digests = stream_digests(frequency, window_end - PERIODS[frequency], window_end, shard, after)
+            for digest in digests:
+                batch.append(build_email(frequency, digest))
+                last_user_id = digest['user']['id']
+                if len(batch) >= batch_size:
+                    flush(connection)
+                    if time.monotonic() >= deadline:
+                        logger.warning(f"Digest {name}: time budget exhausted, checkpoint at user {checkpointed}")
+                        return {'sent': sent, 'completed': False, 'last_user_id': checkpointed}
+            flush(connection)
+    except SoftTimeLimitExceeded:
+        # O lote interrompido não foi gravado no checkpoint: é reenviado na retomada
+        logger.warning(f"Digest {name}: soft time limit reached, checkpoint at user {checkpointed}")
+        return {'sent': sent, 'completed': False, 'last_user_id': checkpointed}
+
+    MaintenanceCheckpoint.objects.filter(name=name).update(last_pk=DONE)
+    logger.info(f"Digest {name}: completed ({sent} emails)")
+    return {'sent': sent, 'completed': True, 'last_user_id': last_user_id}
+
+
+def prune_checkpoints(days: int = 30) -> int:
+    """Remove checkpoints de resumos antigos (os concluídos ficam para barrar reenvios)"""
+    return MaintenanceCheckpoint.objects.filter(
+        name__startswith=CHECKPOINT_PREFIX,
+        started_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()[0]
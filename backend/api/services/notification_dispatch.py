@@ -0,0 +1,421 @@
+"""
+Despacho de notificações por canal, em lotes
+
+Antes: create_notification -> process_notification -> até 3 tasks send_*,
+cada uma relendo a notificação e as preferências (4 hops no broker e 4
+leituras por notificação). Agora:
+
+1. dispatch(): resolve os canais uma única vez, com as preferências
+   cacheadas no Redis (notification:prefs:<user_id>, invalidadas no
+   post_save de NotificationPreferences), e empilha o id da notificação na
+   lista pendente de cada canal (notifications:pending:<canal>)
+2. deliver_notification_channel(canal) drena a lista em lotes: um SELECT
+   por lote e um envio por lote — uma conexão SMTP reaproveitada para todo
+   o lote de emails, um group_send em massa para push, uma chamada de lote
+   para SMS (NOTIFICATION_SMS_SENDER) — e um UPDATE dos flags sent_*
+3. os ids retirados da fila ficam em notifications:processing:<canal> (ZSET
+   com prazo) até o lote ser entregue; se o worker morrer no meio, o sweep
+   devolve os vencidos para a fila em vez de perdê-los
+
+Controle de vazão por canal:
+
+* rate limit: NOTIFICATION_CHANNEL_RATE_LIMITS envios/segundo, contados numa
+  janela de 1s no Redis e compartilhados por todos os workers
+* backpressure: acima de NOTIFICATION_CHANNEL_BACKLOG_LIMITS itens pendentes,
+  entregas de prioridade low/medium são descartadas no canal (a notificação
+  continua no app e entra no resumo por email); high/urgent sempre entram
+"""
+import json
+import logging
+import time
+from typing import Dict, Iterable, List
+
+import redis
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+from ..models import NotificationPreferences, SystemNotification
+from .messaging_counters import counters_client
+from .notification_fanout import group_send_many, notification_event, preference_field
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ('email', 'push', 'sms')
+SENT_FLAGS = {'email': 'sent_email', 'push': 'sent_push', 'sms': 'sent_sms'}
+
+PREFERENCES_KEY = "notification:prefs:{user_id}"
+PENDING_KEY = "notifications:pending:{channel}"
+PROCESSING_KEY = "notifications:processing:{channel}"
+ATTEMPTS_KEY = "notifications:attempts:{channel}"
+DRAIN_FLAG_KEY = "notifications:drain:{channel}"
+RATE_KEY = "notifications:rate:{channel}:{second}"
+
+PRIORITY_BYPASS_BACKPRESSURE = frozenset({'high', 'urgent'})
+PAYMENT_TYPES = frozenset({'payment_received', 'payment_sent'})
+
+PREFERENCE_FIELDS = [
+    field.name for field in NotificationPreferences._meta.get_fields()
+    if field.name.endswith(('_email', '_push', '_sms'))
+]
+DEFAULT_PREFERENCES = {
+    name: NotificationPreferences._meta.get_field(name).default for name in PREFERENCE_FIELDS
+}
+
+# Reserva até ARGV[1] envios na janela de 1s com limite ARGV[2]; devolve quantos couberam
+_ACQUIRE = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(tonumber(ARGV[1]), tonumber(ARGV[2]) - used)
+if granted <= 0 then
+    return 0
+end
+redis.call('INCRBY', KEYS[1], granted)
+redis.call('EXPIRE', KEYS[1], 2)
+return granted
+"""
+
+# Move até ARGV[1] ids da fila (KEYS[1]) para o ZSET em processamento (KEYS[2]) com prazo ARGV[2]
+_CLAIM = """
+local ids = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids > 0 then
+    redis.call('LTRIM', KEYS[1], #ids, -1)
+    for _, id in ipairs(ids) do
+        redis.call('ZADD', KEYS[2], ARGV[2], id)
+    end
+end
+return ids
+"""
+
+# Devolve à fila (KEYS[2]) os ids com prazo vencido em KEYS[1], contando a tentativa em
+# KEYS[3]; descarta quem chegou a ARGV[2] tentativas. Retorna {devolvidos, descartados}
+_RECOVER = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local requeued, dropped = 0, 0
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    if redis.call('HINCRBY', KEYS[3], id, 1) < tonumber(ARGV[2]) then
+        redis.call('RPUSH', KEYS[2], id)
+        requeued = requeued + 1
+    else
+        redis.call('HDEL', KEYS[3], id)
+        dropped = dropped + 1
+    end
+end
+return {requeued, dropped}
+"""
+
+
+def _setting(name: str, channel: str, default):
+    return getattr(settings, name, {}).get(channel, default)
+
+
+# ===== Preferências =====
+
+def cached_preferences(user_ids: Iterable) -> Dict[str, Dict]:
+    """
+    Preferências por usuário ({str(user_id): {campo: bool}}), um MGET no Redis
+    e um SELECT só para os ausentes; usuários sem registro usam os padrões do modelo
+    """
+    user_ids = [str(user_id) for user_id in set(user_ids)]
+    if not user_ids:
+        return {}
+    keys = [PREFERENCES_KEY.format(user_id=user_id) for user_id in user_ids]
+
+    prefs: Dict[str, Dict] = {}
+    try:
+        for user_id, raw in zip(user_ids, counters_client().mget(keys)):
+            if raw is not None:
+                prefs[user_id] = json.loads(raw)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read cached notification preferences: {e}")
+
+    missing = [user_id for user_id in user_ids if user_id not in prefs]
+    if missing:
+        loaded = {
+            str(row['user_id']): {name: row[name] for name in PREFERENCE_FIELDS}
+            for row in NotificationPreferences.objects.filter(
+                user_id__in=missing
+            ).values('user_id', *PREFERENCE_FIELDS)
+        }
+        ttl = getattr(settings, 'NOTIFICATION_PREFERENCES_CACHE_TTL', 300)
+        try:
+            pipe = counters_client().pipeline(transaction=False)
+            for user_id in missing:
+                prefs[user_id] = loaded.get(user_id, DEFAULT_PREFERENCES)
+                pipe.set(PREFERENCES_KEY.format(user_id=user_id), json.dumps(prefs[user_id]), ex=ttl)
+            pipe.execute()
+        except redis.RedisError:
+            for user_id in missing:
+                prefs.setdefault(user_id, loaded.get(user_id, DEFAULT_PREFERENCES))
+    return prefs
+
+
+def invalidate_preferences(user_id) -> None:
+    def delete():
+        try:
+            counters_client().delete(PREFERENCES_KEY.format(user_id=user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate notification preferences of {user_id}: {e}")
+
+    transaction.on_commit(delete)
+
+
+def resolve_channels(notification: SystemNotification, prefs: Dict) -> List[str]:
+    """Canais de entrega de uma notificação (mesmas regras do antigo process_notification)"""
+    notification_type = notification.notification_type
+    channels = []
+    for channel in ('email', 'push'):
+        field = preference_field(notification_type, channel)
+        if field and prefs.get(field, DEFAULT_PREFERENCES.get(field)):
+            channels.append(channel)
+    # SMS apenas para notificações urgentes ou de pagamento
+    if notification.priority == 'urgent' or (
+        notification_type in PAYMENT_TYPES and prefs.get('payments_sms', True)
+    ):
+        channels.append('sms')
+    return channels
+
+
+# ===== Enfileiramento =====
+
+def dispatch(notifications: List[SystemNotification]) -> Dict[str, int]:
+    """
+    Resolve os canais e empilha as entregas pendentes
+
+    Returns:
+        {canal: quantidade enfileirada} (+ 'shed' para descartes por backpressure)
+    """
+    prefs = cached_preferences(n.user_id for n in notifications)
+    by_channel: Dict[str, List[SystemNotification]] = {channel: [] for channel in CHANNELS}
+    for notification in notifications:
+        for channel in resolve_channels(notification, prefs.get(str(notification.user_id), DEFAULT_PREFERENCES)):
+            by_channel[channel].append(notification)
+
+    client = counters_client()
+    counts = {'shed': 0}
+    for channel, items in by_channel.items():
+        if not items:
+            continue
+        key = PENDING_KEY.format(channel=channel)
+        backlog_limit = _setting('NOTIFICATION_CHANNEL_BACKLOG_LIMITS', channel, 10000)
+        if client.llen(key) + len(items) > backlog_limit:
+            kept = [n for n in items if n.priority in PRIORITY_BYPASS_BACKPRESSURE]
+            shed = len(items) - len(kept)
+            if shed:
+                counts['shed'] += shed
+                logger.warning(f"Notification backlog for {channel} above {backlog_limit}, shedding {shed} deliveries")
+            items = kept
+            if not items:
+                continue
+        client.rpush(key, *[str(n.id) for n in items])
+        counts[channel] = len(items)
+        schedule_drain(channel)
+    return counts
+
+
+def dispatch_on_commit(notifications: List[SystemNotification]) -> None:
+    def run():
+        try:
+            dispatch(notifications)
+        except redis.RedisError as e:
+            # A notificação continua no app; só as entregas externas se perdem
+            logger.error(f"Failed to dispatch {len(notifications)} notifications: {e}")
+
+    transaction.on_commit(run)
+
+
+def schedule_drain(channel: str, countdown: float = None) -> None:
+    """Agenda o dreno do canal se ainda não houver um agendado (flag com TTL)"""
+    from ..tasks_messaging import deliver_notification_channel
+
+    if countdown is None:
+        countdown = getattr(settings, 'NOTIFICATION_DISPATCH_WINDOW_SECONDS', 1)
+    if counters_client().set(DRAIN_FLAG_KEY.format(channel=channel), 1, nx=True, ex=int(countdown) + 60):
+        deliver_notification_channel.apply_async(args=[channel], countdown=countdown)
+
+
+def release_drain(channel: str) -> None:
+    """Chamado no início do dreno: novas entregas voltam a poder agendar outro"""
+    counters_client().delete(DRAIN_FLAG_KEY.format(channel=channel))
+
+
+def backlog(channel: str) -> int:
+    return counters_client().llen(PENDING_KEY.format(channel=channel))
+
+
+# ===== Entrega =====
+
+def acquire(channel: str, wanted: int) -> int:
+    """Reserva até wanted envios no limite por segundo do canal"""
+    limit = _setting('NOTIFICATION_CHANNEL_RATE_LIMITS', channel, 100)
+    key = RATE_KEY.format(channel=channel, second=int(time.time()))
+    return int(counters_client().eval(_ACQUIRE, 1, key, wanted, limit))
+
+
+def _pop(channel: str, count: int) -> List[str]:
+    """Retira até count ids da fila, movendo-os para processing (confirmar com _ack)"""
+    timeout = getattr(settings, 'NOTIFICATION_DISPATCH_PROCESSING_TIMEOUT', 300)
+    ids = counters_client().eval(
+        _CLAIM, 2,
+        PENDING_KEY.format(channel=channel), PROCESSING_KEY.format(channel=channel),
+        count, time.time() + timeout
+    )
+    return [i.decode() if isinstance(i, bytes) else i for i in ids]
+
+
+def _ack(channel: str, ids: List[str]) -> None:
+    """Lote entregue: sai de processing e zera as tentativas"""
+    if not ids:
+        return
+    pipe = counters_client().pipeline(transaction=False)
+    pipe.zrem(PROCESSING_KEY.format(channel=channel), *ids)
+    pipe.hdel(ATTEMPTS_KEY.format(channel=channel), *ids)
+    pipe.execute()
+
+
+def recover_stalled(channel: str) -> Dict[str, int]:
+    """Devolve à fila lotes de workers que morreram antes do _ack (prazo vencido)"""
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_DELIVERY_ATTEMPTS', 3)
+    requeued, dropped = counters_client().eval(
+        _RECOVER, 3,
+        PROCESSING_KEY.format(channel=channel), PENDING_KEY.format(channel=channel),
+        ATTEMPTS_KEY.format(channel=channel),
+        time.time(), max_attempts
+    )
+    if requeued or dropped:
+        logger.warning(f"Recovered {requeued} stalled {channel} deliveries ({dropped} dropped)")
+    return {'requeued': int(requeued), 'dropped': int(dropped)}
+
+
+def _requeue(channel: str, ids: List[str]) -> int:
+    """Devolve ids ao fim da fila; descarta quem passou de NOTIFICATION_MAX_DELIVERY_ATTEMPTS"""
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_DELIVERY_ATTEMPTS', 3)
+    client = counters_client()
+    attempts_key = ATTEMPTS_KEY.format(channel=channel)
+    pipe = client.pipeline(transaction=False)
+    for notification_id in ids:
+        pipe.hincrby(attempts_key, notification_id, 1)
+    attempts = pipe.execute()
+
+    retry = [i for i, n in zip(ids, attempts) if n < max_attempts]
+    dropped = [i for i, n in zip(ids, attempts) if n >= max_attempts]
+    if dropped:
+        logger.error(f"Dropping {len(dropped)} {channel} deliveries after {max_attempts} attempts")
+    # Volta para a fila e sai de processing na mesma transação
+    pipe = client.pipeline(transaction=True)
+    if dropped:
+        pipe.hdel(attempts_key, *dropped)
+    if retry:
+        pipe.rpush(PENDING_KEY.format(channel=channel), *retry)
+    pipe.zrem(PROCESSING_KEY.format(channel=channel), *ids)
+    pipe.execute()
+    return len(dropped)
+
+
+def send_email_batch(notifications: List[SystemNotification]) -> List:
+    """Renderiza e envia o lote por uma única conexão SMTP; devolve os ids enviados"""
+    site_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+    messages, ids = [], []
+    for notification in notifications:
+        user = notification.user
+        if not user.email:
+            continue
+        context = {'user': user, 'notification': notification, 'site_url': site_url}
+        email = EmailMultiAlternatives(
+            subject=f"GalaxIA - {notification.title}",
+            body=render_to_string('emails/notification.txt', context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+        )
+        email.attach_alternative(render_to_string('emails/notification.html', context), 'text/html')
+        messages.append(email)
+        ids.append(notification.id)
+
+    if messages:
+        with get_connection(fail_silently=False) as connection:
+            connection.send_messages(messages)
+    return ids
+
+
+def send_push_batch(notifications: List[SystemNotification]) -> List:
+    """Todos os notification_broadcast do lote numa única entrada no channel layer"""
+    group_send_many([
+        (f'notifications_{notification.user_id}', notification_event(notification))
+        for notification in notifications
+    ])
+    return [notification.id for notification in notifications]
+
+
+def send_sms_batch(notifications: List[SystemNotification]) -> List:
+    """
+    Lote de SMS pelo provedor de NOTIFICATION_SMS_SENDER: caminho de uma função
+    que recebe [{'id', 'to', 'body'}] e devolve os ids aceitos, numa chamada
+    por lote. Sem provedor configurado nada é enviado (sent_sms fica False).
+    """
+    batch = [
+        {'id': notification.id, 'to': notification.user.phone,
+         'body': f"{notification.title}: {notification.message}"}
+        for notification in notifications if getattr(notification.user, 'phone', '')
+    ]
+    if not batch:
+        return []
+    sender_path = getattr(settings, 'NOTIFICATION_SMS_SENDER', None)
+    if not sender_path:
+        logger.warning(f"SMS batch with {len(batch)} messages not sent: NOTIFICATION_SMS_SENDER not configured")
+        return []
+    return list(import_string(sender_path)(batch))
+
+
+SENDERS = {
+    'email': send_email_batch,
+    'push': send_push_batch,
+    'sms': send_sms_batch,
+}
+
+
+def deliver(channel: str, notifications: List[SystemNotification]) -> List:
+    """Envia um lote já carregado e marca sent_<canal> num único UPDATE"""
+    sent_ids = SENDERS[channel](notifications)
+    if sent_ids:
+        SystemNotification.objects.filter(id__in=sent_ids).update(**{SENT_FLAGS[channel]: True})
+    return sent_ids
+
+
+def drain(channel: str) -> Dict[str, int]:
+    """
+    Drena a fila do canal respeitando o rate limit e o orçamento de tempo
+
+    Returns:
+        Dict com sent, skipped, failed, dropped e remaining
+    """
+    batch_size = _setting('NOTIFICATION_DISPATCH_BATCH_SIZES', channel, 100)
+    budget = getattr(settings, 'NOTIFICATION_DISPATCH_TIME_BUDGET_SECONDS', 50)
+    deadline = time.monotonic() + budget
+    counts = {'sent': 0, 'skipped': 0, 'failed': 0, 'dropped': 0}
+
+    while time.monotonic() < deadline:
+        granted = acquire(channel, batch_size)
+        if not granted:
+            # Limite do segundo atingido: espera a próxima janela
+            time.sleep(max(1 - (time.time() % 1), 0.05))
+            continue
+        ids = _pop(channel, granted)
+        if not ids:
+            break
+
+        notifications = list(SystemNotification.objects.select_related('user').filter(id__in=ids))
+        try:
+            sent = deliver(channel, notifications)
+        except Exception as e:
+            logger.warning(f"{channel} batch of {len(ids)} failed, requeueing: {e}")
+            counts['failed'] += len(ids)
+            counts['dropped'] += _requeue(channel, ids)
+            break
+        _ack(channel, ids)
+        counts['sent'] += len(sent)
+        counts['skipped'] += len(ids) - len(sent)
+
+    counts['remaining'] = backlog(channel)
+    return counts
@@ -0,0 +1,184 @@
+"""
+Fan-out de notificações em lote (fora do request)
+
+Uma mensagem numa conversa em grupo (ou um aviso do sistema para muitos
+usuários) vira, num worker:
+
+1. um SELECT das preferências de todos os destinatários
+2. um bulk_create das SystemNotification (o bulk_create não dispara
+   post_save, então os contadores de não lidas são ajustados aqui)
+3. um único async_to_sync com todos os group_send em paralelo, em vez de
+   uma ida ao Redis por destinatário
+
+Retries da task não duplicam notificações: destinatários que já têm a
+notificação da mensagem são ignorados.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from ..models import MessageConversation, NotificationPreferences, SystemNotification
+from . import conversation_access, messaging_counters, ws_delivery
+
+logger = logging.getLogger(__name__)
+
+# Prefixo dos campos de NotificationPreferences por tipo de notificação
+PREFERENCE_PREFIXES = {
+    'message': 'messages',
+    'payment_received': 'payments',
+    'payment_sent': 'payments',
+    'project_update': 'project_updates',
+    'proposal_received': 'proposals',
+    'proposal_accepted': 'proposals',
+    'proposal_rejected': 'proposals',
+    'system': 'system',
+}
+
+
+def preference_field(notification_type: str, channel: str) -> Optional[str]:
+    """Ex.: ('message', 'push') -> 'messages_push'; None se o tipo não tem preferência"""
+    prefix = PREFERENCE_PREFIXES.get(notification_type)
+    return f"{prefix}_{channel}" if prefix else None
+
+
+def enabled_recipients(user_ids: Iterable, notification_type: str, channel: str = 'push') -> List:
+    """
+    Filtra os destinatários pelas preferências, num único SELECT.
+    Sem preferências cadastradas vale o padrão do modelo (habilitado).
+    """
+    user_ids = list(user_ids)
+    field = preference_field(notification_type, channel)
+    if not field or not user_ids:
+        return user_ids
+    disabled = {
+        str(user_id) for user_id in NotificationPreferences.objects.filter(
+            user_id__in=user_ids, **{field: False}
+        ).values_list('user_id', flat=True)
+    }
+    return [user_id for user_id in user_ids if str(user_id) not in disabled]
+
+
+def notification_event(notification: SystemNotification) -> Dict:
+    """
+    Evento notification_broadcast do grupo notifications_<user_id>, com o
+    frame já serializado (todas as abas do usuário repassam o mesmo payload)
+    """
+    return ws_delivery.group_event('notification_broadcast', 'notification', {
+        'id': str(notification.id),
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'priority': notification.priority,
+        'created_at': notification.created_at.isoformat(),
+        'action_url': notification.action_url,
+        'data': notification.data
+    })
+
+
+def group_send_many(events: List[Tuple[str, Dict]]) -> int:
+    """
+    Publica vários eventos numa única entrada no event loop; os group_send
+    rodam concorrentemente sobre o pool de conexões do channel layer.
+
+    Returns:
+        Quantidade de eventos publicados com sucesso
+    """
+    if not events:
+        return 0
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        return await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in events),
+            return_exceptions=True
+        )
+
+    results = async_to_sync(send_all)()
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning(f"{len(failures)}/{len(events)} notification broadcasts failed: {failures[0]}")
+    return len(events) - len(failures)
+
+
+def fan_out(user_ids: Iterable, notification_type: str, title: str, message: str,
+            **fields) -> List[SystemNotification]:
+    """
+    Cria a mesma notificação para vários usuários e publica via WebSocket
+
+    Args:
+        user_ids: Destinatários (já filtrados pelas preferências, se for o caso)
+        notification_type, title, message: Conteúdo da notificação
+        **fields: Demais campos de SystemNotification (priority, data, related_*)
+
+    Returns:
+        Notificações criadas
+    """
+    notifications = [
+        SystemNotification(
+            user_id=user_id,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            **fields
+        )
+        for user_id in user_ids
+    ]
+    if not notifications:
+        return []
+
+    with transaction.atomic():
+        SystemNotification.objects.bulk_create(notifications)
+        messaging_counters.notifications_created([n.user_id for n in notifications])
+
+    group_send_many([
+        (f'notifications_{notification.user_id}', notification_event(notification))
+        for notification in notifications
+    ])
+    return notifications
+
+
+def fan_out_message(message_id) -> Dict:
+    """
+    Notificações de uma nova mensagem para os demais participantes
+
+    Returns:
+        Dict com recipients, created e skipped
+    """
+    message = MessageConversation.objects.select_related('sender').get(id=message_id)
+    sender = message.sender
+
+    participants = conversation_access.participant_ids(message.conversation_id) - {str(sender.id)}
+    recipients = enabled_recipients(participants, 'message', 'push')
+
+    # Retry da task: não recria para quem já foi notificado
+    already_notified = {
+        str(user_id) for user_id in SystemNotification.objects.filter(
+            related_message=message, user_id__in=recipients
+        ).values_list('user_id', flat=True)
+    }
+    recipients = [user_id for user_id in recipients if str(user_id) not in already_notified]
+
+    content = message.content
+    created = fan_out(
+        recipients,
+        'message',
+        f'Nova mensagem de {sender.get_full_name()}',
+        content[:100] + "..." if len(content) > 100 else content,
+        priority='medium',
+        related_conversation_id=message.conversation_id,
+        related_message=message,
+        data={
+            'conversation_id': str(message.conversation_id),
+            'sender_id': str(sender.id)
+        }
+    )
+
+    return {
+        'recipients': len(participants),
+        'created': len(created),
+        'skipped': len(participants) - len(created),
+    }
@@ -0,0 +1,167 @@
+"""
+Presença de usuários com TTL no Redis (usado pelos consumers, async)
+
+* presence:conn:<user_id>: ZSET das conexões abertas do usuário (channel
+  name -> expiração). Cada conexão renova sua entrada a cada
+  MESSAGING_PRESENCE_HEARTBEAT_SECONDS; conexões de processos que morreram
+  expiram sozinhas após MESSAGING_PRESENCE_TTL
+* presence:announced:<user_id>: último estado anunciado ('online'/'offline').
+  Só transições são publicadas: a segunda aba não anuncia 'online' de novo e
+  uma reconexão dentro do período de carência não anuncia 'offline'
+* os anúncios vão para o grupo presence_<user_id>, assinado pelas conexões
+  que exibem esse usuário; quem conecta recebe um snapshot em vez de
+  depender do histórico de eventos
+
+As transições rodam em scripts Lua, atômicos entre conexões concorrentes.
+"""
+import logging
+import time
+from typing import Iterable, List, Optional
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis-py < 4.2
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+CONNECTIONS_KEY = "presence:conn:{user_id}"
+ANNOUNCED_KEY = "presence:announced:{user_id}"
+GROUP = "presence_{user_id}"
+
+# KEYS: conexões, anunciado; ARGV: agora, expiração, membro, ttl, ttl do anunciado
+# Retorna 1 se o usuário passou a estar online (deve anunciar)
+_CONNECT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+local previous = redis.call('GETSET', KEYS[2], 'online')
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+if previous == 'online' then
+    return 0
+end
+return 1
+"""
+
+# KEYS: conexões, anunciado; ARGV: agora, ttl do anunciado
+# Retorna 1 se não sobrou conexão viva e o último anúncio era 'online'
+_SETTLE_OFFLINE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+local previous = redis.call('GETSET', KEYS[2], 'offline')
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if previous == 'online' then
+    return 1
+end
+return 0
+"""
+
+_client = None
+
+
+def presence_client():
+    """Cliente Redis assíncrono (um por processo ASGI)"""
+    global _client
+    if _client is None:
+        if aioredis is None:
+            raise RuntimeError("redis.asyncio is required for presence")
+        url = getattr(settings, 'MESSAGING_REDIS_URL', settings.CELERY_BROKER_URL)
+        _client = aioredis.Redis.from_url(url)
+    return _client
+
+
+def ttl() -> int:
+    return getattr(settings, 'MESSAGING_PRESENCE_TTL', 60)
+
+
+def heartbeat_interval() -> float:
+    return getattr(settings, 'MESSAGING_PRESENCE_HEARTBEAT_SECONDS', 20)
+
+
+def offline_grace() -> float:
+    return getattr(settings, 'MESSAGING_PRESENCE_OFFLINE_GRACE_SECONDS', 5)
+
+
+def _announced_ttl() -> int:
+    return 24 * 3600
+
+
+async def connect(user_id, connection: str) -> bool:
+    """Registra a conexão; True se o usuário acabou de ficar online"""
+    now = time.time()
+    try:
+        went_online = await presence_client().eval(
+            _CONNECT, 2,
+            CONNECTIONS_KEY.format(user_id=user_id), ANNOUNCED_KEY.format(user_id=user_id),
+            now, now + ttl(), connection, ttl(), _announced_ttl()
+        )
+        return bool(went_online)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to register presence of {user_id}: {e}")
+        return False
+
+
+async def heartbeat(user_id, connection: str) -> None:
+    """Renova a expiração da conexão (ZADD XX: não ressuscita conexões removidas)"""
+    key = CONNECTIONS_KEY.format(user_id=user_id)
+    try:
+        pipe = presence_client().pipeline(transaction=False)
+        pipe.zadd(key, {connection: time.time() + ttl()}, xx=True)
+        pipe.expire(key, ttl())
+        await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to refresh presence of {user_id}: {e}")
+
+
+async def disconnect(user_id, connection: str) -> None:
+    try:
+        await presence_client().zrem(CONNECTIONS_KEY.format(user_id=user_id), connection)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to unregister presence of {user_id}: {e}")
+
+
+async def settle_offline(user_id) -> bool:
+    """Após a carência: True se o usuário ficou offline (deve anunciar)"""
+    try:
+        went_offline = await presence_client().eval(
+            _SETTLE_OFFLINE, 2,
+            CONNECTIONS_KEY.format(user_id=user_id), ANNOUNCED_KEY.format(user_id=user_id),
+            time.time(), _announced_ttl()
+        )
+        return bool(went_offline)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to settle presence of {user_id}: {e}")
+        return False
+
+
+async def online_users(user_ids: Iterable) -> List[str]:
+    """Snapshot: quais dos usuários têm alguma conexão viva"""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return []
+    now = time.time()
+    try:
+        pipe = presence_client().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(CONNECTIONS_KEY.format(user_id=user_id), now, '+inf')
+        counts = await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read presence snapshot: {e}")
+        return []
+    return [user_id for user_id, count in zip(user_ids, counts) if count]
+
+
+def status_event(user_id, status: str, timestamp: Optional[str] = None) -> dict:
+    """Evento user_status do grupo presence_<user_id>"""
+    return {
+        'type': 'user_status',
+        'user_id': str(user_id),
+        'status': status,
+        'timestamp': timestamp or timezone.now().isoformat()
+    }
@@ -3,7 +3,6 @@ SERPRO Datavalid Provider - Acesso direto às bases oficiais brasileiras
 Melhor custo para alto volume (R$ 0.08-0.30/consulta)
 """
 
-import requests
 import os
 import time
 import logging
@@ -12,6 +11,7 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.cache import cache
 from ..kyc_router import BaseKYCProvider, KYCPayload, KYCResult
+from ..kyc_http import provider_client
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +39,7 @@ class DatavalidKYCProvider(BaseKYCProvider):
         self.endpoint = settings.KYC_PROVIDERS.get('serpro', {}).get('endpoint', 'https://apigateway.serpro.gov.br/')
         self.timeout = 35  # APIs gov podem ser mais lentas
         self._token_cache_key = 'datavalid_oauth_token'
+        self.http = provider_client('datavalid', settings_key='serpro')
     
     @property
     def name(self) -> str:
@@ -128,8 +129,9 @@ class DatavalidKYCProvider(BaseKYCProvider):
                 'client_secret': self.client_secret
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}oauth2/token',
+                endpoint='oauth2/token',
                 data=auth_data,
                 headers={'Content-Type': 'application/x-www-form-urlencoded'},
                 timeout=10
@@ -167,8 +169,9 @@ class DatavalidKYCProvider(BaseKYCProvider):
                 'dataNascimento': data_nascimento
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}api/cidadao/v1/validar-cpf',
+                endpoint='api/cidadao/v1/validar-cpf',
                 json=data,
                 headers=headers,
                 timeout=self.timeout
@@ -211,8 +214,9 @@ class DatavalidKYCProvider(BaseKYCProvider):
                 'cpf': cpf
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}api/detran/v1/validar-cnh',
+                endpoint='api/detran/v1/validar-cnh',
                 json=data,
                 headers=headers,
                 timeout=self.timeout
@@ -257,8 +261,9 @@ class DatavalidKYCProvider(BaseKYCProvider):
                 'imageSelfie': selfie_b64
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}api/biometria/v1/verificar',
+                endpoint='api/biometria/v1/verificar',
                 json=data,
                 headers=headers,
                 timeout=self.timeout
@@ -345,8 +350,9 @@ class DatavalidKYCProvider(BaseKYCProvider):
                 return {'status': 'unhealthy', 'error': 'Cannot obtain OAuth token'}
             
             # Teste básico de conectividade
-            response = requests.get(
+            response = self.http.get(
                 f'{self.endpoint}api/status',
+                endpoint='api/status',
                 headers={'Authorization': f'Bearer {token}'},
                 timeout=5
             )
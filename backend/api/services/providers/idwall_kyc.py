@@ -3,13 +3,13 @@ Idwall Provider - Melhor custo-benefício 1k-10k verificações/mês
 Integração completa: KYC + PEP + AML em um só endpoint
 """
 
-import requests
 import os
 import time
 import logging
 from typing import Dict
 from django.conf import settings
 from ..kyc_router import BaseKYCProvider, KYCPayload, KYCResult
+from ..kyc_http import TIMEOUT_ERRORS, provider_client, async_provider_client
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +33,7 @@ class IdwallKYCProvider(BaseKYCProvider):
         self.api_key = settings.KYC_PROVIDERS.get('idwall', {}).get('api_key', '')
         self.endpoint = settings.KYC_PROVIDERS.get('idwall', {}).get('endpoint', 'https://api.idwall.co/v2/')
         self.timeout = 30
+        self.http = provider_client('idwall')
     
     @property
     def name(self) -> str:
@@ -45,68 +46,48 @@ class IdwallKYCProvider(BaseKYCProvider):
         start_time = time.time()
         
         try:
-            # Preparar dados para Idwall
-            verification_data = {
-                "document_front": payload.get('doc_front'),
-                "document_back": payload.get('doc_back'), 
-                "selfie": payload.get('selfie'),
-                "document_type": payload.get('document_type', 'rg'),
-                "check_pep": True,  # Sempre verificar PEP
-                "check_sanctions": True,
-                "match_selfie": bool(payload.get('selfie')),
-                "extract_data": True,
-                "user_metadata": {
-                    "user_id": str(user_id),
-                    "marketplace": "galaxia"
-                }
-            }
-            
-            # Fazer chamada para API Idwall
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json',
-                'User-Agent': 'GalaxIA-Marketplace/1.0'
-            }
-            
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}kyc/verify',
-                json=verification_data,
-                headers=headers,
+                endpoint='kyc/verify',
+                json=self._build_verification_data(user_id, payload),
+                headers=self._headers(),
                 timeout=self.timeout
             )
+            latency_ms = int((time.time() - start_time) * 1000)
+            return self._parse_response(response, payload, latency_ms)
+                
+        except TIMEOUT_ERRORS:
+            latency_ms = int((time.time() - start_time) * 1000)
+            logger.error("Idwall API timeout")
+            return self._create_error_result(latency_ms, "Timeout")
             
+        except Exception as e:
             latency_ms = int((time.time() - start_time) * 1000)
+            logger.error(f"Idwall provider error: {str(e)}")
+            return self._create_error_result(latency_ms, str(e))
+    
+    async def averify(self, user_id: int, payload: KYCPayload) -> KYCResult:
+        """
+        Verificação via Idwall sem bloquear o worker (httpx)
+        """
+        http = async_provider_client('idwall')
+        if http is None:
+            return await super().averify(user_id, payload)
+        
+        start_time = time.time()
+        
+        try:
+            response = await http.post(
+                f'{self.endpoint}kyc/verify',
+                endpoint='kyc/verify',
+                json=self._build_verification_data(user_id, payload),
+                headers=self._headers(),
+                timeout=self.timeout
+            )
+            latency_ms = int((time.time() - start_time) * 1000)
+            return self._parse_response(response, payload, latency_ms)
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Mapear resposta Idwall para formato padrão
-                success = data.get('approved', False)
-                confidence_score = data.get('confidence', 0.0)
-                pep_found = data.get('pep', {}).get('found', False)
-                
-                return KYCResult(
-                    success=success,
-                    confidence_score=confidence_score,
-                    details={
-                        'idwall_id': data.get('id'),
-                        'document_data': data.get('document', {}),
-                        'pep_details': data.get('pep', {}),
-                        'sanctions': data.get('sanctions', {}),
-                        'face_match': data.get('face_match', {}),
-                        'provider': 'idwall'
-                    },
-                    pep_match=pep_found,
-                    cost=self.get_cost_estimate(payload),
-                    provider='idwall',
-                    latency_ms=latency_ms,
-                    requires_manual_review=data.get('manual_review', False)
-                )
-            else:
-                logger.error(f"Idwall API error: {response.status_code} - {response.text}")
-                return self._create_error_result(latency_ms, f"API Error: {response.status_code}")
-                
-        except requests.exceptions.Timeout:
+        except TIMEOUT_ERRORS:
             latency_ms = int((time.time() - start_time) * 1000)
             logger.error("Idwall API timeout")
             return self._create_error_result(latency_ms, "Timeout")
@@ -116,6 +97,60 @@ class IdwallKYCProvider(BaseKYCProvider):
             logger.error(f"Idwall provider error: {str(e)}")
             return self._create_error_result(latency_ms, str(e))
     
+    def _headers(self) -> Dict:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'User-Agent': 'GalaxIA-Marketplace/1.0'
+        }
+    
+    def _build_verification_data(self, user_id: int, payload: KYCPayload) -> Dict:
+        """Prepara dados para Idwall"""
+        return {
+            "document_front": payload.get('doc_front'),
+            "document_back": payload.get('doc_back'), 
+            "selfie": payload.get('selfie'),
+            "document_type": payload.get('document_type', 'rg'),
+            "check_pep": True,  # Sempre verificar PEP
+            "check_sanctions": True,
+            "match_selfie": bool(payload.get('selfie')),
+            "extract_data": True,
+            "user_metadata": {
+                "user_id": str(user_id),
+                "marketplace": "galaxia"
+            }
+        }
+    
+    def _parse_response(self, response, payload: KYCPayload, latency_ms: int) -> KYCResult:
+        """Mapeia resposta Idwall (requests ou httpx) para formato padrão"""
+        if response.status_code != 200:
+            logger.error(f"Idwall API error: {response.status_code} - {response.text}")
+            return self._create_error_result(latency_ms, f"API Error: {response.status_code}")
+        
+        data = response.json()
+        
+        success = data.get('approved', False)
+        confidence_score = data.get('confidence', 0.0)
+        pep_found = data.get('pep', {}).get('found', False)
+        
+        return KYCResult(
+            success=success,
+            confidence_score=confidence_score,
+            details={
+                'idwall_id': data.get('id'),
+                'document_data': data.get('document', {}),
+                'pep_details': data.get('pep', {}),
+                'sanctions': data.get('sanctions', {}),
+                'face_match': data.get('face_match', {}),
+                'provider': 'idwall'
+            },
+            pep_match=pep_found,
+            cost=self.get_cost_estimate(payload),
+            provider='idwall',
+            latency_ms=latency_ms,
+            requires_manual_review=data.get('manual_review', False)
+        )
+    
     def _create_error_result(self, latency_ms: int, error: str) -> KYCResult:
         """Cria resultado de erro padronizado"""
         return KYCResult(
@@ -150,8 +185,9 @@ class IdwallKYCProvider(BaseKYCProvider):
         Verifica saúde da API Idwall
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f'{self.endpoint}health',
+                endpoint='health',
                 headers={'Authorization': f'Bearer {self.api_key}'},
                 timeout=5
             )
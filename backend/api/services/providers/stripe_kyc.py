@@ -10,6 +10,7 @@ import logging
 from typing import Dict
 from django.conf import settings
 from ..kyc_router import BaseKYCProvider, KYCPayload, KYCResult
+from ..kyc_http import provider_client
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,9 @@ class StripeKYCProvider(BaseKYCProvider):
     - Custo alto após free tier (US$ 1.50/verif)
     """
     
+    def __init__(self):
+        self.http = provider_client('stripe')
+    
     @property
     def name(self) -> str:
         return "stripe"
@@ -69,7 +73,11 @@ class StripeKYCProvider(BaseKYCProvider):
                     'https://app.galaxia.com/kyc/callback')
             
             # Criar sessão de verificação
-            verification_session = stripe.identity.VerificationSession.create(**session_config)
+            verification_session = self._call(
+                'identity/verification_sessions',
+                stripe.identity.VerificationSession.create,
+                **session_config
+            )
             
             # Se temos dados de documento, simular verificação
             success = False
@@ -81,7 +89,9 @@ class StripeKYCProvider(BaseKYCProvider):
                 confidence_score = 0.95
                 
                 # Atualizar sessão (em produção seria feito pelo webhook)
-                verification_session = stripe.identity.VerificationSession.modify(
+                verification_session = self._call(
+                    'identity/verification_sessions/modify',
+                    stripe.identity.VerificationSession.modify,
                     verification_session.id,
                     metadata={
                         **verification_session.metadata,
@@ -123,6 +133,22 @@ class StripeKYCProvider(BaseKYCProvider):
                 requires_manual_review=True
             )
     
+    def _call(self, endpoint: str, fn, *args, **kwargs):
+        """
+        Chamada ao SDK Stripe dentro do teto de concorrência do provedor,
+        com latência registrada (retries ficam a cargo do próprio SDK)
+        """
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            with self.http.slot():
+                return fn(*args, **kwargs)
+        except stripe.error.StripeError as e:
+            outcome = str(getattr(e, 'http_status', None) or 'error')
+            raise
+        finally:
+            self.http.observe(endpoint, outcome, time.perf_counter() - start)
+    
     def get_cost_estimate(self, payload: KYCPayload) -> float:
         """
         Calcula custo estimado em BRL
@@ -3,13 +3,13 @@ Unico Check Provider - Máxima acurácia biométrica (>99%)
 Ideal para alto volume (≥10k/mês) ou verticais de alto risco
 """
 
-import requests
 import os
 import time
 import logging
 from typing import Dict
 from django.conf import settings
 from ..kyc_router import BaseKYCProvider, KYCPayload, KYCResult
+from ..kyc_http import TIMEOUT_ERRORS, provider_client, async_provider_client
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +34,7 @@ class UnicoKYCProvider(BaseKYCProvider):
         self.api_token = settings.KYC_PROVIDERS.get('unico', {}).get('api_key', '')
         self.endpoint = settings.KYC_PROVIDERS.get('unico', {}).get('endpoint', 'https://check.unico.io/api/v2/')
         self.timeout = 25
+        self.http = provider_client('unico')
     
     @property
     def name(self) -> str:
@@ -46,90 +47,48 @@ class UnicoKYCProvider(BaseKYCProvider):
         start_time = time.time()
         
         try:
-            # Preparar dados para Unico
-            verification_data = {
-                "document": {
-                    "front": payload.get('doc_front'),
-                    "back": payload.get('doc_back'),
-                    "type": self._map_document_type(payload.get('document_type', 'rg'))
-                },
-                "biometry": {
-                    "selfie": payload.get('selfie'),
-                    "liveness_check": True,
-                    "face_match": True
-                },
-                "options": {
-                    "extract_data": True,
-                    "quality_threshold": 0.7,  # Threshold mínimo de qualidade
-                    "similarity_threshold": 0.85,  # Threshold face match
-                    "anti_spoofing": True
-                },
-                "metadata": {
-                    "user_id": str(user_id),
-                    "source": "galaxia_marketplace"
-                }
-            }
-            
-            # Headers Unico
-            headers = {
-                'Authorization': f'Bearer {self.api_token}',
-                'Content-Type': 'application/json',
-                'X-Client-Version': 'galaxia-v1.0'
-            }
-            
-            # Chamada para API Unico
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}verification',
-                json=verification_data,
-                headers=headers,
+                endpoint='verification',
+                json=self._build_verification_data(user_id, payload),
+                headers=self._headers(),
                 timeout=self.timeout
             )
+            latency_ms = int((time.time() - start_time) * 1000)
+            return self._parse_response(response, payload, latency_ms)
+                
+        except TIMEOUT_ERRORS:
+            latency_ms = int((time.time() - start_time) * 1000)
+            logger.error("Unico API timeout")
+            return self._create_error_result(latency_ms, "Timeout")
             
+        except Exception as e:
             latency_ms = int((time.time() - start_time) * 1000)
+            logger.error(f"Unico provider error: {str(e)}")
+            return self._create_error_result(latency_ms, str(e))
+    
+    async def averify(self, user_id: int, payload: KYCPayload) -> KYCResult:
+        """
+        Verificação via Unico Check sem bloquear o worker (httpx)
+        """
+        http = async_provider_client('unico')
+        if http is None:
+            return await super().averify(user_id, payload)
+        
+        start_time = time.time()
+        
+        try:
+            response = await http.post(
+                f'{self.endpoint}verification',
+                endpoint='verification',
+                json=self._build_verification_data(user_id, payload),
+                headers=self._headers(),
+                timeout=self.timeout
+            )
+            latency_ms = int((time.time() - start_time) * 1000)
+            return self._parse_response(response, payload, latency_ms)
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Mapear resposta Unico para formato padrão
-                status = data.get('status', 'PENDING')
-                success = status == 'APPROVED'
-                
-                # Scores detalhados do Unico
-                document_score = data.get('document', {}).get('confidence', 0.0)
-                liveness_score = data.get('biometry', {}).get('liveness_score', 0.0)
-                similarity_score = data.get('biometry', {}).get('similarity_score', 0.0)
-                
-                # Confidence score combinado
-                confidence_score = (document_score * 0.4 + liveness_score * 0.3 + similarity_score * 0.3)
-                
-                return KYCResult(
-                    success=success,
-                    confidence_score=confidence_score,
-                    details={
-                        'unico_id': data.get('verification_id'),
-                        'status': status,
-                        'document_analysis': data.get('document', {}),
-                        'biometry_analysis': data.get('biometry', {}),
-                        'quality_scores': {
-                            'document': document_score,
-                            'liveness': liveness_score,
-                            'similarity': similarity_score
-                        },
-                        'extracted_data': data.get('extracted_data', {}),
-                        'provider': 'unico_check'
-                    },
-                    pep_match=False,  # PEP é add-on separado
-                    cost=self.get_cost_estimate(payload),
-                    provider='unico',
-                    latency_ms=latency_ms,
-                    requires_manual_review=status in ['MANUAL_REVIEW', 'PENDING']
-                )
-                
-            else:
-                logger.error(f"Unico API error: {response.status_code} - {response.text}")
-                return self._create_error_result(latency_ms, f"API Error: {response.status_code}")
-                
-        except requests.exceptions.Timeout:
+        except TIMEOUT_ERRORS:
             latency_ms = int((time.time() - start_time) * 1000)
             logger.error("Unico API timeout")
             return self._create_error_result(latency_ms, "Timeout")
@@ -139,6 +98,80 @@ class UnicoKYCProvider(BaseKYCProvider):
             logger.error(f"Unico provider error: {str(e)}")
             return self._create_error_result(latency_ms, str(e))
     
+    def _headers(self) -> Dict:
+        return {
+            'Authorization': f'Bearer {self.api_token}',
+            'Content-Type': 'application/json',
+            'X-Client-Version': 'galaxia-v1.0'
+        }
+    
+    def _build_verification_data(self, user_id: int, payload: KYCPayload) -> Dict:
+        """Prepara dados para Unico"""
+        return {
+            "document": {
+                "front": payload.get('doc_front'),
+                "back": payload.get('doc_back'),
+                "type": self._map_document_type(payload.get('document_type', 'rg'))
+            },
+            "biometry": {
+                "selfie": payload.get('selfie'),
+                "liveness_check": True,
+                "face_match": True
+            },
+            "options": {
+                "extract_data": True,
+                "quality_threshold": 0.7,  # Threshold mínimo de qualidade
+                "similarity_threshold": 0.85,  # Threshold face match
+                "anti_spoofing": True
+            },
+            "metadata": {
+                "user_id": str(user_id),
+                "source": "galaxia_marketplace"
+            }
+        }
+    
+    def _parse_response(self, response, payload: KYCPayload, latency_ms: int) -> KYCResult:
+        """Mapeia resposta Unico (requests ou httpx) para formato padrão"""
+        if response.status_code != 200:
+            logger.error(f"Unico API error: {response.status_code} - {response.text}")
+            return self._create_error_result(latency_ms, f"API Error: {response.status_code}")
+        
+        data = response.json()
+        
+        status = data.get('status', 'PENDING')
+        success = status == 'APPROVED'
+        
+        # Scores detalhados do Unico
+        document_score = data.get('document', {}).get('confidence', 0.0)
+        liveness_score = data.get('biometry', {}).get('liveness_score', 0.0)
+        similarity_score = data.get('biometry', {}).get('similarity_score', 0.0)
+        
+        # Confidence score combinado
+        confidence_score = (document_score * 0.4 + liveness_score * 0.3 + similarity_score * 0.3)
+        
+        return KYCResult(
+            success=success,
+            confidence_score=confidence_score,
+            details={
+                'unico_id': data.get('verification_id'),
+                'status': status,
+                'document_analysis': data.get('document', {}),
+                'biometry_analysis': data.get('biometry', {}),
+                'quality_scores': {
+                    'document': document_score,
+                    'liveness': liveness_score,
+                    'similarity': similarity_score
+                },
+                'extracted_data': data.get('extracted_data', {}),
+                'provider': 'unico_check'
+            },
+            pep_match=False,  # PEP é add-on separado
+            cost=self.get_cost_estimate(payload),
+            provider='unico',
+            latency_ms=latency_ms,
+            requires_manual_review=status in ['MANUAL_REVIEW', 'PENDING']
+        )
+    
     def _map_document_type(self, doc_type: str) -> str:
         """Mapeia tipos de documento para formato Unico"""
         mapping = {
@@ -199,8 +232,9 @@ class UnicoKYCProvider(BaseKYCProvider):
                 'analysis_type': 'quality_only'
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f'{self.endpoint}biometry/analyze',
+                endpoint='biometry/analyze',
                 json=quality_data,
                 headers=headers,
                 timeout=10
@@ -217,8 +251,9 @@ class UnicoKYCProvider(BaseKYCProvider):
     def health_check(self) -> Dict:
         """Verifica saúde da API Unico"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f'{self.endpoint}health',
+                endpoint='health',
                 headers={'Authorization': f'Bearer {self.api_token}'},
                 timeout=5
             )
@@ -0,0 +1,139 @@
+"""
+Cursores de leitura por participante
+
+Em vez de gravar o id do leitor no JSON read_by de cada mensagem, cada
+participante tem um cursor em ConversationReadState (last_read_message,
+last_read_at = created_at dessa mensagem). Uma mensagem está lida por um
+usuário se ele a enviou ou se created_at <= last_read_at.
+
+* mark_read(): um UPDATE condicional (o cursor nunca volta) e, na primeira
+  leitura, um INSERT ... ON CONFLICT DO NOTHING; independe de quantas
+  mensagens estavam não lidas
+* cursor_event(): um único evento 'read_cursor' para o grupo chat_<id>,
+  no lugar de um evento por mensagem
+* CursorMap: cursores de todos os participantes, um SELECT por conversa,
+  para os serializers derivarem read_by/is_read_by_current_user
+"""
+import logging
+from typing import Dict, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ConversationReadState, MessageConversation
+from . import messaging_counters
+
+logger = logging.getLogger(__name__)
+
+
+def mark_read(user, conversation_id, up_to: Optional[MessageConversation] = None) -> Optional[Dict]:
+    """
+    Avança o cursor do usuário até up_to (ou até a última mensagem da conversa)
+
+    Args:
+        user: Leitor
+        conversation_id: Conversa
+        up_to: Mensagem lida mais recente; None = última da conversa
+
+    Returns:
+        Dict com o cursor e unread_count restante, ou None se não avançou
+    """
+    if up_to is None:
+        up_to = MessageConversation.objects.filter(
+            conversation_id=conversation_id
+        ).order_by('-created_at', '-id').only('id', 'created_at').first()
+        if up_to is None:
+            return None
+        remaining = 0
+    else:
+        # Leitura parcial: sobram as mensagens de terceiros depois do cursor
+        remaining = MessageConversation.objects.filter(
+            conversation_id=conversation_id, created_at__gt=up_to.created_at
+        ).exclude(sender=user).count()
+
+    cursor = {
+        'last_read_message': up_to,
+        'last_read_at': up_to.created_at,
+        'unread_count': remaining,
+    }
+    advanced = ConversationReadState.objects.filter(
+        conversation_id=conversation_id, user=user
+    ).exclude(
+        last_read_at__gte=up_to.created_at
+    ).update(updated_at=timezone.now(), **cursor)
+
+    if not advanced:
+        # Primeira leitura (sem estado) ou cursor já adiante
+        ConversationReadState.objects.bulk_create(
+            [ConversationReadState(conversation_id=conversation_id, user=user, **cursor)],
+            ignore_conflicts=True
+        )
+        if not ConversationReadState.objects.filter(
+            conversation_id=conversation_id, user=user, last_read_message=up_to
+        ).exists():
+            return None
+
+    messaging_counters.conversation_read(user.id)
+    return {
+        'user_id': str(user.id),
+        'conversation_id': str(conversation_id),
+        'last_read_message_id': str(up_to.id),
+        'last_read_at': up_to.created_at.isoformat(),
+        'unread_count': remaining,
+    }
+
+
+def cursor_event(cursor: Dict) -> Dict:
+    """Evento do channel layer para o grupo chat_<conversation_id>"""
+    return {'type': 'read_cursor', 'cursor': cursor}
+
+
+def broadcast(cursor: Optional[Dict]) -> None:
+    """Envia o cursor ao grupo da conversa após o commit (contexto síncrono)"""
+    if not cursor:
+        return
+
+    def send():
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        try:
+            async_to_sync(get_channel_layer().group_send)(
+                f"chat_{cursor['conversation_id']}", cursor_event(cursor)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to broadcast read cursor: {e}")
+
+    transaction.on_commit(send)
+
+
+class CursorMap:
+    """
+    Cursores {user_id: last_read_at} por conversa, carregados sob demanda
+    (um SELECT por conversa) e reutilizados por todas as mensagens da página
+    """
+
+    def __init__(self):
+        self._cursors: Dict = {}
+
+    def for_conversation(self, conversation_id) -> Dict:
+        if conversation_id not in self._cursors:
+            self._cursors[conversation_id] = dict(
+                ConversationReadState.objects.filter(
+                    conversation_id=conversation_id, last_read_at__isnull=False
+                ).values_list('user_id', 'last_read_at')
+            )
+        return self._cursors[conversation_id]
+
+    def readers(self, message) -> Dict:
+        """{user_id: last_read_at} de quem já leu a mensagem (exceto o remetente)"""
+        return {
+            user_id: last_read_at
+            for user_id, last_read_at in self.for_conversation(message.conversation_id).items()
+            if user_id != message.sender_id and message.created_at <= last_read_at
+        }
+
+    def is_read_by(self, message, user) -> bool:
+        if message.sender_id == user.id:
+            return True
+        last_read_at = self.for_conversation(message.conversation_id).get(user.id)
+        return bool(last_read_at and message.created_at <= last_read_at)
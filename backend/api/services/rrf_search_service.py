@@ -4,12 +4,14 @@ Combina busca BM25 + k-NN seguindo arquitetura híbrida do diagrama
 """
 import logging
 from typing import Dict, List, Any, Optional
-from django.conf import settings
 from elasticsearch_dsl import connections
 from elasticsearch.exceptions import RequestError
-import requests
+import numpy as np
 import time
 
+from .ai_search_service import AISearchService
+from .search_tracing import SearchTrace
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,11 +43,12 @@ class RRFSearchService:
         Returns:
             Resultados híbridos BM25 + k-NN
         """
-        start_time = time.time()
+        trace = SearchTrace('rrf')
         
         try:
             # 1. Verificar se Elasticsearch suporta RRF
-            es_version = cls._get_elasticsearch_version()
+            with trace.stage('es_version'):
+                es_version = cls._get_elasticsearch_version()
             if not cls._supports_rrf(es_version):
                 logger.warning(f"Elasticsearch {es_version} não suporta RRF nativo. Fazendo fallback para merge Python.")
                 return cls._python_rrf_fallback(query, category, price_max, location, limit, offset)
@@ -54,20 +57,25 @@ class RRFSearchService:
             bm25_query = cls._build_bm25_query(query, category, price_max, location)
             
             # 3. Construir query k-NN (delegando para marketplace_ai)
-            knn_query = cls._build_knn_query(query, category, price_max, location)
+            with trace.stage('knn_embed'):
+                knn_query = cls._build_knn_query(query, category, price_max, location)
             
             # 4. Executar RRF nativo
-            results = cls._execute_native_rrf(
-                bm25_query, knn_query, limit, offset, window_size, rank_constant
-            )
+            with trace.stage('rrf_execute'):
+                results = cls._execute_native_rrf(
+                    bm25_query, knn_query, limit, offset, window_size, rank_constant
+                )
+            trace.count('rrf_execute', len(results))
             
             # 5. Aplicar re-ranking heurístico (mantém arquitetura existente)
-            final_results = cls._apply_heuristic_rerank(results)
-            
-            elapsed_ms = int((time.time() - start_time) * 1000)
+            with trace.stage('rerank'):
+                final_results = cls._apply_heuristic_rerank(results)
             
-            # 6. Métricas para Prometheus
-            cls._record_metrics('rrf', query, len(final_results), elapsed_ms)
+            # 6. Métricas para Prometheus / log de buscas lentas
+            elapsed_ms = int(cls._record_metrics(
+                trace, len(final_results),
+                query_body={'query': query, 'bm25': bm25_query, 'window_size': window_size}
+            ))
             
             return {
                 'success': True,
@@ -178,7 +186,7 @@ class RRFSearchService:
                         {
                             "knn": {
                                 "embedding": {
-                                    "vector": embedding,
+                                    "vector": embedding.tolist(),
                                     "k": 100,
                                     "num_candidates": 200
                                 }
@@ -200,30 +208,21 @@ class RRFSearchService:
             }
     
     @classmethod
-    def _get_query_embedding(cls, query: str) -> List[float]:
+    def _get_query_embedding(cls, query: str) -> np.ndarray:
         """
-        Obtém embedding da query via marketplace_ai
-        TODO: Integrar com sistema real de embeddings
+        Obtém embedding da query via marketplace_ai (transporte binário,
+        conexão keep-alive compartilhada)
+
+        Sem embedding não há metade semântica: a falha sobe para
+        _build_knn_query, que troca o k-NN por match_all. Um vetor de zeros
+        devolveria vizinhos arbitrários sem ninguém perceber.
         """
         try:
-            # Em produção, fazer chamada para marketplace_ai
-            ai_search_url = getattr(settings, 'AI_SEARCH_BASE_URL', 'http://localhost:8001')
-            
-            response = requests.post(
-                f"{ai_search_url}/embed/",
-                json={"text": query},
-                timeout=2
-            )
-            
-            if response.status_code == 200:
-                return response.json()['embedding']
-            else:
-                raise Exception(f"AI service returned {response.status_code}")
+            return AISearchService.get_query_embedding(query, timeout=2)
                 
         except Exception as e:
-            logger.warning(f"Falha ao obter embedding: {e}")
-            # Retornar vetor dummy para não quebrar a query
-            return [0.0] * 1536  # Tamanho padrão OpenAI
+            logger.error(f"Falha ao obter embedding da query: {e}")
+            raise
     
     @classmethod
     def _execute_native_rrf(cls, bm25_query: Dict, knn_query: Dict, 
@@ -397,23 +396,20 @@ class RRFSearchService:
         return results
     
     @classmethod
-    def _record_metrics(cls, engine: str, query: str, result_count: int, elapsed_ms: int):
+    def _record_metrics(cls, trace: SearchTrace, result_count: int,
+                        query_body: Optional[Dict] = None) -> float:
         """
-        Registra métricas para Prometheus
-        TODO: Integrar com sistema de métricas real
+        Fecha o trace da busca: histogramas Prometheus por estágio/engine e
+        amostragem de buscas lentas (com o corpo da query) em `search.slow`.
+        Retorna a duração total em ms.
         """
         try:
-            # Placeholder para métricas Prometheus
-            logger.info(f"METRICS: search_route_total{{engine='{engine}'}} query='{query}' "
-                       f"results={result_count} took_ms={elapsed_ms}")
-            
-            # Em produção, usar prometheus_client:
-            # SEARCH_TOTAL.labels(engine=engine).inc()
-            # SEARCH_DURATION.labels(engine=engine).observe(elapsed_ms / 1000.0)
-            # SEARCH_RESULTS.labels(engine=engine).observe(result_count)
+            trace.count('results', result_count)
+            return trace.finish(query_body=query_body)
             
         except Exception as e:
             logger.warning(f"Falha ao registrar métricas: {e}")
+            return (time.perf_counter() - trace.started) * 1000
 
 
 # Função de conveniência para classificação automática de query
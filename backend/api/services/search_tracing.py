@@ -0,0 +1,109 @@
+"""
+Tracing por requisição das buscas (RRF / BM25 / IA)
+Mede cada estágio, exporta histogramas Prometheus e amostra buscas lentas
+"""
+import contextlib
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+
+try:
+    from prometheus_client import Counter, Histogram
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('search.slow')
+
+if PROMETHEUS_AVAILABLE:
+    SEARCH_STAGE_SECONDS = Histogram(
+        'search_stage_seconds',
+        'Duração de cada estágio do pipeline de busca',
+        ['engine', 'stage'],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    )
+    SEARCH_RESULTS = Histogram(
+        'search_results',
+        'Resultados/candidatos por estágio do pipeline de busca',
+        ['engine', 'stage'],
+        buckets=(0, 1, 5, 10, 30, 60, 100, 200),
+    )
+    SEARCH_TOTAL = Counter(
+        'search_route_total',
+        'Buscas executadas por engine',
+        ['engine'],
+    )
+
+
+class SearchTrace:
+    """
+    Tempos (ms), contagens e cache hits de uma única busca
+
+    Uso:
+        trace = SearchTrace('rrf')
+        with trace.stage('knn_embed'):
+            ...
+        trace.count('results', len(results))
+        trace.finish(query_body=body)
+    """
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.cache: Dict[str, bool] = {}
+        self.total_ms: Optional[float] = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed * 1000
+            if PROMETHEUS_AVAILABLE:
+                SEARCH_STAGE_SECONDS.labels(self.engine, name).observe(elapsed)
+
+    def count(self, stage: str, n: int):
+        self.counts[stage] = n
+        if PROMETHEUS_AVAILABLE:
+            SEARCH_RESULTS.labels(self.engine, stage).observe(n)
+
+    def cache_hit(self, cache: str, hit: bool):
+        self.cache[cache] = hit
+
+    def finish(self, query_body: Any = None) -> float:
+        """Fecha o trace e retorna a duração total em ms"""
+        elapsed = time.perf_counter() - self.started
+        self.total_ms = elapsed * 1000
+
+        if PROMETHEUS_AVAILABLE:
+            SEARCH_TOTAL.labels(self.engine).inc()
+            SEARCH_STAGE_SECONDS.labels(self.engine, 'total').observe(elapsed)
+
+        if self.total_ms >= getattr(settings, 'SEARCH_SLOW_MS', 500):
+            try:
+                slow_logger.warning(
+                    "slow search %s",
+                    json.dumps({'trace': self.as_dict(), 'query_body': query_body}, default=str)
+                )
+            except Exception as e:
+                logger.warning(f"Falha ao registrar busca lenta: {e}")
+
+        return self.total_ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'engine': self.engine,
+            'total_ms': round(self.total_ms, 2) if self.total_ms is not None else None,
+            'stages_ms': {k: round(v, 2) for k, v in self.stages.items()},
+            'counts': dict(self.counts),
+            'cache': dict(self.cache),
+        }
+
@@ -0,0 +1,126 @@
+"""
+Lease de processamento para verificações KYC (KYCDocument / BiometricVerification)
+
+Substitui o select_for_update mantido durante a chamada ao provedor:
+1. claim()     - UPDATE condicional pending→processing com token + expiração
+2. chamada ao provedor fora de qualquer transação, dentro de held(): o
+   lease é renovado (heartbeat) ao obter o slot do provedor e antes de cada
+   retry, e a chamada é abortada se o lease já tiver sido perdido
+3. owned_for_update() - transação curta que só grava se o token ainda for nosso
+Linhas presas em processing com lease vencido voltam a pending via reclaim_expired()
+"""
+import contextlib
+import logging
+import uuid
+from datetime import timedelta
+from typing import Iterator, List, Optional, Type
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import VerificationStatus
+from . import kyc_http
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Outro worker assumiu a linha (lease vencido e reclamado)"""
+    pass
+
+
+def lease_seconds() -> int:
+    """
+    Duração do lease; renovado a cada tentativa HTTP, precisa cobrir uma
+    tentativa (timeout do provedor) mais a espera antes dela (max_retry_after)
+    """
+    return getattr(settings, 'KYC_PROCESSING_LEASE_SECONDS', 120)
+
+
+def claim(model: Type[models.Model], pk) -> Optional[uuid.UUID]:
+    """
+    Tenta assumir o processamento da linha com um único UPDATE condicional.
+    Aceita linhas pendentes ou em processing com lease vencido/ausente.
+
+    Returns:
+        Token do lease, ou None se outro worker já detém a linha
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    claimable = (
+        Q(status=VerificationStatus.PENDING) |
+        Q(status=VerificationStatus.PROCESSING, lease_expires_at__lt=now) |
+        Q(status=VerificationStatus.PROCESSING, lease_expires_at__isnull=True)
+    )
+    updated = model.objects.filter(claimable, pk=pk).update(
+        status=VerificationStatus.PROCESSING,
+        lease_token=token,
+        lease_expires_at=now + timedelta(seconds=lease_seconds()),
+    )
+    return token if updated else None
+
+
+def heartbeat(model: Type[models.Model], pk, token: uuid.UUID) -> bool:
+    """Estende o lease; False se ele já foi perdido para outro worker"""
+    return bool(model.objects.filter(
+        pk=pk, lease_token=token, status=VerificationStatus.PROCESSING
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds())))
+
+
+@contextlib.contextmanager
+def held(model: Type[models.Model], pk, token: uuid.UUID) -> Iterator[None]:
+    """
+    Mantém o lease vivo durante a chamada ao provedor: cada tentativa HTTP
+    (kyc_http) renova o lease antes de sair; se ele foi perdido, LeaseLost
+    aborta a chamada em vez de cobrar o provedor duas vezes. Provedores que
+    capturam Exception devolvem falha; a fase 3 a descarta (lease não é nosso)
+    """
+    def renew():
+        if not heartbeat(model, pk, token):
+            raise LeaseLost(f"{model.__name__} {pk}: lease lost")
+
+    with kyc_http.before_each_attempt(renew):
+        yield
+
+
+def release(model: Type[models.Model], pk, token: uuid.UUID, status: str = VerificationStatus.PENDING) -> bool:
+    """Devolve a linha (por padrão para pending) se o lease ainda for nosso"""
+    return bool(model.objects.filter(pk=pk, lease_token=token).update(
+        status=status, lease_token=None, lease_expires_at=None,
+    ))
+
+
+def owned_for_update(model: Type[models.Model], pk, token: uuid.UUID):
+    """
+    Trava e retorna a linha se o lease ainda for nosso (usar dentro de
+    transaction.atomic). Retorna None se o lease foi perdido; o lease é
+    limpo na instância para ser gravado junto com o resultado.
+    """
+    obj = model.objects.select_for_update().filter(pk=pk).first()
+    if obj is None or obj.lease_token != token or obj.status != VerificationStatus.PROCESSING:
+        return None
+    obj.lease_token = None
+    obj.lease_expires_at = None
+    return obj
+
+
+def reclaim_expired(model: Type[models.Model], limit: int = 500) -> List:
+    """
+    Devolve para pending as linhas presas em processing com lease vencido.
+
+    Returns:
+        PKs devolvidos (para reenfileirar)
+    """
+    now = timezone.now()
+    expired = Q(status=VerificationStatus.PROCESSING, lease_expires_at__lt=now)
+    pks = list(model.objects.filter(expired).values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+
+    model.objects.filter(expired, pk__in=pks).update(
+        status=VerificationStatus.PENDING, lease_token=None, lease_expires_at=None,
+    )
+    logger.warning(f"Reclaimed {len(pks)} stuck {model.__name__} rows with expired lease")
+    return pks
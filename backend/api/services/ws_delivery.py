@@ -0,0 +1,104 @@
+"""
+Entrega de frames nos websockets
+
+* group_event(): o produtor serializa o frame uma única vez e o envia
+  pronto no evento ('payload'); cada consumer do grupo só repassa a string,
+  sem json.dumps por assinante. orjson é usado quando instalado
+* BatchedSendMixin: frames para o mesmo socket dentro de
+  WEBSOCKET_BATCH_WINDOW_MS viram um único frame
+  {"type": "batch", "events": [...]}, montado por concatenação dos payloads
+  (sem reserializar). Opt-in por conexão com ?batch=1, para não quebrar
+  clientes que esperam um evento por frame
+
+permessage-deflate é negociado pelo servidor ASGI, não pela aplicação: o
+uvicorn com o backend 'websockets' o habilita por padrão (o daphne não
+suporta). Frames agrupados comprimem melhor que frames pequenos isolados.
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def encode(obj: Any) -> str:
+    """JSON de um frame (datetime/UUID/Decimal suportados nos dois caminhos)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, cls=DjangoJSONEncoder)
+
+
+def frame(client_type: str, data: Any) -> str:
+    """Frame no formato dos consumers: {"type": ..., "data": ...}"""
+    return encode({'type': client_type, 'data': data})
+
+
+def group_event(handler: str, client_type: str, data: Any, **extra) -> Dict:
+    """
+    Evento do channel layer com o frame já serializado
+
+    Args:
+        handler: Método do consumer (ex.: 'chat_message_broadcast')
+        client_type: Campo 'type' visto pelo cliente (ex.: 'new_message')
+        data: Conteúdo do frame
+        **extra: Campos que o consumer lê para filtrar (ex.: user_id)
+    """
+    return {'type': handler, 'payload': frame(client_type, data), **extra}
+
+
+class BatchedSendMixin:
+    """
+    Fila de frames por socket, descarregada a cada WEBSOCKET_BATCH_WINDOW_MS
+    (ou ao atingir WEBSOCKET_BATCH_MAX_EVENTS). Sem ?batch=1 envia direto.
+    """
+
+    def setup_batching(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode('utf-8', 'ignore'))
+        self.batch_frames = query.get('batch', ['0'])[0] in ('1', 'true')
+        self.pending_frames: List[str] = []
+        self.frames_flush: Optional[asyncio.Task] = None
+
+    async def send_frame(self, payload: str):
+        if not getattr(self, 'batch_frames', False):
+            await self.send(text_data=payload)
+            return
+
+        self.pending_frames.append(payload)
+        if len(self.pending_frames) >= getattr(settings, 'WEBSOCKET_BATCH_MAX_EVENTS', 50):
+            await self.flush_frames()
+        elif self.frames_flush is None or self.frames_flush.done():
+            self.frames_flush = asyncio.ensure_future(self._flush_later())
+
+    async def send_event(self, event: Dict, client_type: str, data_key: str):
+        """Repassa o payload pronto do evento; serializa só eventos sem payload (legado)"""
+        payload = event.get('payload')
+        if payload is None:
+            payload = frame(client_type, event[data_key])
+        await self.send_frame(payload)
+
+    async def _flush_later(self):
+        await asyncio.sleep(getattr(settings, 'WEBSOCKET_BATCH_WINDOW_MS', 25) / 1000)
+        await self.flush_frames()
+
+    async def flush_frames(self):
+        frames, self.pending_frames = self.pending_frames, []
+        if not frames:
+            return
+        if len(frames) == 1:
+            await self.send(text_data=frames[0])
+        else:
+            await self.send(text_data='{"type":"batch","events":[' + ','.join(frames) + ']}')
+
+    async def stop_batching(self):
+        """No disconnect: cancela o timer; o socket já fechou, o restante é descartado"""
+        if getattr(self, 'frames_flush', None) and not self.frames_flush.done():
+            self.frames_flush.cancel()
+        self.pending_frames = []
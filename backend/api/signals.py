@@ -1,10 +1,15 @@
 """
 Signals para sincronização automática com sistema de IA
+e manutenção dos contadores de mensageria
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
-from .models import ServicePackage, FreelancerProfile
+from .models import (
+    ServicePackage, FreelancerProfile, Conversation, MessageConversation,
+    SystemNotification, NotificationPreferences
+)
+from .services import conversation_access, messaging_counters, notification_dispatch
 from .services.ai_search_service import auto_sync_to_ai_system, auto_sync_delete_to_ai_system
 import logging
 
@@ -56,4 +61,63 @@ def delete_freelancer_profile_from_ai(sender, instance, **kwargs):
         try:
             auto_sync_delete_to_ai_system(sender, instance, **kwargs)
         except Exception as e:
-            logger.error(f"Erro ao deletar FreelancerProfile {instance.id} da IA: {str(e)}")
\ No newline at end of file
+            logger.error(f"Erro ao deletar FreelancerProfile {instance.id} da IA: {str(e)}")
+
+
+@receiver(post_save, sender=MessageConversation)
+def update_unread_counters_on_message(sender, instance, created, **kwargs):
+    """
+    Incrementa as não lidas dos outros participantes
+    """
+    if created:
+        messaging_counters.message_created(instance)
+
+
+@receiver(post_save, sender=MessageConversation)
+def update_conversation_last_message(sender, instance, created, **kwargs):
+    """
+    Mantém last_message/last_message_at/preview da conversa
+    """
+    if created:
+        Conversation.record_message(instance)
+
+
+@receiver(post_save, sender=SystemNotification)
+def update_unread_counters_on_notification(sender, instance, created, **kwargs):
+    """
+    Incrementa o total de notificações não lidas do usuário
+    """
+    if created and not instance.read:
+        messaging_counters.notifications_created([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def cleanup_read_states_on_participant_removal(sender, instance, action, pk_set, **kwargs):
+    """
+    Remove estados de leitura de quem saiu da conversa
+    """
+    if action == 'post_remove' and pk_set and isinstance(instance, Conversation):
+        messaging_counters.participants_removed(instance.pk, pk_set)
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_participants_cache(sender, instance, action, pk_set, **kwargs):
+    """
+    Invalida o conjunto de participantes cacheado (services/conversation_access.py)
+    """
+    if isinstance(instance, Conversation):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            conversation_access.invalidate([instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        conversation_access.invalidate(pk_set)
+    elif action == 'pre_clear':
+        # user.conversations.clear(): as conversas só são conhecidas antes do clear
+        conversation_access.invalidate(list(instance.conversations.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=NotificationPreferences)
+def invalidate_cached_notification_preferences(sender, instance, **kwargs):
+    """
+    Descarta as preferências cacheadas pelo despacho de notificações
+    """
+    notification_dispatch.invalidate_preferences(instance.user_id)
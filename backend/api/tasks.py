@@ -298,21 +298,6 @@ def send_change_request_notification(change_request_id):
         return f"Erro ao enviar notificação de solicitação: {str(e)}"
 
 
-@shared_task
-def clean_expired_time_slots():
-    """
-    Remove slots de tempo expirados (datas passadas)
-    """
-    from .models import TimeSlot
-    from datetime import date
-    
-    expired_slots = TimeSlot.objects.filter(date__lt=date.today())
-    count = expired_slots.count()
-    expired_slots.delete()
-    
-    return f"Removidos {count} slots de tempo expirados"
-
-
 @shared_task
 def auto_complete_past_bookings():
     """
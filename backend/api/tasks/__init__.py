@@ -7,16 +7,43 @@ from .kyc_tasks import (
     process_document_verification,
     process_biometric_verification,
     process_kyc_webhook,
+    process_kyc_webhook_partition,
+    sweep_kyc_webhook_events,
+    prune_kyc_webhook_events,
     trigger_profile_update,
     send_level_upgrade_notification,
-    cleanup_expired_verifications
+    cleanup_expired_verifications,
+    reclaim_stuck_verifications
+)
+from .booking_tasks import clean_expired_time_slots
+# api/tasks_messaging.py fica fora do pacote: importado aqui para o worker registrar as tasks
+from ..tasks_messaging import (
+    fan_out_message_notifications,
+    process_notification,
+    deliver_notification_channel,
+    sweep_notification_backlogs,
+    cleanup_old_notifications,
+    send_digest_notifications,
+    send_digest_shard
 )
 
 __all__ = [
     'process_document_verification',
     'process_biometric_verification', 
     'process_kyc_webhook',
+    'process_kyc_webhook_partition',
+    'sweep_kyc_webhook_events',
+    'prune_kyc_webhook_events',
     'trigger_profile_update',
     'send_level_upgrade_notification',
-    'cleanup_expired_verifications'
+    'cleanup_expired_verifications',
+    'reclaim_stuck_verifications',
+    'clean_expired_time_slots',
+    'fan_out_message_notifications',
+    'process_notification',
+    'deliver_notification_channel',
+    'sweep_notification_backlogs',
+    'cleanup_old_notifications',
+    'send_digest_notifications',
+    'send_digest_shard'
 ]
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+Celery tasks de manutenção do sistema de agendamento
+"""
+
+import logging
+from datetime import date
+from celery import shared_task
+
+from ..models import TimeSlot
+from ..services.chunked_maintenance import run_chunked
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def clean_expired_time_slots():
+    """
+    Remove slots de tempo expirados (datas passadas) em lotes
+    Retoma do checkpoint se o orçamento de tempo acabar
+    """
+    result = run_chunked(
+        'booking.clean_expired_time_slots',
+        TimeSlot.objects.filter(date__lt=date.today()),
+        delete=True
+    )
+    
+    if not result['completed']:
+        clean_expired_time_slots.delay()
+    
+    logger.info(f"Removed {result['processed']} expired time slots")
+    return {'success': True, 'slots_removed': result['processed'], 'completed': result['completed']}
@@ -4,6 +4,7 @@ Seguindo as melhores práticas de webhook processing com retry e logging
 """
 
 import logging
+import time
 from celery import shared_task
 from celery.exceptions import Retry
 from django.conf import settings
@@ -11,7 +12,8 @@ from django.utils import timezone
 from django.db import transaction
 from typing import Optional, Dict, Any
 
-from ..models import KYCDocument, BiometricVerification, KYCProfile, VerificationProvider, KYCProviderStats
+from ..models import KYCDocument, BiometricVerification, KYCProfile, VerificationProvider, KYCProviderStats, VerificationStatus
+from ..services import kyc_budget, verification_lease
 from ..services.kyc_service import kyc_service
 from ..services.kyc_router import kyc_router, get_kyc_provider
 
@@ -23,6 +25,11 @@ def process_document_verification(self, document_id: str, provider_name: Optiona
     """
     Processa verificação de documento de forma assíncrona
     
+    Três fases, sem lock de linha durante a chamada HTTP ao provedor:
+    1. claim atômico pending→processing (UPDATE condicional com lease)
+    2. chamada ao provedor fora de qualquer transação
+    3. transação curta que grava o resultado se o lease ainda for nosso
+    
     Args:
         document_id: UUID do documento a ser verificado
         provider_name: Nome do provedor KYC (opcional)
@@ -30,63 +37,74 @@ def process_document_verification(self, document_id: str, provider_name: Optiona
     Returns:
         Dict com resultado da verificação
     """
+    # Fase 1: claim
+    token = verification_lease.claim(KYCDocument, document_id)
+    if token is None:
+        if not KYCDocument.objects.filter(id=document_id).exists():
+            logger.error(f"Document {document_id} not found")
+            return {'success': False, 'error': 'Document not found'}
+        logger.warning(f"Document {document_id} already being processed")
+        return {'success': False, 'error': 'Already processing'}
+    
     try:
+        document = KYCDocument.objects.select_related('user').get(id=document_id)
+        provider = kyc_service.get_document_provider(provider_name)
+        
+        if provider is None:
+            logger.error("No KYC provider available")
+            with transaction.atomic():
+                document = verification_lease.owned_for_update(KYCDocument, document_id, token)
+                if document is not None:
+                    document.rejection_reason = 'No KYC provider available'
+                    document.mark_as_processed(VerificationStatus.REJECTED)
+            return {'success': False, 'document_id': str(document_id), 'error': 'No provider available'}
+        
+        logger.info(f"Starting verification for document {document_id}")
+        
+        # Fase 2: chamada externa (sem transação, sem lock; lease renovado a cada tentativa)
+        try:
+            with verification_lease.held(KYCDocument, document_id, token):
+                result = kyc_service.call_document_provider(document, provider)
+        except verification_lease.LeaseLost:
+            logger.warning(f"Lease lost for document {document_id}; provider call aborted")
+            return {'success': False, 'document_id': str(document_id), 'error': 'Lease lost'}
+        
+        # Fase 3: gravação curta, condicionada ao lease
         with transaction.atomic():
-            # Buscar documento
-            try:
-                document = KYCDocument.objects.select_for_update().get(id=document_id)
-            except KYCDocument.DoesNotExist:
-                logger.error(f"Document {document_id} not found")
-                return {'success': False, 'error': 'Document not found'}
+            document = verification_lease.owned_for_update(KYCDocument, document_id, token)
+            if document is None:
+                logger.warning(f"Lease lost for document {document_id}; discarding provider result")
+                return {'success': False, 'document_id': str(document_id), 'error': 'Lease lost'}
+            verification_result = kyc_service.apply_document_result(document, provider, result)
+        
+        if verification_result:
+            logger.info(f"Document {document_id} verified successfully")
             
-            # Verificar se já está sendo processado
-            if document.status == 'processing':
-                logger.warning(f"Document {document_id} already being processed")
-                return {'success': False, 'error': 'Already processing'}
+            # Trigger next steps se necessário
+            if document.status == VerificationStatus.APPROVED:
+                trigger_profile_update.delay(document.user_id)
             
-            # Marcar como processando
-            document.status = 'processing'
-            document.save(update_fields=['status'])
-            
-            logger.info(f"Starting verification for document {document_id}")
-            
-            # Verificar documento via KYC service
-            verification_result = kyc_service.verify_document(document, provider_name)
-            
-            if verification_result:
-                logger.info(f"Document {document_id} verified successfully")
-                
-                # Trigger next steps se necessário
-                if document.status == 'approved':
-                    trigger_profile_update.delay(document.user.id)
-                
-                return {
-                    'success': True,
-                    'document_id': str(document.id),
-                    'status': document.status,
-                    'confidence_score': document.confidence_score
-                }
-            else:
-                logger.warning(f"Document {document_id} verification failed")
-                return {
-                    'success': False,
-                    'document_id': str(document.id),
-                    'error': 'Verification failed'
-                }
+            return {
+                'success': True,
+                'document_id': str(document.id),
+                'status': document.status,
+                'confidence_score': document.confidence_score
+            }
+        else:
+            logger.warning(f"Document {document_id} verification failed")
+            return {
+                'success': False,
+                'document_id': str(document.id),
+                'error': 'Verification failed'
+            }
                 
     except Exception as exc:
         logger.error(f"Error processing document {document_id}: {str(exc)}")
         
         # Retry com backoff exponencial
         if self.request.retries < self.max_retries:
-            # Reset status se falhou
-            try:
-                doc = KYCDocument.objects.get(id=document_id)
-                if doc.status == 'processing':
-                    doc.status = 'pending'
-                    doc.save(update_fields=['status'])
-            except:
-                pass
+            # Devolve o documento para pending para o próximo claim
+            verification_lease.release(KYCDocument, document_id, token)
             
             retry_delay = 60 * (2 ** self.request.retries)  # Exponential backoff
             logger.info(f"Retrying document {document_id} in {retry_delay} seconds")
@@ -94,13 +112,13 @@ def process_document_verification(self, document_id: str, provider_name: Optiona
         
         # Max retries exceeded
         logger.error(f"Max retries exceeded for document {document_id}")
-        try:
-            doc = KYCDocument.objects.get(id=document_id)
-            doc.status = 'rejected'
-            doc.rejection_reason = f"System error after {self.max_retries} retries: {str(exc)}"
-            doc.save()
-        except:
-            pass
+        KYCDocument.objects.filter(id=document_id, lease_token=token).update(
+            status=VerificationStatus.REJECTED,
+            rejection_reason=f"System error after {self.max_retries} retries: {str(exc)}",
+            processed_at=timezone.now(),
+            lease_token=None,
+            lease_expires_at=None,
+        )
         
         return {
             'success': False,
@@ -114,6 +132,9 @@ def process_biometric_verification(self, biometric_id: str, provider_name: Optio
     """
     Processa verificação biométrica de forma assíncrona
     
+    Mesmo pipeline em três fases de process_document_verification
+    (claim → chamada ao provedor sem lock → gravação curta).
+    
     Args:
         biometric_id: UUID da verificação biométrica
         provider_name: Nome do provedor KYC (opcional)
@@ -121,66 +142,75 @@ def process_biometric_verification(self, biometric_id: str, provider_name: Optio
     Returns:
         Dict com resultado da verificação
     """
+    # Fase 1: claim
+    token = verification_lease.claim(BiometricVerification, biometric_id)
+    if token is None:
+        if not BiometricVerification.objects.filter(id=biometric_id).exists():
+            logger.error(f"Biometric verification {biometric_id} not found")
+            return {'success': False, 'error': 'Biometric verification not found'}
+        logger.warning(f"Biometric {biometric_id} already being processed")
+        return {'success': False, 'error': 'Already processing'}
+    
     try:
+        biometric = BiometricVerification.objects.select_related('user').get(id=biometric_id)
+        
+        provider = None
+        if provider_name and provider_name in kyc_service.providers:
+            provider = kyc_service.providers[provider_name]
+        if provider is None or not provider.provider.supports_biometric:
+            provider = kyc_service.get_biometric_provider()
+        
+        if provider is None:
+            logger.error("No biometric provider available")
+            verification_lease.release(
+                BiometricVerification, biometric_id, token, status=VerificationStatus.REJECTED
+            )
+            return {'success': False, 'biometric_id': str(biometric_id), 'error': 'No provider available'}
+        
+        logger.info(f"Starting biometric verification for {biometric_id}")
+        
+        # Fase 2: chamada externa (sem transação, sem lock; lease renovado a cada tentativa)
+        try:
+            with verification_lease.held(BiometricVerification, biometric_id, token):
+                result = kyc_service.call_biometric_provider(biometric, provider)
+        except verification_lease.LeaseLost:
+            logger.warning(f"Lease lost for biometric {biometric_id}; provider call aborted")
+            return {'success': False, 'biometric_id': str(biometric_id), 'error': 'Lease lost'}
+        
+        # Fase 3: gravação curta, condicionada ao lease
         with transaction.atomic():
-            # Buscar verificação biométrica
-            try:
-                biometric = BiometricVerification.objects.select_for_update().get(id=biometric_id)
-            except BiometricVerification.DoesNotExist:
-                logger.error(f"Biometric verification {biometric_id} not found")
-                return {'success': False, 'error': 'Biometric verification not found'}
+            biometric = verification_lease.owned_for_update(BiometricVerification, biometric_id, token)
+            if biometric is None:
+                logger.warning(f"Lease lost for biometric {biometric_id}; discarding provider result")
+                return {'success': False, 'biometric_id': str(biometric_id), 'error': 'Lease lost'}
+            kyc_service.apply_biometric_result(biometric, provider, result)
+        
+        if biometric.status == VerificationStatus.APPROVED:
+            logger.info(f"Biometric {biometric_id} verified successfully")
             
-            # Verificar se já está sendo processado
-            if biometric.status == 'processing':
-                logger.warning(f"Biometric {biometric_id} already being processed")
-                return {'success': False, 'error': 'Already processing'}
-            
-            # Marcar como processando
-            biometric.status = 'processing'
-            biometric.save(update_fields=['status'])
-            
-            logger.info(f"Starting biometric verification for {biometric_id}")
-            
-            # Processar via KYC service
-            processed_biometric = kyc_service.verify_biometric(
-                user=biometric.user,
-                selfie_file=None,  # Já foi feito upload
-                liveness_video_file=None,  # Já foi feito upload
-                device_info=biometric.device_info
-            )
+            # Trigger profile update
+            trigger_profile_update.delay(biometric.user_id)
             
-            if processed_biometric.status == 'approved':
-                logger.info(f"Biometric {biometric_id} verified successfully")
-                
-                # Trigger profile update
-                trigger_profile_update.delay(biometric.user.id)
-                
-                return {
-                    'success': True,
-                    'biometric_id': str(biometric.id),
-                    'status': biometric.status,
-                    'liveness_score': biometric.liveness_score
-                }
-            else:
-                logger.warning(f"Biometric {biometric_id} verification failed")
-                return {
-                    'success': False,
-                    'biometric_id': str(biometric.id),
-                    'error': 'Biometric verification failed'
-                }
+            return {
+                'success': True,
+                'biometric_id': str(biometric.id),
+                'status': biometric.status,
+                'liveness_score': biometric.liveness_score
+            }
+        else:
+            logger.warning(f"Biometric {biometric_id} verification failed")
+            return {
+                'success': False,
+                'biometric_id': str(biometric.id),
+                'error': 'Biometric verification failed'
+            }
                 
     except Exception as exc:
         logger.error(f"Error processing biometric {biometric_id}: {str(exc)}")
         
         # Retry logic similar to document verification
         if self.request.retries < self.max_retries:
-            try:
-                bio = BiometricVerification.objects.get(id=biometric_id)
-                if bio.status == 'processing':
-                    bio.status = 'pending'
-                    bio.save(update_fields=['status'])
-            except:
-                pass
+            verification_lease.release(BiometricVerification, biometric_id, token)
             
             retry_delay = 60 * (2 ** self.request.retries)
             logger.info(f"Retrying biometric {biometric_id} in {retry_delay} seconds")
@@ -188,12 +218,9 @@ def process_biometric_verification(self, biometric_id: str, provider_name: Optio
         
         # Max retries exceeded
         logger.error(f"Max retries exceeded for biometric {biometric_id}")
-        try:
-            bio = BiometricVerification.objects.get(id=biometric_id)
-            bio.status = 'rejected'
-            bio.save()
-        except:
-            pass
+        verification_lease.release(
+            BiometricVerification, biometric_id, token, status=VerificationStatus.REJECTED
+        )
         
         return {
             'success': False,
@@ -202,6 +229,32 @@ def process_biometric_verification(self, biometric_id: str, provider_name: Optio
         }
 
 
+@shared_task
+def reclaim_stuck_verifications():
+    """
+    Devolve para a fila verificações presas em processing com lease vencido
+    (worker morto, timeout, deploy no meio da chamada ao provedor)
+    """
+    try:
+        documents = verification_lease.reclaim_expired(KYCDocument)
+        for document_id in documents:
+            process_document_verification.delay(str(document_id))
+        
+        biometrics = verification_lease.reclaim_expired(BiometricVerification)
+        for biometric_id in biometrics:
+            process_biometric_verification.delay(str(biometric_id))
+        
+        return {
+            'success': True,
+            'documents_reclaimed': len(documents),
+            'biometrics_reclaimed': len(biometrics)
+        }
+        
+    except Exception as exc:
+        logger.error(f"Error reclaiming stuck verifications: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
+
+
 @shared_task(bind=True, max_retries=2, default_retry_delay=30)
 def trigger_profile_update(self, user_id: int):
     """
@@ -335,6 +388,9 @@ def process_kyc_webhook(self, webhook_data: Dict[str, Any], provider: str):
     """
     Processa webhook de provedor KYC de forma assíncrona
     
+    Caminho legado (mensagens já enfileiradas antes da ingestão via
+    KYCWebhookEvent); novos webhooks passam por process_kyc_webhook_partition.
+    
     Args:
         webhook_data: Dados recebidos do webhook
         provider: Nome do provedor (idwall, stripe, unico)
@@ -371,8 +427,11 @@ def process_kyc_webhook(self, webhook_data: Dict[str, Any], provider: str):
 def smart_kyc_verification(self, user_id: int, document_id: str, payload: Dict[str, Any]):
     """
     Verificação KYC inteligente com roteamento automático
-    Seleciona o melhor provedor baseado em custo-benefício em tempo real
+    Seleciona o melhor provedor baseado em custo-benefício em tempo real,
+    reservando free tier / orçamento antes da chamada (services/kyc_budget.py)
     """
+    reservation = None
+    called = False
     try:
         from django.contrib.auth import get_user_model
         User = get_user_model()
@@ -385,8 +444,8 @@ def smart_kyc_verification(self, user_id: int, document_id: str, payload: Dict[s
         needs_biometric = bool(payload.get('selfie'))
         needs_pep = payload.get('check_pep', True)
         
-        # Selecionar provedor inteligentemente
-        chosen_provider = kyc_router.choose_provider(
+        # Selecionar provedor inteligentemente (com reserva atômica de orçamento)
+        chosen_provider, reservation = kyc_router.reserve_provider(
             user=user,
             needs_biometric=needs_biometric,
             needs_pep=needs_pep
@@ -399,6 +458,7 @@ def smart_kyc_verification(self, user_id: int, document_id: str, payload: Dict[s
         
         # Executar verificação
         start_time = time.time()
+        called = True
         result = provider.verify(user_id, payload)
         
         # Atualizar métricas do roteador
@@ -437,6 +497,8 @@ def smart_kyc_verification(self, user_id: int, document_id: str, payload: Dict[s
         
     except Exception as exc:
         logger.error(f"Smart KYC verification failed: {str(exc)}")
+        if not called:
+            kyc_budget.release(reservation)
         
         if self.request.retries < self.max_retries:
             retry_delay = 60 * (2 ** self.request.retries)
@@ -509,31 +571,112 @@ def optimize_kyc_routing():
 def reset_monthly_kyc_metrics():
     """
     Reset mensal das métricas KYC (executar no dia 1 de cada mês)
+    UPDATE em lote nas linhas cujo reset_month não é o mês corrente
     """
     try:
         from datetime import date
+        from ..services.chunked_maintenance import run_chunked
+        
+        today = date.today()
+        result = run_chunked(
+            'kyc.reset_monthly_metrics',
+            KYCProviderStats.objects.exclude(
+                reset_month__year=today.year,
+                reset_month__month=today.month
+            ),
+            update={
+                'monthly_spent': 0,
+                'attempts': 0,
+                'successes': 0,
+                'reset_month': today
+            }
+        )
         
-        reset_count = 0
-        for stats in KYCProviderStats.objects.all():
-            if stats.should_reset_monthly():
-                stats.reset_monthly_metrics()
-                reset_count += 1
-                logger.info(f"Reset monthly metrics for {stats.name}")
-        
-        return {'success': True, 'providers_reset': reset_count}
+        logger.info(f"Reset monthly metrics for {result['processed']} KYC providers")
+        return {'success': True, 'providers_reset': result['processed']}
         
     except Exception as exc:
         logger.error(f"Monthly KYC reset failed: {str(exc)}")
         return {'success': False, 'error': str(exc)}
 
 
+@shared_task
+def flush_kyc_latency_sketches():
+    """
+    Consolida os sketches de latência do Redis em KYCProviderStats
+    (latency_sketch com decaimento + last_ms_p95). Único escritor dessas colunas.
+    """
+    from ..services import kyc_metrics
+    
+    decay = getattr(settings, 'KYC_LATENCY_SKETCH_DECAY', 0.9)
+    flushed = {}
+    
+    try:
+        for name, sketch in KYCProviderStats.objects.values_list('name', 'latency_sketch'):
+            fresh = kyc_metrics.drain(name)
+            if not fresh:
+                continue
+            
+            merged = kyc_metrics.merge(sketch, fresh, decay=decay)
+            p95 = kyc_metrics.quantile(merged, 0.95)
+            KYCProviderStats.objects.filter(name=name).update(
+                latency_sketch=merged,
+                last_ms_p95=p95
+            )
+            flushed[name] = {'samples': int(sum(fresh.values())), 'p95_ms': p95}
+        
+        return {'success': True, 'providers': flushed}
+        
+    except Exception as exc:
+        logger.error(f"KYC latency sketch flush failed: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
+
+
+@shared_task
+def refresh_verification_rollups():
+    """
+    Catch-up idempotente do rollup horário de VerificationLog (dashboards KYC)
+    """
+    from ..services.kyc_analytics import KYCAnalyticsService
+    
+    try:
+        result = KYCAnalyticsService.refresh_rollups()
+        return {'success': True, **result}
+        
+    except Exception as exc:
+        logger.error(f"Verification rollup refresh failed: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
+
+
+@shared_task
+def prune_verification_logs():
+    """
+    Retenção dos VerificationLog brutos (o rollup horário é mantido)
+    """
+    from ..services.kyc_analytics import KYCAnalyticsService
+    
+    try:
+        # Garante que as horas a podar já estão consolidadas
+        KYCAnalyticsService.refresh_rollups()
+        deleted = KYCAnalyticsService.prune_raw_logs()
+        return {'success': True, 'deleted': deleted}
+        
+    except Exception as exc:
+        logger.error(f"Verification log pruning failed: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
+
+
 @shared_task
 def kyc_provider_health_check():
     """
-    Health check de todos os provedores KYC
-    Desativa automaticamente provedores com problemas
+    Health check concorrente de todos os provedores KYC
+    
+    Grava status/latência no hash compartilhado (services/kyc_health.py);
+    o KYCRouter tira do roteamento provedores instáveis com histerese,
+    sem alterar KYCProviderStats.is_active
     """
     try:
+        from ..services import kyc_health
         from ..services.providers import (
             StripeKYCProvider, IdwallKYCProvider, 
             UnicoKYCProvider, DatavalidKYCProvider
@@ -546,30 +689,17 @@ def kyc_provider_health_check():
             'datavalid': DatavalidKYCProvider()
         }
         
-        health_results = {}
+        health_results = kyc_health.probe_all(providers)
+        states = kyc_health.record(health_results)
         
-        for name, provider in providers.items():
-            try:
-                if hasattr(provider, 'health_check'):
-                    health = provider.health_check()
-                    health_results[name] = health
-                    
-                    # Desativar se unhealthy
-                    if health.get('status') == 'unhealthy':
-                        stats = KYCProviderStats.objects.get(name=name)
-                        stats.is_active = False
-                        stats.save()
-                        logger.warning(f"Deactivated unhealthy provider: {name}")
-                else:
-                    health_results[name] = {'status': 'unknown', 'note': 'No health check available'}
-                    
-            except Exception as e:
-                health_results[name] = {'status': 'error', 'error': str(e)}
-                logger.error(f"Health check failed for {name}: {str(e)}")
+        for name, result in health_results.items():
+            if result.get('status') not in kyc_health.HEALTHY_STATUSES | {'unknown'}:
+                logger.warning(f"Health check failed for {name}: {result.get('error', result.get('status'))}")
         
         return {
             'success': True,
             'health_results': health_results,
+            'unroutable': [name for name, state in states.items() if not state['routable']],
             'timestamp': timezone.now().isoformat()
         }
         
@@ -581,41 +711,102 @@ def kyc_provider_health_check():
 def calculate_market_volatility() -> float:
     """
     Calcula volatilidade do mercado KYC baseado em métricas recentes
+    (coeficiente de variação do tempo de resposta, lido do rollup horário)
     """
     try:
-        from django.db.models import Avg, StdDev
         from datetime import timedelta
+        from ..services.kyc_analytics import KYCAnalyticsService
         
         # Analisar variação nos últimos 7 dias
         week_ago = timezone.now() - timedelta(days=7)
+        volatility = KYCAnalyticsService.market_volatility(week_ago)
         
-        # Buscar logs de verificação recentes
-        recent_logs = VerificationLog.objects.filter(
-            created_at__gte=week_ago
-        ).values('provider__name').annotate(
-            avg_response_time=Avg('response_time'),
-            std_response_time=StdDev('response_time'),
-            success_rate=Avg('success')
-        )
+        return volatility if volatility is not None else 0.1  # Volatilidade baixa se não há dados
         
-        if not recent_logs:
-            return 0.1  # Volatilidade baixa se não há dados
+    except Exception as e:
+        logger.error(f"Error calculating market volatility: {str(e)}")
+        return 0.1  # Default baixa volatilidade
+
+
+@shared_task
+def process_kyc_webhook_partition(partition: int):
+    """
+    Drena os KYCWebhookEvent pendentes de uma partição (fila kyc_webhooks.<n>)
+    em lotes, até esvaziar ou estourar o orçamento de tempo
+    """
+    import time
+    from ..services import kyc_webhooks
+    
+    deadline = time.monotonic() + getattr(settings, 'KYC_WEBHOOK_TIME_BUDGET_SECONDS', 60)
+    totals = {'fetched': 0, 'processed': 0, 'failed': 0, 'deferred': 0}
+    
+    try:
+        while True:
+            counts = kyc_webhooks.process_batch(partition, WEBHOOK_HANDLERS)
+            for key, value in counts.items():
+                totals[key] += value
+            
+            if counts['fetched'] == 0:
+                break
+            if time.monotonic() >= deadline:
+                # Sobrou trabalho: continua numa nova execução, sem janela
+                kyc_webhooks.schedule_partition(partition, countdown=0)
+                break
         
-        # Calcular volatilidade baseada em:
-        # 1. Variação do tempo de resposta
-        # 2. Variação da taxa de sucesso
-        volatilities = []
+        if totals['fetched']:
+            logger.info(f"Webhook partition {partition}: {totals}")
+        return {'success': True, 'partition': partition, **totals}
         
-        for log in recent_logs:
-            if log['std_response_time'] and log['avg_response_time']:
-                time_volatility = log['std_response_time'] / log['avg_response_time']
-                volatilities.append(min(time_volatility, 1.0))
+    except Exception as exc:
+        logger.error(f"Webhook partition {partition} processing failed: {str(exc)}")
+        return {'success': False, 'partition': partition, 'error': str(exc)}
+
+
+@shared_task
+def sweep_kyc_webhook_events():
+    """
+    Reagenda partições com eventos vencidos: retries após backoff e
+    agendamentos perdidos (broker fora do ar no momento da ingestão)
+    """
+    from ..services import kyc_webhooks
+    
+    try:
+        partitions = kyc_webhooks.pending_partitions()
+        for partition in partitions:
+            kyc_webhooks.schedule_partition(partition, countdown=0)
+        return {'success': True, 'partitions': partitions}
         
-        return sum(volatilities) / len(volatilities) if volatilities else 0.1
+    except Exception as exc:
+        logger.error(f"Webhook sweep failed: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
+
+
+@shared_task
+def prune_kyc_webhook_events():
+    """
+    Retenção dos KYCWebhookEvent processados (janela de deduplicação)
+    """
+    from datetime import timedelta
+    from ..models import KYCWebhookEvent
+    from ..services.chunked_maintenance import run_chunked
+    
+    days = getattr(settings, 'KYC_WEBHOOK_EVENT_RETENTION_DAYS', 30)
+    try:
+        result = run_chunked(
+            'kyc.prune_webhook_events',
+            KYCWebhookEvent.objects.filter(
+                status=KYCWebhookEvent.STATUS_PROCESSED,
+                received_at__lt=timezone.now() - timedelta(days=days)
+            ),
+            delete=True
+        )
+        if not result['completed']:
+            prune_kyc_webhook_events.delay()
+        return {'success': True, 'deleted': result['processed'], 'completed': result['completed']}
         
-    except Exception as e:
-        logger.error(f"Error calculating market volatility: {str(e)}")
-        return 0.1  # Default baixa volatilidade
+    except Exception as exc:
+        logger.error(f"Webhook event pruning failed: {str(exc)}")
+        return {'success': False, 'error': str(exc)}
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
@@ -715,8 +906,8 @@ def process_sdk_kyc_result(self, user_id: int, provider: str, result_data: Dict[
         }
 
 
-def process_idwall_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Processa webhook específico do Idwall"""
+def process_idwall_webhook(webhook_data: Dict[str, Any], document: Optional[KYCDocument] = None) -> Dict[str, Any]:
+    """Processa webhook específico do Idwall (document pré-carregado pelo lote, se houver)"""
     try:
         # Exemplo de estrutura webhook Idwall
         verification_id = webhook_data.get('verification_id')
@@ -724,13 +915,14 @@ def process_idwall_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         result = webhook_data.get('result', {})
         
         # Buscar documento relacionado
-        try:
-            document = KYCDocument.objects.get(
-                provider_response__verification_id=verification_id
-            )
-        except KYCDocument.DoesNotExist:
-            logger.error(f"Document not found for Idwall verification {verification_id}")
-            return {'success': False, 'error': 'Document not found'}
+        if document is None:
+            try:
+                document = KYCDocument.objects.get(
+                    provider_response__verification_id=verification_id
+                )
+            except KYCDocument.DoesNotExist:
+                logger.error(f"Document not found for Idwall verification {verification_id}")
+                return {'success': False, 'error': 'Document not found'}
         
         # Atualizar status baseado no webhook
         if status == 'approved':
@@ -748,7 +940,8 @@ def process_idwall_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         
         # Trigger profile update se aprovado
         if status == 'approved':
-            trigger_profile_update.delay(document.user.id)
+            user_id = document.user_id
+            transaction.on_commit(lambda: trigger_profile_update.delay(user_id))
         
         logger.info(f"Idwall webhook processed successfully for document {document.id}")
         return {'success': True, 'document_id': str(document.id)}
@@ -758,8 +951,8 @@ def process_idwall_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         raise
 
 
-def process_stripe_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Processa webhook específico do Stripe Identity"""
+def process_stripe_webhook(webhook_data: Dict[str, Any], document: Optional[KYCDocument] = None) -> Dict[str, Any]:
+    """Processa webhook específico do Stripe Identity (document pré-carregado pelo lote, se houver)"""
     try:
         event_type = webhook_data.get('type')
         data = webhook_data.get('data', {}).get('object', {})
@@ -768,13 +961,14 @@ def process_stripe_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
             session_id = data.get('id')
             
             # Buscar documento relacionado
-            try:
-                document = KYCDocument.objects.get(
-                    provider_response__session_id=session_id
-                )
-            except KYCDocument.DoesNotExist:
-                logger.error(f"Document not found for Stripe session {session_id}")
-                return {'success': False, 'error': 'Document not found'}
+            if document is None:
+                try:
+                    document = KYCDocument.objects.get(
+                        provider_response__session_id=session_id
+                    )
+                except KYCDocument.DoesNotExist:
+                    logger.error(f"Document not found for Stripe session {session_id}")
+                    return {'success': False, 'error': 'Document not found'}
             
             # Atualizar com dados do Stripe
             document.status = 'approved'
@@ -784,7 +978,8 @@ def process_stripe_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
             document.save()
             
             # Trigger profile update
-            trigger_profile_update.delay(document.user.id)
+            user_id = document.user_id
+            transaction.on_commit(lambda: trigger_profile_update.delay(user_id))
             
             logger.info(f"Stripe webhook processed successfully for document {document.id}")
             return {'success': True, 'document_id': str(document.id)}
@@ -793,17 +988,19 @@ def process_stripe_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
             # Documento rejeitado ou precisa revisão
             session_id = data.get('id')
             
-            try:
-                document = KYCDocument.objects.get(
-                    provider_response__session_id=session_id
-                )
-                document.status = 'manual_review'
-                document.provider_response.update(webhook_data)
-                document.save()
-                
-                return {'success': True, 'document_id': str(document.id)}
-            except KYCDocument.DoesNotExist:
-                return {'success': False, 'error': 'Document not found'}
+            if document is None:
+                try:
+                    document = KYCDocument.objects.get(
+                        provider_response__session_id=session_id
+                    )
+                except KYCDocument.DoesNotExist:
+                    return {'success': False, 'error': 'Document not found'}
+            
+            document.status = 'manual_review'
+            document.provider_response.update(webhook_data)
+            document.save()
+            
+            return {'success': True, 'document_id': str(document.id)}
         
         return {'success': True, 'message': f'Stripe event {event_type} processed'}
         
@@ -812,7 +1009,7 @@ def process_stripe_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         raise
 
 
-def process_unico_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
+def process_unico_webhook(webhook_data: Dict[str, Any], document: Optional[KYCDocument] = None) -> Dict[str, Any]:
     """Processa webhook específico do Unico"""
     try:
         # Implementar lógica específica do Unico
@@ -825,30 +1022,44 @@ def process_unico_webhook(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         raise
 
 
+# Handlers por provedor de process_kyc_webhook_partition (após as definições acima)
+WEBHOOK_HANDLERS = {
+    'idwall': process_idwall_webhook,
+    'stripe': process_stripe_webhook,
+    'unico': process_unico_webhook,
+}
+
+
 @shared_task
 def cleanup_expired_verifications():
     """
     Limpa verificações expiradas (task periódica)
+    Lotes via run_chunked; reenfileira a si mesma se o orçamento de tempo acabar
     """
     try:
         from datetime import timedelta
+        from ..services.chunked_maintenance import run_chunked
         
         expiry_date = timezone.now() - timedelta(days=settings.KYC_VERIFICATION_TIMEOUT_DAYS)
         
         # Documentos pendentes por muito tempo
-        expired_docs = KYCDocument.objects.filter(
-            status='pending',
-            uploaded_at__lt=expiry_date
+        result = run_chunked(
+            'kyc.expire_documents',
+            KYCDocument.objects.filter(
+                status=VerificationStatus.PENDING,
+                uploaded_at__lt=expiry_date
+            ),
+            update={
+                'status': VerificationStatus.EXPIRED,
+                'rejection_reason': 'Verification timeout'
+            }
         )
         
-        count = expired_docs.count()
-        expired_docs.update(
-            status='expired',
-            rejection_reason='Verification timeout'
-        )
+        if not result['completed']:
+            cleanup_expired_verifications.delay()
         
-        logger.info(f"Cleaned up {count} expired KYC documents")
-        return {'success': True, 'cleaned_documents': count}
+        logger.info(f"Cleaned up {result['processed']} expired KYC documents")
+        return {'success': True, 'cleaned_documents': result['processed'], 'completed': result['completed']}
         
     except Exception as exc:
         logger.error(f"Error cleaning up expired verifications: {str(exc)}")
@@ -5,116 +5,42 @@ Tasks assíncronas para o sistema de mensageria e notificações.
 import json
 from celery import shared_task
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
-from .models import SystemNotification, NotificationPreferences
+from .models import SystemNotification
+from .services import notification_dispatch
+from .services.notification_fanout import fan_out_message
 
 User = get_user_model()
 
 
-@shared_task
-def send_email_notification(notification_id):
-    """
-    Envia notificação por email.
-    """
+def _deliver_single(notification_id, channel):
+    """Entrega avulsa de uma notificação por um canal (mesmo caminho dos lotes)."""
     try:
-        notification = SystemNotification.objects.get(id=notification_id)
-        user = notification.user
-        
-        # Verificar preferências do usuário
-        try:
-            prefs = user.notification_preferences
-            if not prefs.messages_email and notification.notification_type == 'message':
-                return {'status': 'skipped', 'reason': 'email disabled for messages'}
-            # Adicionar outras verificações conforme necessário
-        except NotificationPreferences.DoesNotExist:
-            pass  # Usar configurações padrão
-        
-        # Preparar dados do email
-        context = {
-            'user': user,
-            'notification': notification,
-            'site_url': getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
-        }
-        
-        # Renderizar templates
-        subject = f"GalaxIA - {notification.title}"
-        html_message = render_to_string('emails/notification.html', context)
-        text_message = render_to_string('emails/notification.txt', context)
-        
-        # Enviar email
-        send_mail(
-            subject=subject,
-            message=text_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False
-        )
-        
-        # Marcar como enviado
-        notification.sent_email = True
-        notification.save(update_fields=['sent_email'])
-        
-        return {'status': 'sent', 'email': user.email}
-        
+        notification = SystemNotification.objects.select_related('user').get(id=notification_id)
+        sent = notification_dispatch.deliver(channel, [notification])
+        if not sent:
+            return {'status': 'skipped', 'reason': f'no {channel} destination'}
+        return {'status': 'sent', 'user_id': str(notification.user_id)}
     except SystemNotification.DoesNotExist:
         return {'status': 'error', 'message': 'Notification not found'}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task
+def send_email_notification(notification_id):
+    """
+    Envia notificação por email.
+    """
+    return _deliver_single(notification_id, 'email')
+
+
 @shared_task
 def send_push_notification(notification_id):
     """
-    Envia notificação push (via WebSocket e/ou serviços push externos).
+    Envia notificação push (via WebSocket).
     """
-    try:
-        notification = SystemNotification.objects.get(id=notification_id)
-        user = notification.user
-        
-        # Verificar preferências do usuário
-        try:
-            prefs = user.notification_preferences
-            if not prefs.messages_push and notification.notification_type == 'message':
-                return {'status': 'skipped', 'reason': 'push disabled for messages'}
-        except NotificationPreferences.DoesNotExist:
-            pass
-        
-        # Enviar via WebSocket
-        channel_layer = get_channel_layer()
-        notification_group = f'notifications_{user.id}'
-        
-        notification_data = {
-            'type': 'notification_broadcast',
-            'notification': {
-                'id': str(notification.id),
-                'type': notification.notification_type,
-                'title': notification.title,
-                'message': notification.message,
-                'priority': notification.priority,
-                'created_at': notification.created_at.isoformat(),
-                'action_url': notification.action_url,
-                'data': notification.data
-            }
-        }
-        
-        async_to_sync(channel_layer.group_send)(notification_group, notification_data)
-        
-        # Marcar como enviado
-        notification.sent_push = True
-        notification.save(update_fields=['sent_push'])
-        
-        return {'status': 'sent', 'user_id': str(user.id)}
-        
-    except SystemNotification.DoesNotExist:
-        return {'status': 'error', 'message': 'Notification not found'}
-    except Exception as e:
-        return {'status': 'error', 'message': str(e)}
+    return _deliver_single(notification_id, 'push')
 
 
 @shared_task
@@ -122,196 +48,146 @@ def send_sms_notification(notification_id):
     """
     Envia notificação por SMS (integração com Twilio, AWS SNS, etc).
     """
+    return _deliver_single(notification_id, 'sms')
+
+
+@shared_task(bind=True, max_retries=3)
+def fan_out_message_notifications(self, message_id):
+    """
+    Cria e publica as notificações de uma nova mensagem (fora do request).
+    """
+    from .models import MessageConversation
+    
     try:
-        notification = SystemNotification.objects.get(id=notification_id)
-        user = notification.user
-        
-        # Verificar preferências do usuário
-        try:
-            prefs = user.notification_preferences
-            if not prefs.messages_sms and notification.notification_type == 'message':
-                return {'status': 'skipped', 'reason': 'sms disabled for messages'}
-        except NotificationPreferences.DoesNotExist:
-            pass
-        
-        # Verificar se usuário tem telefone
-        if not hasattr(user, 'phone_number') or not user.phone_number:
-            return {'status': 'skipped', 'reason': 'no phone number'}
-        
-        # TODO: Implementar integração com provedor SMS
-        # Exemplo com Twilio:
-        # from twilio.rest import Client
-        # client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        # message = client.messages.create(
-        #     body=f"{notification.title}: {notification.message}",
-        #     from_=settings.TWILIO_PHONE_NUMBER,
-        #     to=user.phone_number
-        # )
-        
-        # Por enquanto, apenas simular o envio
-        print(f"SMS enviado para {user.phone_number}: {notification.title}")
-        
-        # Marcar como enviado
-        notification.sent_sms = True
-        notification.save(update_fields=['sent_sms'])
-        
-        return {'status': 'sent', 'phone': user.phone_number}
-        
-    except SystemNotification.DoesNotExist:
-        return {'status': 'error', 'message': 'Notification not found'}
+        result = fan_out_message(message_id)
+        return {'status': 'processed', **result}
+    except MessageConversation.DoesNotExist:
+        return {'status': 'error', 'message': 'Message not found'}
     except Exception as e:
-        return {'status': 'error', 'message': str(e)}
+        raise self.retry(exc=e, countdown=10 * (2 ** self.request.retries))
 
 
 @shared_task
 def process_notification(notification_id):
     """
-    Processa uma notificação, enviando pelos canais apropriados.
+    Resolve os canais de uma notificação e a coloca nas filas de entrega.
     """
     try:
         notification = SystemNotification.objects.get(id=notification_id)
-        user = notification.user
-        
-        # Obter preferências do usuário
-        try:
-            prefs = user.notification_preferences
-        except NotificationPreferences.DoesNotExist:
-            # Criar preferências padrão
-            prefs = NotificationPreferences.objects.create(user=user)
-        
-        results = []
-        
-        # Verificar canais de notificação baseados no tipo
-        notification_type = notification.notification_type
-        
-        # Email
-        should_send_email = False
-        if notification_type == 'message' and prefs.messages_email:
-            should_send_email = True
-        elif notification_type in ['payment_received', 'payment_sent'] and prefs.payments_email:
-            should_send_email = True
-        elif notification_type in ['project_update'] and prefs.project_updates_email:
-            should_send_email = True
-        elif notification_type in ['proposal_received', 'proposal_accepted', 'proposal_rejected'] and prefs.proposals_email:
-            should_send_email = True
-        elif notification_type == 'system' and prefs.system_email:
-            should_send_email = True
-        
-        if should_send_email:
-            send_email_notification.delay(notification_id)
-            results.append('email_queued')
-        
-        # Push
-        should_send_push = False
-        if notification_type == 'message' and prefs.messages_push:
-            should_send_push = True
-        elif notification_type in ['payment_received', 'payment_sent'] and prefs.payments_push:
-            should_send_push = True
-        elif notification_type in ['project_update'] and prefs.project_updates_push:
-            should_send_push = True
-        elif notification_type in ['proposal_received', 'proposal_accepted', 'proposal_rejected'] and prefs.proposals_push:
-            should_send_push = True
-        elif notification_type == 'system' and prefs.system_push:
-            should_send_push = True
-        
-        if should_send_push:
-            send_push_notification.delay(notification_id)
-            results.append('push_queued')
-        
-        # SMS (apenas para notificações urgentes ou de pagamento)
-        should_send_sms = False
-        if notification.priority == 'urgent':
-            should_send_sms = True
-        elif notification_type in ['payment_received', 'payment_sent'] and prefs.payments_sms:
-            should_send_sms = True
-        
-        if should_send_sms:
-            send_sms_notification.delay(notification_id)
-            results.append('sms_queued')
-        
-        return {'status': 'processed', 'channels': results}
-        
+        counts = notification_dispatch.dispatch([notification])
+        return {'status': 'processed', 'channels': counts}
     except SystemNotification.DoesNotExist:
         return {'status': 'error', 'message': 'Notification not found'}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task
+def deliver_notification_channel(channel):
+    """
+    Drena a fila de entregas pendentes de um canal em lotes.
+    """
+    notification_dispatch.release_drain(channel)
+    counts = notification_dispatch.drain(channel)
+    
+    if counts['remaining']:
+        # Falha no lote: espera antes de tentar de novo; senão continua no próximo segundo
+        notification_dispatch.schedule_drain(channel, countdown=30 if counts['failed'] else 1)
+    
+    return {'status': 'processed', 'channel': channel, **counts}
+
+
+@shared_task
+def sweep_notification_backlogs():
+    """
+    Devolve à fila lotes de workers que morreram no meio da entrega e
+    reagenda o dreno de canais com entregas pendentes (agendamento perdido).
+    """
+    scheduled = []
+    for channel in notification_dispatch.CHANNELS:
+        notification_dispatch.recover_stalled(channel)
+        if notification_dispatch.backlog(channel):
+            notification_dispatch.schedule_drain(channel)
+            scheduled.append(channel)
+    return {'status': 'completed', 'channels': scheduled}
+
+
 @shared_task
 def cleanup_old_notifications():
     """
-    Limpeza periódica de notificações antigas.
+    Limpeza periódica de notificações antigas (em lotes).
     """
     from datetime import timedelta
     from django.utils import timezone
+    from .services.chunked_maintenance import run_chunked
     
     # Deletar notificações lidas mais antigas que 30 dias
     cutoff_date = timezone.now() - timedelta(days=30)
     
-    deleted_count = SystemNotification.objects.filter(
-        read=True,
-        created_at__lt=cutoff_date
-    ).delete()[0]
+    result = run_chunked(
+        'notifications.cleanup_old',
+        SystemNotification.objects.filter(
+            read=True,
+            created_at__lt=cutoff_date
+        ),
+        delete=True
+    )
+    
+    if not result['completed']:
+        cleanup_old_notifications.delay()
     
-    return {'status': 'completed', 'deleted_count': deleted_count}
+    return {
+        'status': 'completed' if result['completed'] else 'partial',
+        'deleted_count': result['processed']
+    }
 
 
 @shared_task
-def send_digest_notifications():
+def send_digest_notifications(frequency='daily'):
     """
     Envia resumos de notificações para usuários com preferência de email diário/semanal.
+    Cada shard de usuários roda numa subtask com checkpoint próprio.
     """
-    from datetime import timedelta
-    from django.utils import timezone
-    from django.db.models import Count
+    from .services import notification_digest
+    
+    if frequency not in notification_digest.PERIODS:
+        return {'status': 'error', 'message': f'Unsupported digest frequency: {frequency}'}
     
-    now = timezone.now()
+    window = notification_digest.window(frequency)
+    window_end = window['end'].isoformat()
+    for shard in range(notification_digest.shard_count()):
+        send_digest_shard.delay(frequency, window_end, shard)
+    
+    notification_digest.prune_checkpoints()
+    
+    return {
+        'status': 'scheduled',
+        'frequency': frequency,
+        'window_end': window_end,
+        'shards': notification_digest.shard_count()
+    }
+
+
+@shared_task(soft_time_limit=420, time_limit=480)
+def send_digest_shard(frequency, window_end, shard):
+    """
+    Envia os resumos de um shard; estourando o orçamento de tempo (ou o soft
+    limit, acima do orçamento), reenfileira e retoma do checkpoint.
+    """
+    from django.utils.dateparse import parse_datetime
+    from .services import notification_digest
     
-    # Usuários com preferência de resumo diário
-    daily_users = User.objects.filter(
-        notification_preferences__email_frequency='daily'
-    ).select_related('notification_preferences')
+    result = notification_digest.send_shard(frequency, parse_datetime(window_end), shard)
     
-    for user in daily_users:
-        # Notificações não lidas das últimas 24 horas
-        yesterday = now - timedelta(days=1)
-        unread_notifications = SystemNotification.objects.filter(
-            user=user,
-            read=False,
-            created_at__gte=yesterday
-        ).order_by('-created_at')
-        
-        if unread_notifications.exists():
-            # Agrupar por tipo
-            notifications_by_type = {}
-            for notif in unread_notifications:
-                notif_type = notif.get_notification_type_display()
-                if notif_type not in notifications_by_type:
-                    notifications_by_type[notif_type] = []
-                notifications_by_type[notif_type].append(notif)
-            
-            # Enviar email resumo
-            context = {
-                'user': user,
-                'notifications_by_type': notifications_by_type,
-                'total_count': unread_notifications.count(),
-                'site_url': getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
-            }
-            
-            subject = f"GalaxIA - Resumo diário ({unread_notifications.count()} notificações)"
-            html_message = render_to_string('emails/daily_digest.html', context)
-            text_message = render_to_string('emails/daily_digest.txt', context)
-            
-            send_mail(
-                subject=subject,
-                message=text_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=True
-            )
+    if not result['completed']:
+        send_digest_shard.delay(frequency, window_end, shard)
     
-    return {'status': 'completed', 'processed_users': daily_users.count()}
+    return {
+        'status': 'completed' if result['completed'] else 'partial',
+        'frequency': frequency,
+        'shard': shard,
+        'sent': result['sent']
+    }
 
 
 # Função auxiliar para criar notificações
@@ -327,8 +203,8 @@ def create_notification(user, notification_type, title, message, **kwargs):
         **kwargs
     )
     
-    # Processar notificação de forma assíncrona
-    process_notification.delay(notification.id)
+    # Canais resolvidos uma vez após o commit; entrega em lotes por canal
+    notification_dispatch.dispatch_on_commit([notification])
     
     return notification
 
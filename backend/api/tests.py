@@ -1,3 +1,17 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+
+class TaskImportTests(SimpleTestCase):
+    """Importar api.tasks é o que o autodiscover do Celery faz no worker"""
+
+    def test_tasks_package_imports(self):
+        import api.tasks
+
+        for name in api.tasks.__all__:
+            self.assertTrue(hasattr(api.tasks, name), name)
+
+    def test_webhook_handlers_cover_providers(self):
+        from api.tasks.kyc_tasks import WEBHOOK_HANDLERS
+
+        self.assertEqual(set(WEBHOOK_HANDLERS), {'idwall', 'stripe', 'unico'})
+        self.assertTrue(all(callable(handler) for handler in WEBHOOK_HANDLERS.values()))
@@ -5,14 +5,15 @@ Dashboard views para monitoramento do sistema KYC multi-provider
 import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db.models import Avg, Sum, Count
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.core.cache import cache
 
-from ..models import KYCProviderStats, VerificationLog, KYCProviderConfig
+from ..models import KYCProviderStats, KYCProviderConfig
+from ..services import kyc_health
 from ..services.kyc_router import kyc_router
+from ..services.kyc_analytics import KYCAnalyticsService
 
 logger = logging.getLogger(__name__)
 
@@ -116,62 +117,17 @@ def kyc_routing_analytics(request):
         days = int(request.GET.get('days', 7))
         since = timezone.now() - timedelta(days=days)
         
-        # Análise de roteamento por dia
-        daily_routing = []
-        
-        for i in range(days):
-            day_start = since + timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            
-            day_logs = VerificationLog.objects.filter(
-                created_at__gte=day_start,
-                created_at__lt=day_end
-            )
-            
-            if day_logs.exists():
-                daily_data = day_logs.values('provider__name').annotate(
-                    count=Count('id'),
-                    success_rate=Avg('success'),
-                    avg_cost=Avg('cost'),
-                    avg_response_time=Avg('response_time')
-                )
-                
-                daily_routing.append({
-                    'date': day_start.date().isoformat(),
-                    'providers': list(daily_data)
-                })
-        
-        # Análise de custos por hora do dia
-        hourly_costs = []
-        for hour in range(24):
-            hour_logs = VerificationLog.objects.filter(
-                created_at__gte=since,
-                created_at__hour=hour
-            )
-            
-            if hour_logs.exists():
-                hourly_costs.append({
-                    'hour': hour,
-                    'total_cost': hour_logs.aggregate(Sum('cost'))['cost__sum'] or 0,
-                    'avg_response_time': hour_logs.aggregate(Avg('response_time'))['response_time__avg'] or 0
-                })
-        
-        # Performance por tipo de verificação
-        verification_types = VerificationLog.objects.filter(
-            created_at__gte=since
-        ).values('verification_type').annotate(
-            count=Count('id'),
-            success_rate=Avg('success'),
-            avg_cost=Avg('cost')
-        )
+        # Cada breakdown é uma query agrupada sobre o rollup horário
+        totals = KYCAnalyticsService.totals(since)
         
         return Response({
             'period': f'Last {days} days',
-            'daily_routing': daily_routing,
-            'hourly_costs': hourly_costs,
-            'verification_types': list(verification_types),
-            'routing_efficiency': calculate_routing_efficiency(since),
-            'cost_savings': calculate_cost_savings(since)
+            'daily_routing': KYCAnalyticsService.daily_routing(since),
+            'hourly_costs': KYCAnalyticsService.hourly_costs(since),
+            'verification_types': KYCAnalyticsService.verification_types(since),
+            'latency_percentiles': KYCAnalyticsService.latency_percentiles(since),
+            'routing_efficiency': KYCAnalyticsService.routing_efficiency(totals),
+            'cost_savings': KYCAnalyticsService.cost_savings(totals)
         })
         
     except Exception as e:
@@ -222,6 +178,8 @@ def adjust_kyc_settings(request):
                 except KYCProviderStats.DoesNotExist:
                     logger.warning(f"Provider {provider_name} not found")
         
+        kyc_router.invalidate_snapshot()
+        
         return Response({
             'success': True,
             'current_epsilon': kyc_router.epsilon,
@@ -237,15 +195,7 @@ def get_routing_history():
     """Obtém histórico de roteamento das últimas 24h"""
     try:
         last_24h = timezone.now() - timedelta(hours=24)
-        
-        routing_data = VerificationLog.objects.filter(
-            created_at__gte=last_24h
-        ).values('provider__name').annotate(
-            count=Count('id'),
-            success_rate=Avg('success')
-        ).order_by('-count')
-        
-        return list(routing_data)
+        return KYCAnalyticsService.by_provider(last_24h)
         
     except Exception:
         return []
@@ -277,16 +227,9 @@ def get_cost_analysis(stats):
 
 
 def get_provider_health(provider_name):
-    """Obtém status de saúde do provedor"""
+    """Obtém status de saúde do provedor (gravado por kyc_provider_health_check)"""
     try:
-        cache_key = f'provider_health_{provider_name}'
-        health = cache.get(cache_key)
-        
-        if health is None:
-            # Se não há cache, assumir saudável
-            health = {'status': 'unknown', 'last_check': 'never'}
-        
-        return health
+        return kyc_health.get_health(provider_name)
         
     except Exception:
         return {'status': 'error'}
@@ -295,29 +238,7 @@ def get_provider_health(provider_name):
 def calculate_routing_efficiency(since):
     """Calcula eficiência do roteamento inteligente"""
     try:
-        logs = VerificationLog.objects.filter(created_at__gte=since)
-        
-        if not logs.exists():
-            return {'efficiency': 0, 'note': 'No data available'}
-        
-        # Métricas de eficiência
-        total_cost = logs.aggregate(Sum('cost'))['cost__sum'] or 0
-        total_successes = logs.filter(success=True).count()
-        avg_response_time = logs.aggregate(Avg('response_time'))['response_time__avg'] or 0
-        
-        # Score de eficiência (simplificado)
-        cost_efficiency = total_successes / max(total_cost, 0.01)
-        time_efficiency = 1 / max(avg_response_time, 1)
-        
-        efficiency_score = (cost_efficiency * 0.7 + time_efficiency * 0.3)
-        
-        return {
-            'efficiency_score': min(efficiency_score, 1.0),
-            'total_cost': total_cost,
-            'total_successes': total_successes,
-            'avg_response_time': avg_response_time
-        }
-        
+        return KYCAnalyticsService.routing_efficiency(KYCAnalyticsService.totals(since))
     except Exception as e:
         return {'efficiency': 0, 'error': str(e)}
 
@@ -325,30 +246,6 @@ def calculate_routing_efficiency(since):
 def calculate_cost_savings(since):
     """Calcula economia gerada pelo roteamento inteligente"""
     try:
-        # Comparar custo real vs custo se fosse sempre o provedor mais caro
-        logs = VerificationLog.objects.filter(created_at__gte=since)
-        
-        if not logs.exists():
-            return {'savings': 0}
-        
-        actual_cost = logs.aggregate(Sum('cost'))['cost__sum'] or 0
-        
-        # Simular custo se usasse sempre o provedor mais caro
-        highest_cost_provider = KYCProviderStats.objects.order_by('-cost_per_ok').first()
-        if highest_cost_provider:
-            simulated_cost = logs.count() * highest_cost_provider.cost_per_ok
-            savings = max(0, simulated_cost - actual_cost)
-            savings_percentage = (savings / max(simulated_cost, 0.01)) * 100
-        else:
-            savings = 0
-            savings_percentage = 0
-        
-        return {
-            'actual_cost': actual_cost,
-            'simulated_cost': simulated_cost if 'simulated_cost' in locals() else 0,
-            'savings_amount': savings,
-            'savings_percentage': savings_percentage
-        }
-        
+        return KYCAnalyticsService.cost_savings(KYCAnalyticsService.totals(since))
     except Exception as e:
-        return {'savings': 0, 'error': str(e)}
\ No newline at end of file
+        return {'savings': 0, 'error': str(e)}
@@ -1,6 +1,10 @@
 """
 Views para processamento de webhooks de provedores KYC
 Seguindo padrões de segurança e validação HMAC
+
+As views só validam a assinatura e persistem o evento bruto (deduplicado por
+provider + event_id) antes de responder 200; o processamento roda nas filas
+particionadas de services/kyc_webhooks.py.
 """
 
 import hashlib
@@ -20,7 +24,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from ..tasks.kyc_tasks import process_kyc_webhook
+from ..services import kyc_webhooks
 
 logger = logging.getLogger(__name__)
 
@@ -56,18 +60,18 @@ class IdwallWebhookView(View):
                 logger.error(f"Invalid JSON in Idwall webhook: {str(e)}")
                 return HttpResponseBadRequest("Invalid JSON")
             
-            # Log webhook recebido
-            logger.info(f"Received Idwall webhook: {webhook_data.get('event_type', 'unknown')}")
-            
-            # Processar assincronamente
-            process_kyc_webhook.delay(webhook_data, provider='idwall')
+            # Persistir evento bruto (duplicatas também recebem 200)
+            event, created = kyc_webhooks.ingest('idwall', payload, webhook_data)
+            if created:
+                logger.info(f"Received Idwall webhook: {event.event_type or 'unknown'} ({event.event_id})")
             
             # Responder imediatamente para o Idwall
             return HttpResponse("OK", status=200)
             
         except Exception as exc:
+            # 5xx para o Idwall reenviar: o evento não foi persistido
             logger.error(f"Error processing Idwall webhook: {str(exc)}")
-            return HttpResponseBadRequest("Internal error")
+            return HttpResponse("Internal error", status=500)
     
     def validate_signature(self, payload: bytes, signature: str) -> bool:
         """
@@ -123,16 +127,15 @@ class UnicoWebhookView(View):
                 logger.error(f"Invalid JSON in Unico webhook: {str(e)}")
                 return HttpResponseBadRequest("Invalid JSON")
             
-            logger.info(f"Received Unico webhook: {webhook_data.get('event', 'unknown')}")
-            
-            # Processar assincronamente
-            process_kyc_webhook.delay(webhook_data, provider='unico')
+            event, created = kyc_webhooks.ingest('unico', payload, webhook_data)
+            if created:
+                logger.info(f"Received Unico webhook: {event.event_type or 'unknown'} ({event.event_id})")
             
             return HttpResponse("OK", status=200)
             
         except Exception as exc:
             logger.error(f"Error processing Unico webhook: {str(exc)}")
-            return HttpResponseBadRequest("Internal error")
+            return HttpResponse("Internal error", status=500)
     
     def validate_signature(self, payload: bytes, signature: str) -> bool:
         """Valida assinatura HMAC do Unico"""
@@ -191,11 +194,11 @@ def stripe_identity_webhook(request):
             logger.debug(f"Ignoring non-identity Stripe event: {event_type}")
             return Response({'status': 'ignored'}, status=200)
         
-        logger.info(f"Received Stripe Identity webhook: {event_type}")
-        
-        # Processar assincronamente
-        process_kyc_webhook.delay(webhook_data, provider='stripe')
+        event, created = kyc_webhooks.ingest('stripe', payload, webhook_data)
+        if not created:
+            return Response({'status': 'duplicate'}, status=200)
         
+        logger.info(f"Received Stripe Identity webhook: {event_type} ({event.event_id})")
         return Response({'status': 'ok'}, status=200)
         
     except Exception as exc:
@@ -311,7 +314,7 @@ def test_webhook_endpoint(request):
         logger.info(f"Test webhook received for provider: {provider}")
         
         # Processar como webhook real
-        process_kyc_webhook.delay(payload, provider=provider)
+        kyc_webhooks.ingest(provider, request.body, payload)
         
         return HttpResponse("Test webhook processed", status=200)
         
@@ -330,39 +333,19 @@ class WebhookMetricsView(View):
             return HttpResponseBadRequest("Unauthorized")
         
         try:
-            from ..models import VerificationLog
             from datetime import timedelta
             from django.utils import timezone
-            from django.db.models import Count, Avg
+            from ..services.kyc_analytics import KYCAnalyticsService
             
-            # Métricas dos últimos 7 dias
+            # Métricas dos últimos 7 dias (rollup horário)
             week_ago = timezone.now() - timedelta(days=7)
+            totals = KYCAnalyticsService.totals(week_ago)
             
             metrics = {
-                'total_webhooks_7d': VerificationLog.objects.filter(
-                    created_at__gte=week_ago
-                ).count(),
-                
-                'success_rate_7d': VerificationLog.objects.filter(
-                    created_at__gte=week_ago
-                ).aggregate(
-                    success_rate=Avg('success')
-                )['success_rate'] or 0,
-                
-                'avg_response_time_7d': VerificationLog.objects.filter(
-                    created_at__gte=week_ago
-                ).aggregate(
-                    avg_time=Avg('response_time')
-                )['avg_time'] or 0,
-                
-                'by_provider_7d': list(
-                    VerificationLog.objects.filter(
-                        created_at__gte=week_ago
-                    ).values('provider__name').annotate(
-                        count=Count('id'),
-                        success_rate=Avg('success')
-                    )
-                )
+                'total_webhooks_7d': totals['count'],
+                'success_rate_7d': totals['success_rate'],
+                'avg_response_time_7d': totals['avg_response_time'],
+                'by_provider_7d': KYCAnalyticsService.by_provider(week_ago)
             }
             
             return HttpResponse(
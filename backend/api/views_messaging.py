@@ -2,23 +2,34 @@
 Views para o sistema de mensageria e notificações.
 """
 
-from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Max, Prefetch
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.urls import replace_query_param
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+import base64
 import json
+import uuid
+from datetime import datetime
 
 from .models import (
     Conversation, 
+    ConversationReadState,
     MessageConversation, 
     SystemNotification, 
     NotificationPreferences
 )
+from .services import conversation_access, messaging_counters, read_cursors, ws_delivery
+from .tasks_messaging import fan_out_message_notifications
 from .serializers_messaging import (
     ConversationSerializer,
     MessageConversationSerializer,
@@ -36,25 +47,170 @@ class MessagingPagination(PageNumberPagination):
     max_page_size = 100
 
 
+def encode_cursor(*values):
+    """Cursor opaco (base64 de JSON) com a chave de ordenação"""
+    payload = [v.isoformat() if isinstance(v, datetime) else (str(v) if v is not None else None) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """Decodifica um cursor de encode_cursor; datas ISO voltam como datetime"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return [parse_datetime(v) if isinstance(v, str) and parse_datetime(v) else v for v in values]
+    except (ValueError, TypeError):
+        raise ValidationError({'cursor': 'Cursor inválido'})
+
+
+class KeysetPagination(BasePagination):
+    """Base das paginações por chave: tamanho de página limitado por max_page_size"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+
+class ConversationKeysetPagination(KeysetPagination):
+    """
+    Paginação por chave (last_message_at DESC NULLS LAST, id DESC).
+    O custo de cada página não depende da profundidade; conversas sem
+    mensagens vêm por último, ordenadas por id.
+    """
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(F('last_message_at').desc(nulls_last=True), '-id')
+        
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            last_message_at, pk = decode_cursor(cursor, 2)
+            if last_message_at is None:
+                queryset = queryset.filter(last_message_at__isnull=True, id__lt=pk)
+            else:
+                queryset = queryset.filter(
+                    Q(last_message_at__lt=last_message_at) |
+                    Q(last_message_at=last_message_at, id__lt=pk) |
+                    Q(last_message_at__isnull=True)
+                )
+        
+        page = list(queryset[:size + 1])
+        self.has_next = len(page) > size
+        page = page[:size]
+        self.next_cursor = encode_cursor(page[-1].last_message_at, page[-1].id) if self.has_next else None
+        return page
+    
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'cursor', self.next_cursor)
+        return Response({
+            'next': next_url,
+            'next_cursor': self.next_cursor,
+            'results': data
+        })
+
+
+def messages_after(queryset, cursor):
+    """Mensagens estritamente depois de (created_at, id), em ordem cronológica"""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    ).order_by('created_at', 'id')
+
+
+def messages_before(queryset, cursor):
+    """Mensagens estritamente antes de (created_at, id), da mais nova para a mais antiga"""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    ).order_by('-created_at', '-id')
+
+
+def message_cursor(message):
+    return encode_cursor(message.created_at, message.id)
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """
+    Histórico de uma conversa por chave (conversation, created_at, id)
+    
+    * sem parâmetros: a página mais recente
+    * ?before=<cursor>: mensagens mais antigas que o cursor
+    * ?after=<cursor>: mensagens mais novas que o cursor
+    
+    Os resultados vêm sempre em ordem cronológica; before_cursor/after_cursor
+    apontam para a primeira/última mensagem da página.
+    """
+    page_size = 50
+    max_page_size = 200
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        size = self.get_page_size(request)
+        after = request.query_params.get('after')
+        before = request.query_params.get('before')
+        self.after = after
+        
+        if after:
+            page = list(messages_after(queryset, decode_cursor(after, 2))[:size + 1])
+            self.has_newer = len(page) > size
+            self.has_older = True
+            page = page[:size]
+        else:
+            if before:
+                queryset = messages_before(queryset, decode_cursor(before, 2))
+            else:
+                queryset = queryset.order_by('-created_at', '-id')
+            page = list(queryset[:size + 1])
+            self.has_older = len(page) > size
+            self.has_newer = bool(before)
+            page = page[:size][::-1]
+        
+        self.page = page
+        return page
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'before_cursor': message_cursor(self.page[0]) if self.page else None,
+            # Página vazia: o cliente continua do mesmo ponto
+            'after_cursor': message_cursor(self.page[-1]) if self.page else self.after,
+            'has_older': self.has_older,
+            'has_newer': self.has_newer,
+            'results': data
+        })
+
+
 class ConversationViewSet(viewsets.ModelViewSet):
     """ViewSet para gerenciar conversas."""
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = MessagingPagination
+    pagination_class = ConversationKeysetPagination
     
     def get_queryset(self):
         """Retorna apenas conversas do usuário atual."""
+        unread = ConversationReadState.objects.filter(
+            conversation=OuterRef('pk'),
+            user=self.request.user
+        ).values('unread_count')[:1]
+        
+        # Última mensagem vem das colunas desnormalizadas; só participantes são pré-carregados
         return Conversation.objects.filter(
             participants=self.request.user
+        ).select_related(
+            'last_message_sender'
         ).prefetch_related(
-            'participants',
-            Prefetch(
-                'message_conversations',
-                queryset=MessageConversation.objects.select_related('sender').order_by('-created_at')
-            )
+            'participants'
         ).annotate(
-            last_message_time=Max('message_conversations__created_at')
-        ).order_by('-last_message_time', '-created_at')
+            unread_count=Coalesce(Subquery(unread), Value(0))
+        ).order_by(F('last_message_at').desc(nulls_last=True), '-id')
     
     def get_serializer_class(self):
         """Usa serializer otimizado para listagem."""
@@ -67,32 +223,21 @@ class ConversationViewSet(viewsets.ModelViewSet):
         """Marca todas as mensagens da conversa como lidas."""
         conversation = self.get_object()
         
-        # Buscar mensagens não lidas do usuário atual
-        unread_messages = conversation.message_conversations.exclude(
-            sender=request.user
-        ).exclude(
-            read_by__has_key=str(request.user.id)
-        )
-        
-        # Marcar como lidas
-        for message in unread_messages:
-            message.mark_as_read_by(request.user)
+        # Avança o cursor até a última mensagem (um UPDATE, qualquer que seja o volume)
+        marked_count = getattr(conversation, 'unread_count', 0)
+        cursor = read_cursors.mark_read(request.user, conversation.id)
+        read_cursors.broadcast(cursor)
         
         return Response({
             'status': 'success',
-            'marked_count': unread_messages.count()
+            'marked_count': marked_count if cursor else 0,
+            'cursor': cursor
         })
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Retorna total de mensagens não lidas."""
-        conversations = self.get_queryset()
-        total_unread = 0
-        
-        for conversation in conversations:
-            total_unread += conversation.get_unread_count_for_user(request.user)
-        
-        return Response({'unread_count': total_unread})
+        """Retorna total de mensagens não lidas (contador mantido, O(1))."""
+        return Response({'unread_count': messaging_counters.conversation_unread_total(request.user)})
 
 
 class MessageConversationViewSet(viewsets.ModelViewSet):
@@ -101,20 +246,85 @@ class MessageConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = MessagingPagination
     
+    def get_conversation_id(self):
+        """
+        ?conversation= autorizado uma vez contra o conjunto de participantes
+        cacheado; None se o parâmetro não foi enviado
+        """
+        conversation_id = self.request.query_params.get('conversation')
+        if not conversation_id:
+            return None
+        try:
+            conversation_id = uuid.UUID(conversation_id)
+        except ValueError:
+            raise ValidationError({'conversation': 'Identificador inválido'})
+        if not conversation_access.is_participant(self.request.user, conversation_id):
+            raise NotFound('Conversa não encontrada')
+        return conversation_id
+    
     def get_queryset(self):
         """Retorna mensagens das conversas do usuário atual."""
-        conversation_id = self.request.query_params.get('conversation')
-        
         base_queryset = MessageConversation.objects.select_related(
-            'sender', 'conversation', 'reply_to__sender'
-        ).filter(
-            conversation__participants=self.request.user
+            'sender', 'reply_to__sender'
         )
         
+        conversation_id = self.get_conversation_id()
         if conversation_id:
-            base_queryset = base_queryset.filter(conversation_id=conversation_id)
+            # Já autorizado: só o índice (conversation, created_at, id), sem JOIN no M2M
+            return base_queryset.filter(conversation_id=conversation_id)
         
-        return base_queryset.order_by('created_at')
+        return base_queryset.filter(
+            conversation__participants=self.request.user
+        ).order_by('created_at')
+    
+    @property
+    def paginator(self):
+        """Histórico de uma conversa usa cursores; listagens gerais seguem por página"""
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('conversation'):
+                self._paginator = MessageKeysetPagination()
+            else:
+                self._paginator = MessagingPagination()
+        return self._paginator
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Delta para clientes reconectando: mensagens depois de ?since=<cursor>
+        e os cursores de leitura atuais dos participantes.
+        """
+        conversation_id = self.get_conversation_id()
+        if not conversation_id:
+            raise ValidationError({'conversation': 'Parâmetro obrigatório'})
+        since = request.query_params.get('since')
+        if not since:
+            raise ValidationError({'since': 'Parâmetro obrigatório'})
+        
+        limit = getattr(settings, 'MESSAGING_SYNC_MAX_MESSAGES', 200)
+        messages = list(messages_after(self.get_queryset(), decode_cursor(since, 2))[:limit + 1])
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        
+        serializer = MessageConversationSerializer(messages, many=True, context=self.get_serializer_context())
+        states = ConversationReadState.objects.filter(
+            conversation_id=conversation_id, last_read_at__isnull=False
+        ).values('user_id', 'last_read_message_id', 'last_read_at', 'unread_count')
+        
+        return Response({
+            'messages': serializer.data,
+            'cursor': message_cursor(messages[-1]) if messages else since,
+            'has_more': has_more,
+            'read_cursors': {
+                str(state['user_id']): {
+                    'last_read_message_id': str(state['last_read_message_id']) if state['last_read_message_id'] else None,
+                    'last_read_at': state['last_read_at'].isoformat()
+                }
+                for state in states
+            },
+            'unread_count': next(
+                (state['unread_count'] for state in states if state['user_id'] == request.user.id), 0
+            )
+        })
     
     def get_serializer_class(self):
         """Usa serializer específico para criação."""
@@ -124,112 +334,54 @@ class MessageConversationViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """Cria mensagem e envia via WebSocket."""
+        # last_message_at/preview da conversa são atualizados pelo signal de post_save
         message = serializer.save(sender=self.request.user)
         
-        # Atualizar last_message_at da conversa
-        conversation = message.conversation
-        conversation.last_message_at = timezone.now()
-        conversation.save(update_fields=['last_message_at'])
-        
         # Enviar via WebSocket
         self._send_websocket_message(message)
         
-        # Criar notificação para outros participantes
-        self._create_message_notifications(message)
+        # Notificações dos demais participantes: fan-out em lote num worker
+        message_id = str(message.id)
+        transaction.on_commit(lambda: fan_out_message_notifications.delay(message_id))
     
     def _send_websocket_message(self, message):
         """Envia mensagem via WebSocket para todos os participantes."""
         channel_layer = get_channel_layer()
         conversation_group = f'chat_{message.conversation.id}'
         
-        # Dados da mensagem para WebSocket
-        message_data = {
-            'type': 'chat_message_broadcast',
-            'message': {
-                'id': str(message.id),
-                'content': message.content,
-                'sender': {
-                    'id': str(message.sender.id),
-                    'name': message.sender.get_full_name() or message.sender.username,
-                    'avatar': f"https://ui-avatars.com/api/?name={message.sender.get_full_name() or message.sender.username}&background=0066cc&color=fff"
-                },
-                'timestamp': message.created_at.isoformat(),
-                'message_type': message.message_type,
-                'conversation_id': str(message.conversation.id)
-            }
-        }
+        # Frame serializado uma vez; cada socket do grupo só repassa o payload
+        message_data = ws_delivery.group_event('chat_message_broadcast', 'new_message', {
+            'id': str(message.id),
+            'content': message.content,
+            'sender': {
+                'id': str(message.sender.id),
+                'name': message.sender.get_full_name() or message.sender.username,
+                'avatar': f"https://ui-avatars.com/api/?name={message.sender.get_full_name() or message.sender.username}&background=0066cc&color=fff"
+            },
+            'timestamp': message.created_at.isoformat(),
+            'message_type': message.message_type,
+            'conversation_id': str(message.conversation.id)
+        })
         
         async_to_sync(channel_layer.group_send)(conversation_group, message_data)
     
-    def _create_message_notifications(self, message):
-        """Cria notificações para outros participantes da conversa."""
-        other_participants = message.conversation.participants.exclude(
-            id=message.sender.id
-        )
-        
-        for participant in other_participants:
-            # Verificar preferências de notificação do usuário
-            try:
-                prefs = participant.notification_preferences
-                if not prefs.messages_push:
-                    continue
-            except NotificationPreferences.DoesNotExist:
-                pass  # Usar configurações padrão
-            
-            # Criar notificação
-            notification = SystemNotification.objects.create(
-                user=participant,
-                notification_type='message',
-                title=f'Nova mensagem de {message.sender.get_full_name()}',
-                message=message.content[:100] + "..." if len(message.content) > 100 else message.content,
-                priority='medium',
-                related_conversation=message.conversation,
-                related_message=message,
-                data={
-                    'conversation_id': str(message.conversation.id),
-                    'sender_id': str(message.sender.id)
-                }
-            )
-            
-            # Enviar notificação via WebSocket
-            self._send_websocket_notification(notification)
-    
-    def _send_websocket_notification(self, notification):
-        """Envia notificação via WebSocket."""
-        channel_layer = get_channel_layer()
-        notification_group = f'notifications_{notification.user.id}'
-        
-        notification_data = {
-            'type': 'notification_broadcast',
-            'notification': {
-                'id': str(notification.id),
-                'type': notification.notification_type,
-                'title': notification.title,
-                'message': notification.message,
-                'priority': notification.priority,
-                'created_at': notification.created_at.isoformat(),
-                'action_url': notification.action_url,
-                'data': notification.data
-            }
-        }
-        
-        async_to_sync(channel_layer.group_send)(notification_group, notification_data)
-    
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """Marca mensagem específica como lida."""
         message = self.get_object()
         
         # Verificar se o usuário tem acesso à mensagem
-        if not message.conversation.participants.filter(id=request.user.id).exists():
+        if not conversation_access.is_participant(request.user, message.conversation_id):
             return Response(
                 {'error': 'Você não tem acesso a esta mensagem'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        message.mark_as_read_by(request.user)
+        # Marca a mensagem e todas as anteriores (cursor)
+        cursor = read_cursors.mark_read(request.user, message.conversation_id, up_to=message)
+        read_cursors.broadcast(cursor)
         
-        return Response({'status': 'success'})
+        return Response({'status': 'success', 'cursor': cursor})
 
 
 class SystemNotificationViewSet(viewsets.ModelViewSet):
@@ -271,7 +423,8 @@ class SystemNotificationViewSet(viewsets.ModelViewSet):
     def mark_as_read(self, request, pk=None):
         """Marca notificação como lida."""
         notification = self.get_object()
-        notification.mark_as_read()
+        if notification.mark_as_read():
+            messaging_counters.notifications_read(request.user.id)
         
         return Response({'status': 'success'})
     
@@ -285,6 +438,7 @@ class SystemNotificationViewSet(viewsets.ModelViewSet):
             read=True,
             read_at=timezone.now()
         )
+        messaging_counters.all_notifications_read(request.user.id)
         
         return Response({
             'status': 'success',
@@ -293,13 +447,8 @@ class SystemNotificationViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Retorna quantidade de notificações não lidas."""
-        unread_count = SystemNotification.objects.filter(
-            user=request.user,
-            read=False
-        ).count()
-        
-        return Response({'unread_count': unread_count})
+        """Retorna quantidade de notificações não lidas (contador mantido, O(1))."""
+        return Response({'unread_count': messaging_counters.notification_unread_total(request.user)})
 
 
 class NotificationPreferencesViewSet(viewsets.ModelViewSet):
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Compressão dos websockets (permessage-deflate) é negociada pelo servidor
+ASGI: o uvicorn com --ws websockets a habilita por padrão
+(--ws-per-message-deflate); o daphne não a suporta.
 """
 
 import os
@@ -24,14 +24,31 @@ app.conf.update(
         'api.tasks.kyc_tasks.process_document_verification': {'queue': 'kyc'},
         'api.tasks.kyc_tasks.process_biometric_verification': {'queue': 'kyc'},
         'api.tasks.kyc_tasks.process_kyc_webhook': {'queue': 'kyc_webhooks'},
+        # Enfileirada explicitamente em kyc_webhooks.<partição> (ver services/kyc_webhooks.py)
+        'api.tasks.kyc_tasks.process_kyc_webhook_partition': {'queue': 'kyc_webhooks'},
+        'api.tasks.kyc_tasks.sweep_kyc_webhook_events': {'queue': 'maintenance'},
+        'api.tasks.kyc_tasks.prune_kyc_webhook_events': {'queue': 'maintenance'},
         'api.tasks.kyc_tasks.trigger_profile_update': {'queue': 'kyc'},
         'api.tasks.kyc_tasks.send_level_upgrade_notification': {'queue': 'notifications'},
         'api.tasks.kyc_tasks.cleanup_expired_verifications': {'queue': 'maintenance'},
+        'api.tasks.kyc_tasks.reclaim_stuck_verifications': {'queue': 'maintenance'},
         # Smart KYC routing tasks
         'api.tasks.kyc_tasks.smart_kyc_verification': {'queue': 'kyc_smart'},
         'api.tasks.kyc_tasks.optimize_kyc_routing': {'queue': 'kyc_optimization'},
         'api.tasks.kyc_tasks.reset_monthly_kyc_metrics': {'queue': 'maintenance'},
+        'api.tasks.kyc_tasks.flush_kyc_latency_sketches': {'queue': 'maintenance'},
+        'api.tasks.kyc_tasks.refresh_verification_rollups': {'queue': 'maintenance'},
+        'api.tasks.kyc_tasks.prune_verification_logs': {'queue': 'maintenance'},
         'api.tasks.kyc_tasks.kyc_provider_health_check': {'queue': 'health_checks'},
+        # Booking tasks
+        'api.tasks.booking_tasks.clean_expired_time_slots': {'queue': 'maintenance'},
+        # Messaging and notification tasks
+        'api.tasks_messaging.fan_out_message_notifications': {'queue': 'notifications'},
+        'api.tasks_messaging.process_notification': {'queue': 'notifications'},
+        'api.tasks_messaging.deliver_notification_channel': {'queue': 'notifications'},
+        'api.tasks_messaging.sweep_notification_backlogs': {'queue': 'maintenance'},
+        'api.tasks_messaging.send_digest_notifications': {'queue': 'notifications'},
+        'api.tasks_messaging.send_digest_shard': {'queue': 'notifications'},
         # Escrow and payment tasks
         'api.services.escrow_service.release_escrowed_funds': {'queue': 'escrow'},
         'api.services.escrow_service.send_payment_reminders': {'queue': 'notifications'},
@@ -71,6 +88,27 @@ app.conf.beat_schedule = {
         'options': {'queue': 'maintenance'}
     },
     
+    # Reenfileira verificações presas em processing com lease vencido (a cada 5 min)
+    'reclaim-stuck-kyc-verifications': {
+        'task': 'api.tasks.kyc_tasks.reclaim_stuck_verifications',
+        'schedule': crontab(minute='*/5'),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Reagenda partições de webhooks KYC com eventos vencidos (a cada minuto)
+    'sweep-kyc-webhook-events': {
+        'task': 'api.tasks.kyc_tasks.sweep_kyc_webhook_events',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Retenção dos eventos de webhook KYC processados (diária às 4h30)
+    'prune-kyc-webhook-events': {
+        'task': 'api.tasks.kyc_tasks.prune_kyc_webhook_events',
+        'schedule': crontab(hour=4, minute=30),
+        'options': {'queue': 'maintenance'}
+    },
+    
     # Atualização de métricas de provedores KYC (a cada 6h)
     'update-provider-metrics': {
         'task': 'api.tasks.kyc_tasks.update_provider_metrics',
@@ -92,13 +130,63 @@ app.conf.beat_schedule = {
         'options': {'queue': 'maintenance'}
     },
     
-    # Health check dos provedores KYC (a cada 15 min)
+    # Consolidação dos sketches de latência KYC em last_ms_p95 (a cada minuto)
+    'flush-kyc-latency-sketches': {
+        'task': 'api.tasks.kyc_tasks.flush_kyc_latency_sketches',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Rollup horário de VerificationLog para os dashboards KYC (a cada 5 min)
+    'refresh-verification-rollups': {
+        'task': 'api.tasks.kyc_tasks.refresh_verification_rollups',
+        'schedule': crontab(minute='*/5'),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Retenção dos VerificationLog brutos (diária às 4h)
+    'prune-verification-logs': {
+        'task': 'api.tasks.kyc_tasks.prune_verification_logs',
+        'schedule': crontab(hour=4, minute=0),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Health check concorrente dos provedores KYC (a cada 2 min; histerese no kyc_health)
     'kyc-provider-health-check': {
         'task': 'api.tasks.kyc_tasks.kyc_provider_health_check',
-        'schedule': crontab(minute='*/15'),
+        'schedule': crontab(minute='*/2'),
         'options': {'queue': 'health_checks'}
     },
     
+    # Remoção em lotes de slots de agenda expirados (diária às 3h15)
+    # (CELERY_BEAT_SCHEDULE do settings é sobrescrito por este dicionário)
+    'clean-expired-time-slots': {
+        'task': 'api.tasks.booking_tasks.clean_expired_time_slots',
+        'schedule': crontab(hour=3, minute=15),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Reagenda o dreno de canais de notificação com entregas pendentes (a cada minuto)
+    'sweep-notification-backlogs': {
+        'task': 'api.tasks_messaging.sweep_notification_backlogs',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': 'maintenance'}
+    },
+    
+    # Resumos de notificações por email (diário às 8h; semanal às segundas 8h)
+    'send-daily-digest': {
+        'task': 'api.tasks_messaging.send_digest_notifications',
+        'schedule': crontab(hour=8, minute=0),
+        'args': ('daily',),
+        'options': {'queue': 'notifications'}
+    },
+    'send-weekly-digest': {
+        'task': 'api.tasks_messaging.send_digest_notifications',
+        'schedule': crontab(hour=8, minute=0, day_of_week=1),
+        'args': ('weekly',),
+        'options': {'queue': 'notifications'}
+    },
+    
     # Escrow and payment tasks
     # Processamento de releases automáticos (a cada 15 min)
     'process-auto-releases': {
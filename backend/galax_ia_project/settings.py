@@ -264,7 +264,7 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 3600.0,  # Execute a cada hora
     },
     'clean-expired-time-slots': {
-        'task': 'api.tasks.clean_expired_time_slots',
+        'task': 'api.tasks.booking_tasks.clean_expired_time_slots',
         'schedule': 86400.0,  # Execute diariamente
     },
     'auto-complete-past-bookings': {
@@ -297,6 +297,9 @@ FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 AI_SEARCH_BASE_URL = os.environ.get('AI_SEARCH_BASE_URL', 'http://localhost:8001')
 AI_SEARCH_TIMEOUT = int(os.environ.get('AI_SEARCH_TIMEOUT', '5'))
 AI_SEARCH_ENABLED = os.environ.get('AI_SEARCH_ENABLED', 'True').lower() == 'true'
+AI_SEARCH_EMBED_DTYPE = os.environ.get('AI_SEARCH_EMBED_DTYPE', 'float32')  # float32 | float16
+AI_SEARCH_POOL_MAXSIZE = int(os.environ.get('AI_SEARCH_POOL_MAXSIZE', '20'))
+SEARCH_SLOW_MS = int(os.environ.get('SEARCH_SLOW_MS', '500'))  # buscas acima disso vão para o log search.slow
 
 # Django Channels Configuration
 ASGI_APPLICATION = 'galax_ia_project.asgi.application'
@@ -310,6 +313,40 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Contadores de não lidas da mensageria (api/services/messaging_counters.py)
+MESSAGING_UNREAD_CACHE_TTL = 3600  # totais por usuário no Redis; recalculados do banco ao expirar
+
+# Histórico e sincronização de mensagens (api/services/conversation_access.py, views_messaging.py)
+MESSAGING_PARTICIPANTS_CACHE_TTL = 600  # conjunto de participantes por conversa no Redis
+MESSAGING_SYNC_MAX_MESSAGES = 200  # mensagens por resposta do endpoint de delta (sync)
+
+# Presença e digitação nos websockets (api/services/presence.py, consumers.py)
+MESSAGING_PRESENCE_TTL = 60  # conexões sem heartbeat expiram após esse tempo
+MESSAGING_PRESENCE_HEARTBEAT_SECONDS = 20
+MESSAGING_PRESENCE_OFFLINE_GRACE_SECONDS = 5  # reconexões dentro da carência não anunciam offline
+MESSAGING_PRESENCE_MAX_WATCHED = 50  # participantes acompanhados por conexão; o resto só no snapshot
+MESSAGING_TYPING_DEBOUNCE_MS = 1000  # no máximo um evento de digitação por usuário nesse intervalo
+
+# Frames agrupados nos websockets de notificações/atualizações (api/services/ws_delivery.py)
+WEBSOCKET_BATCH_WINDOW_MS = 25  # só para conexões com ?batch=1
+WEBSOCKET_BATCH_MAX_EVENTS = 50  # descarrega antes da janela ao atingir esse total
+
+# Despacho de notificações em lote por canal (api/services/notification_dispatch.py)
+NOTIFICATION_PREFERENCES_CACHE_TTL = 300
+NOTIFICATION_DISPATCH_WINDOW_SECONDS = 1  # janela que agrupa entregas antes do dreno
+NOTIFICATION_DISPATCH_TIME_BUDGET_SECONDS = 50  # por execução de deliver_notification_channel
+NOTIFICATION_DISPATCH_BATCH_SIZES = {'email': 100, 'push': 500, 'sms': 50}
+NOTIFICATION_CHANNEL_RATE_LIMITS = {'email': 20, 'push': 1000, 'sms': 10}  # envios/segundo
+NOTIFICATION_CHANNEL_BACKLOG_LIMITS = {'email': 50000, 'push': 200000, 'sms': 5000}  # acima: só high/urgent
+NOTIFICATION_MAX_DELIVERY_ATTEMPTS = 3
+NOTIFICATION_DISPATCH_PROCESSING_TIMEOUT = 300  # lote sem confirmação após isso volta para a fila (sweep)
+NOTIFICATION_SMS_SENDER = os.getenv('NOTIFICATION_SMS_SENDER')  # 'modulo.funcao' do envio de SMS em lote; vazio = SMS desligado
+
+# Resumos diário/semanal (api/services/notification_digest.py)
+NOTIFICATION_DIGEST_SHARDS = 8  # subtasks por execução (user_id % shards)
+NOTIFICATION_DIGEST_BATCH_SIZE = 100  # emails por send_messages; checkpoint após cada lote
+NOTIFICATION_DIGEST_MAX_ITEMS = 50  # notificações listadas por resumo (o total é sempre informado)
+
 # Elasticsearch Configuration for Local Search
 ELASTICSEARCH_DSL = {
     'default': {
@@ -347,27 +384,82 @@ KYC_PROVIDERS = {
         'api_key': os.getenv('UNICO_API_KEY', ''),
         'endpoint': 'https://api.unico.com/v1/',
         'webhook_secret': os.getenv('UNICO_WEBHOOK_SECRET', ''),
-        'enabled': os.getenv('UNICO_ENABLED', 'False').lower() == 'true'
+        'enabled': os.getenv('UNICO_ENABLED', 'False').lower() == 'true',
+        'http': {'max_concurrency': int(os.getenv('UNICO_MAX_CONCURRENCY', 20))},
+        'media_delivery': os.getenv('UNICO_MEDIA_DELIVERY', 'url'),  # 'url' (pré-assinada) ou 'multipart'
     },
     'idwall': {
         'api_key': os.getenv('IDWALL_API_KEY', ''),
         'endpoint': 'https://api.idwall.co/v2/',
         'webhook_secret': os.getenv('IDWALL_WEBHOOK_SECRET', ''),
-        'enabled': os.getenv('IDWALL_ENABLED', 'False').lower() == 'true'
+        'enabled': os.getenv('IDWALL_ENABLED', 'False').lower() == 'true',
+        'http': {'max_concurrency': int(os.getenv('IDWALL_MAX_CONCURRENCY', 20))},
+        'media_delivery': os.getenv('IDWALL_MEDIA_DELIVERY', 'url'),  # 'url' (pré-assinada) ou 'multipart'
     },
     'stripe': {
         'api_key': os.getenv('STRIPE_SECRET_KEY', ''),
         'endpoint': 'https://api.stripe.com/v1/',
         'webhook_secret': os.getenv('STRIPE_IDENTITY_WEBHOOK_SECRET', ''),
-        'enabled': os.getenv('STRIPE_IDENTITY_ENABLED', 'False').lower() == 'true'
+        'enabled': os.getenv('STRIPE_IDENTITY_ENABLED', 'False').lower() == 'true',
+        'http': {'max_concurrency': int(os.getenv('STRIPE_IDENTITY_MAX_CONCURRENCY', 10))}
     },
     'serpro': {
         'api_key': os.getenv('SERPRO_API_KEY', ''),
         'endpoint': 'https://apigateway.serpro.gov.br/',
-        'enabled': os.getenv('SERPRO_ENABLED', 'False').lower() == 'true'
+        'enabled': os.getenv('SERPRO_ENABLED', 'False').lower() == 'true',
+        'http': {'max_concurrency': int(os.getenv('SERPRO_MAX_CONCURRENCY', 5))}
     }
 }
 
+# Camada HTTP dos provedores KYC (api/services/kyc_http.py); sobrescrita por
+# provedor em KYC_PROVIDERS[<nome>]['http']. max_concurrency vale por processo
+# worker: alinhar com o rate limit contratado / número de processos.
+# pool_maxsize é elevado a max_concurrency quando menor (ver provider_http_config).
+KYC_PROVIDER_HTTP_DEFAULTS = {
+    'pool_maxsize': 10,
+    'max_concurrency': 10,
+    'max_retries': 2,
+    'backoff_seconds': 0.5,
+    'max_retry_after': 30,   # teto (s) para Retry-After
+    'acquire_timeout': 30,   # espera máxima (s) por um slot de concorrência
+}
+
+# Roteamento KYC (api/services/kyc_router.py)
+KYC_ROUTER_SNAPSHOT_TTL = 30      # segundos entre recargas do snapshot em memória
+KYC_ROUTER_EPSILON = 0.02         # piso de exploração uniforme
+KYC_ROUTER_COST_WEIGHT = 0.3      # penalidade por custo esperado (normalizado)
+KYC_ROUTER_LATENCY_WEIGHT = 0.1   # penalidade por latência p95 (normalizada)
+
+# Health checks dos provedores KYC (api/services/kyc_health.py)
+KYC_HEALTH_CHECK_TIMEOUTS = {
+    'default': 5,     # segundos por provedor, em paralelo
+    'datavalid': 10,  # OAuth + status
+}
+KYC_HEALTH_FAILURE_THRESHOLD = 3   # falhas seguidas para sair do roteamento
+KYC_HEALTH_RECOVERY_THRESHOLD = 2  # sucessos seguidos para voltar
+KYC_HEALTH_STATE_TTL = 900         # estado expira sem o beat (provedores voltam a ser roteáveis)
+
+# Sketch de latência por provedor (api/services/kyc_metrics.py)
+KYC_LATENCY_SKETCH_ERROR = 0.02  # erro relativo máximo dos quantis
+KYC_LATENCY_SKETCH_DECAY = 0.9   # peso do histórico a cada flush (1/min)
+
+# Rollup horário de VerificationLog (api/services/kyc_analytics.py)
+KYC_ROLLUP_BACKFILL_DAYS = 90  # janela máxima do primeiro catch-up
+KYC_VERIFICATION_LOG_RETENTION_DAYS = 180  # logs brutos além disso são podados
+
+# Ingestão de webhooks KYC (api/services/kyc_webhooks.py)
+KYC_WEBHOOK_PARTITIONS = 8                 # filas kyc_webhooks.0..7, um consumidor cada
+KYC_WEBHOOK_BATCH_WINDOW_SECONDS = 1       # espera antes de drenar (agrupa bursts)
+KYC_WEBHOOK_BATCH_SIZE = 100
+KYC_WEBHOOK_MAX_ATTEMPTS = 5
+KYC_WEBHOOK_TIME_BUDGET_SECONDS = 60
+KYC_WEBHOOK_EVENT_RETENTION_DAYS = 30      # janela de deduplicação
+
+# Manutenção em lotes (api/services/chunked_maintenance.py)
+MAINTENANCE_CHUNK_SIZE = 1000
+MAINTENANCE_CHUNK_SLEEP_SECONDS = 0.05   # pausa entre lotes para aliviar o primário
+MAINTENANCE_TIME_BUDGET_SECONDS = 240    # abaixo do task_soft_time_limit (300s), com folga para o lote corrente
+
 # File Storage for KYC Documents
 KYC_STORAGE_BACKEND = os.getenv('KYC_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage')
 
@@ -389,6 +481,16 @@ KYC_ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/webp']
 KYC_ALLOWED_DOCUMENT_TYPES = ['application/pdf'] + KYC_ALLOWED_IMAGE_TYPES
 KYC_MAX_VERIFICATION_ATTEMPTS = 5
 KYC_VERIFICATION_TIMEOUT_DAYS = 30
+KYC_PROCESSING_LEASE_SECONDS = 120  # lease do claim pending→processing, renovado a cada tentativa HTTP (> timeout + max_retry_after)
+
+# Mídia KYC em streaming (api/services/kyc_media.py)
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440     # uploads maiores vão para arquivo temporário, não RAM
+KYC_MEDIA_CHUNK_SIZE = 1024 * 1024        # chunk de gravação/hash no storage
+KYC_MEDIA_URL_EXPIRE_SECONDS = 900        # validade das URLs pré-assinadas enviadas aos provedores
+KYC_MEDIA_MAX_DIMENSION = 2000            # lado máximo (px) das imagens normalizadas
+KYC_MEDIA_JPEG_QUALITY = 85
+KYC_MEDIA_PROCESS_WORKERS = 2             # pool de processos para normalização no web
+KYC_MEDIA_NORMALIZE_TIMEOUT = 30
 
 # Biometric Verification Settings
 BIOMETRIC_MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB for videos
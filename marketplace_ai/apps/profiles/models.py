@@ -7,11 +7,15 @@ from typing import Any
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.gis.db import models as gismodels
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Greatest
 from django.utils import timezone
 
 from pgvector.django import VectorField
 
+from apps.search.geo import encode as geohash_encode
+
 User = get_user_model()
 
 
@@ -41,6 +45,7 @@ class Professional(TimeStampedModel):
     category = models.CharField(max_length=60)
     price_min = models.DecimalField(max_digits=9, decimal_places=2)
     location = gismodels.PointField(srid=4326)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)  # derivado de location
 
     # embedding OpenAI (1 536 dims)
     embedding = VectorField(dimensions=1536, blank=True, null=True)
@@ -54,7 +59,9 @@ class Professional(TimeStampedModel):
 
     # KYC, disputas, etc.
     kyc_verified = models.BooleanField(default=False)
-    dispute_rate = models.FloatField(default=0.0)  # atualizado em tasks
+    dispute_rate = models.FloatField(default=0.0)  # disputes_open / disputes_total
+    disputes_total = models.PositiveIntegerField(default=0)  # mantidos via F() em Dispute.save
+    disputes_open = models.PositiveIntegerField(default=0)
     phone_verified = models.BooleanField(default=False)
     email_verified = models.BooleanField(default=False)
 
@@ -72,6 +79,17 @@ class Professional(TimeStampedModel):
     def __str__(self) -> str:
         return f"{self.title} ({self.user})"
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        # mantém o geohash sincronizado com location (usado no pré-filtro geo)
+        update_fields = kwargs.get("update_fields")
+        if self.location is not None and (
+            update_fields is None or "location" in update_fields
+        ):
+            self.geohash = geohash_encode(self.location.y, self.location.x)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
     # utilidades ---------------------------------------------------------
 
     @property
@@ -125,10 +143,56 @@ class Dispute(TimeStampedModel):
     def __str__(self) -> str:
         return f"dispute:{self.id} {'✔' if self.resolved else 'open'}"
 
-    # hook para atualizar dispute_rate
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_resolved = instance.resolved
+        return instance
+
+    # hook para atualizar contadores / dispute_rate
     def save(self, *args: Any, **kwargs: Any) -> None:  # noqa: D401
-        super().save(*args, **kwargs)
-        total = self.professional.dispute_set.count()
-        open_ = self.professional.dispute_set.filter(resolved=False).count()
-        self.professional.dispute_rate = open_ / total if total else 0.0
-        self.professional.save(update_fields=["dispute_rate"])
\ No newline at end of file
+        """
+        Mantém disputes_total / disputes_open do profissional com UPDATEs
+        atômicos (F()), só na criação e nas transições de `resolved`.
+        Divergências são corrigidas por `reconcile_dispute_counters`.
+        """
+        creating = self._state.adding
+        was_resolved = getattr(self, "_loaded_resolved", None)
+
+        d_total = 1 if creating else 0
+        if creating:
+            d_open = 0 if self.resolved else 1
+        elif was_resolved is not None and was_resolved != self.resolved:
+            d_open = -1 if self.resolved else 1
+        else:
+            d_open = 0
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if d_total or d_open:
+                Professional.objects.filter(pk=self.professional_id).update(
+                    **dispute_counter_updates(d_total, d_open)
+                )
+        self._loaded_resolved = self.resolved
+
+
+def dispute_counter_updates(d_total: int, d_open: int) -> dict[str, Any]:
+    """
+    Expressões do UPDATE de contadores de disputa.
+
+    O SET do SQL enxerga os valores antigos das colunas, então a taxa é
+    calculada já com os deltas aplicados. Os decrementos param em 0: com os
+    contadores defasados, o CHECK da PositiveIntegerField derrubaria o save
+    da disputa (a reconciliação noturna corrige o valor).
+    """
+    total = Greatest(F("disputes_total") + d_total, Value(0))
+    open_ = Greatest(F("disputes_open") + d_open, Value(0))
+    return {
+        "disputes_total": total,
+        "disputes_open": open_,
+        "dispute_rate": Case(
+            When(**{"disputes_total__lte": -d_total}, then=Value(0.0)),
+            default=Cast(open_, FloatField()) / Cast(total, FloatField()),
+            output_field=FloatField(),
+        ),
+    }
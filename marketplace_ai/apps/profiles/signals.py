@@ -1 +1,33 @@
-"""\nGera embedding + indexa profissional toda vez que o perfil muda.\n"""\nimport os\nfrom django.db import transaction\nfrom django.db.models.signals import post_save\nfrom django.dispatch import receiver\n\nfrom .models import Professional\n\n\n@receiver(post_save, sender=Professional)\ndef enqueue_embedding(sender, instance: Professional, **kwargs):  # noqa: D401\n    \"\"\"\n    Dispara task Celery only *after* commit para evitar race-condition.\n    \"\"\"\n    from apps.search.tasks import generate_embedding  # lazy import\n\n    transaction.on_commit(lambda: generate_embedding.delay(instance.pk))\n    \n    # Se ORCID ou Lattes foi adicionado, dispara coleta acadêmica\n    if instance.orcid_id or instance.lattes_id:\n        from apps.ingest.tasks import refresh_academic_score\n        transaction.on_commit(\n            lambda: refresh_academic_score.delay(instance.pk)\n        )
\ No newline at end of file
+"""
+Gera embedding + indexa profissional toda vez que o perfil muda.
+"""
+import os
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Professional
+
+
+@receiver(post_save, sender=Professional)
+def enqueue_embedding(sender, instance: Professional, update_fields=None, **kwargs):  # noqa: D401
+    """
+    Dispara task Celery only *after* commit para evitar race-condition.
+
+    Saves que só tocam métricas dinâmicas (feature store) não regeram
+    embedding nem reindexam.
+    """
+    from apps.ranking.feature_store import DYNAMIC_FIELDS  # lazy import
+    from apps.search.tasks import generate_embedding
+
+    if update_fields and set(update_fields) <= DYNAMIC_FIELDS:
+        return
+
+    transaction.on_commit(lambda: generate_embedding.delay(instance.pk))
+    
+    # Se ORCID ou Lattes foi adicionado, dispara coleta acadêmica
+    if instance.orcid_id or instance.lattes_id:
+        from apps.ingest.tasks import refresh_academic_score
+        transaction.on_commit(
+            lambda: refresh_academic_score.delay(instance.pk)
+        )
@@ -5,6 +5,7 @@ Camada de ranking:
 2.  scorer.py           → combina features heurísticos (pesos configuráveis em admin).
 3.  tasks.py            → jobs Celery de métricas dinâmicas (rating, engajamento, confiança).
 4.  models.py           → tabela RankingWeight (permite ajuste no Django-admin).
+5.  feature_store.py    → métricas dinâmicas por profissional em Redis (join no re-rank).
 
 Obs.: a lógica de LTR (XGBoost) reside em apps/ltr/.
 """
\ No newline at end of file
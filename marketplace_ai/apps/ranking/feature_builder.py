@@ -5,13 +5,14 @@ para uso no scorer heurístico ou como input do modelo LTR offline.
 from __future__ import annotations
 from typing import Dict, Tuple, Any
 
-from geopy.distance import distance
+from apps.search.geo import haversine_km
 
 
 def build_features(
     hit: Dict[str, Any],
     user_coords: Tuple[float, float] | None,
     radius_km: int = 20,
+    dist_km: float | None = None,
 ) -> Dict[str, float]:
     """
     Extrai features principais:
@@ -22,6 +23,8 @@ def build_features(
     * score_engajamento — % respostas em 7 d
     * score_proximidade — 1-d/radius; 0 se fora
     * score_qualificacao— academic_score 0-1
+
+    `dist_km` pode vir pré-calculado (haversine vetorizado em `rank_hits`).
     """
     src = hit["_source"]
 
@@ -34,11 +37,15 @@ def build_features(
         "score_qualificacao": src.get("academic_score", 0.0),
     }
 
-    if user_coords and src.get("location"):
-        dist_km = distance(
-            user_coords,
-            (src["location"]["lat"], src["location"]["lon"]),
-        ).km
+    if dist_km is None and user_coords and src.get("location"):
+        dist_km = float(
+            haversine_km(
+                user_coords,
+                [src["location"]["lat"]],
+                [src["location"]["lon"]],
+            )[0]
+        )
+    if dist_km is not None:
         feats["score_proximidade"] = max(0.0, 1.0 - dist_km / radius_km)
 
     # clamp [0,1]
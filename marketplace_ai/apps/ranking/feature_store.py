@@ -0,0 +1,90 @@
+"""
+Feature store de ranking — métricas dinâmicas por profissional fora do índice.
+
+Cada profissional ocupa uma linha compacta (float32 little-endian, na ordem
+de FEATURES) num hash Redis. O re-rank junta os candidatos com um único
+HMGET e um `numpy.frombuffer`; os jobs de métricas escrevem aqui direto,
+sem reindexar o documento (texto + embedding) no OpenSearch.
+
+* put_professional() / put_many() → grava linhas
+* gather()                        → matriz (N, len(FEATURES)) + máscara
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import redis
+from django.conf import settings
+
+FEATURES: Tuple[str, ...] = (
+    "confidence_score",
+    "engagement_score",
+    "academic_score",
+    "rating",
+)
+
+# campos do Professional que só alimentam o store — salvar apenas eles
+# não precisa regerar embedding nem reindexar
+DYNAMIC_FIELDS = frozenset(FEATURES) | {"reviews_count", "updated_at"}
+
+STORE_KEY = "ranking:features:v1"
+
+_ROW_DTYPE = np.dtype("<f4")
+_ROW_BYTES = _ROW_DTYPE.itemsize * len(FEATURES)
+_EMPTY_ROW = bytes(_ROW_BYTES)
+
+_redis: Optional[redis.Redis] = None
+
+
+def store_client() -> redis.Redis:
+    """Singleton do cliente Redis do feature store."""
+    global _redis
+    if _redis is None:
+        url = getattr(settings, "RANKING_FEATURE_STORE_URL", settings.CELERY_BROKER_URL)
+        _redis = redis.Redis.from_url(url)
+    return _redis
+
+
+def pack(values: Sequence[float]) -> bytes:
+    return np.asarray(values, dtype=_ROW_DTYPE).tobytes()
+
+
+def put_professional(prof) -> None:
+    """Grava a linha de um Professional (todas as FEATURES de uma vez)."""
+    store_client().hset(
+        STORE_KEY, str(prof.pk), pack([getattr(prof, f) for f in FEATURES])
+    )
+
+
+def put_many(profs: Iterable) -> int:
+    """Grava várias linhas num único pipeline. Retorna quantas foram gravadas."""
+    mapping = {
+        str(prof.pk): pack([getattr(prof, f) for f in FEATURES]) for prof in profs
+    }
+    if mapping:
+        store_client().hset(STORE_KEY, mapping=mapping)
+    return len(mapping)
+
+
+def gather(ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca as linhas de `ids` num único round-trip.
+
+    Retorna (matriz float32 (N, len(FEATURES)), máscara bool de encontrados).
+    Se o Redis estiver indisponível, nada é encontrado e o chamador usa o
+    `_source` do hit como fallback.
+    """
+    if not ids:
+        return np.zeros((0, len(FEATURES)), dtype=_ROW_DTYPE), np.zeros(0, dtype=bool)
+
+    try:
+        rows = store_client().hmget(STORE_KEY, ids)
+    except redis.RedisError:
+        rows = [None] * len(ids)
+
+    rows = [r if r is not None and len(r) == _ROW_BYTES else None for r in rows]
+    found = np.fromiter((r is not None for r in rows), dtype=bool, count=len(ids))
+    buf = b"".join(r if r is not None else _EMPTY_ROW for r in rows)
+    matrix = np.frombuffer(buf, dtype=_ROW_DTYPE).reshape(len(ids), len(FEATURES))
+    return matrix, found
@@ -1 +1,139 @@
-"""\nCombina features normalizadas com pesos configuráveis.\n\n* load_weights()    — carrega da tabela RankingWeight\n* compute_score()   — soma ponderada das features\n* rank_hits()       — aplica scorer a lista de hits\n"""\nfrom __future__ import annotations\n\nfrom typing import Dict, List, Any\nfrom django.core.cache import cache\n\nfrom .models import RankingWeight\nfrom .feature_builder import build_features\n\n\ndef load_weights() -> Dict[str, float]:\n    \"\"\"\n    Carrega pesos do banco com cache de 5 min.\n    Se não houver peso configurado, usa padrão 1.0.\n    \"\"\"\n    weights = cache.get(\"ranking_weights\")\n    if weights is None:\n        weights = dict(RankingWeight.objects.values_list(\"name\", \"value\"))\n        cache.set(\"ranking_weights\", weights, 300)  # 5 min\n    \n    # Defaults para features principais\n    defaults = {\n        \"sim_semantico\": 1.0,\n        \"score_confianca\": 0.8,\n        \"score_avaliacao\": 0.9,\n        \"score_engajamento\": 0.7,\n        \"score_proximidade\": 0.6,\n        \"score_qualificacao\": 0.5,\n    }\n    \n    for key, default_val in defaults.items():\n        if key not in weights:\n            weights[key] = default_val\n            \n    return weights\n\n\ndef compute_score(features: Dict[str, float]) -> float:\n    \"\"\"\n    Calcula score final como soma ponderada das features.\n    \n    Score = Σ(weight_i * feature_i)\n    \"\"\"\n    weights = load_weights()\n    score = 0.0\n    \n    for feat_name, feat_val in features.items():\n        weight = weights.get(feat_name, 0.0)\n        score += weight * feat_val\n        \n    return max(0.0, score)  # garante não-negativo\n\n\ndef rank_hits(\n    hits: List[Dict[str, Any]], \n    user_coords: tuple[float, float] | None = None\n) -> List[Dict[str, Any]]:\n    \"\"\"\n    Aplica re-ranking heurístico aos hits do OpenSearch.\n    \n    1. Extrai features de cada hit\n    2. Calcula score combinado\n    3. Ordena por score decrescente\n    4. Adiciona campo 'final_score' em cada hit\n    \"\"\"\n    scored_hits = []\n    \n    for hit in hits:\n        features = build_features(hit, user_coords)\n        final_score = compute_score(features)\n        \n        # Adiciona score e features ao hit\n        hit[\"final_score\"] = final_score\n        hit[\"features\"] = features\n        scored_hits.append(hit)\n    \n    # Ordena por score decrescente\n    scored_hits.sort(key=lambda x: x[\"final_score\"], reverse=True)\n    \n    return scored_hits
\ No newline at end of file
+"""
+Combina features normalizadas com pesos configuráveis.
+
+* load_weights()    — carrega da tabela RankingWeight
+* compute_score()   — soma ponderada das features
+* rank_hits()       — aplica scorer a lista de hits
+* join_dynamic_features() — sobrepõe métricas do feature store ao _source
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Any
+from django.core.cache import cache
+
+from .models import RankingWeight
+from . import feature_store
+from .feature_builder import build_features
+from apps.search.geo import haversine_km
+from apps.search.tracing import current_trace
+
+
+def load_weights() -> Dict[str, float]:
+    """
+    Carrega pesos do banco com cache de 5 min.
+    Se não houver peso configurado, usa padrão 1.0.
+    """
+    weights = cache.get("ranking_weights")
+    if weights is None:
+        weights = dict(RankingWeight.objects.values_list("name", "value"))
+        cache.set("ranking_weights", weights, 300)  # 5 min
+    
+    # Defaults para features principais
+    defaults = {
+        "sim_semantico": 1.0,
+        "score_confianca": 0.8,
+        "score_avaliacao": 0.9,
+        "score_engajamento": 0.7,
+        "score_proximidade": 0.6,
+        "score_qualificacao": 0.5,
+    }
+    
+    for key, default_val in defaults.items():
+        if key not in weights:
+            weights[key] = default_val
+            
+    return weights
+
+
+def compute_score(features: Dict[str, float]) -> float:
+    """
+    Calcula score final como soma ponderada das features.
+    
+    Score = Σ(weight_i * feature_i)
+    """
+    weights = load_weights()
+    score = 0.0
+    
+    for feat_name, feat_val in features.items():
+        weight = weights.get(feat_name, 0.0)
+        score += weight * feat_val
+        
+    return max(0.0, score)  # garante não-negativo
+
+
+def rank_hits(
+    hits: List[Dict[str, Any]], 
+    user_coords: tuple[float, float] | None = None,
+    radius_km: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    Aplica re-ranking heurístico aos hits do OpenSearch.
+    
+    0. Junta as métricas dinâmicas do feature store (um HMGET só)
+       e calcula distâncias usuário → hits num único passe (haversine numpy)
+       e descarta hits fora do raio (o pré-filtro por geohash é mais largo)
+    1. Extrai features de cada hit
+    2. Calcula score combinado
+    3. Ordena por score decrescente
+    4. Adiciona campo 'final_score' em cada hit
+    """
+    join_dynamic_features(hits)
+
+    distances: List[float | None] = [None] * len(hits)
+    if user_coords:
+        located = [i for i, h in enumerate(hits) if h["_source"].get("location")]
+        if located:
+            dists = haversine_km(
+                user_coords,
+                [hits[i]["_source"]["location"]["lat"] for i in located],
+                [hits[i]["_source"]["location"]["lon"] for i in located],
+            )
+            for i, d in zip(located, dists.tolist()):
+                distances[i] = d
+        hits, distances = filter_by_radius(hits, distances, radius_km)
+
+    scored_hits = []
+    
+    for hit, dist_km in zip(hits, distances):
+        features = build_features(hit, user_coords, radius_km, dist_km=dist_km)
+        final_score = compute_score(features)
+        
+        # Adiciona score e features ao hit
+        hit["final_score"] = final_score
+        hit["features"] = features
+        scored_hits.append(hit)
+    
+    # Ordena por score decrescente
+    scored_hits.sort(key=lambda x: x["final_score"], reverse=True)
+    
+    return scored_hits
+
+
+def filter_by_radius(
+    hits: List[Dict[str, Any]],
+    distances: List[float | None],
+    radius_km: int,
+) -> tuple[List[Dict[str, Any]], List[float | None]]:
+    """Mantém só os hits a até `radius_km` (hits sem coordenada são mantidos)."""
+    kept = [
+        (h, d) for h, d in zip(hits, distances) if d is None or d <= radius_km
+    ]
+    return [h for h, _ in kept], [d for _, d in kept]
+
+
+def join_dynamic_features(hits: List[Dict[str, Any]]) -> None:
+    """
+    Sobrescreve no `_source` de cada hit as FEATURES vindas do feature store.
+    Hits sem linha no store mantêm os valores do índice (cópia da última
+    indexação, ver index_professional).
+    """
+    trace = current_trace()
+    if trace is None:
+        matrix, found = feature_store.gather([h["_id"] for h in hits])
+    else:
+        with trace.stage("feature_store"):
+            matrix, found = feature_store.gather([h["_id"] for h in hits])
+        trace.count("feature_store_found", int(found.sum()))
+    for hit, row, ok in zip(hits, matrix.tolist(), found.tolist()):
+        if ok:
+            hit["_source"].update(zip(feature_store.FEATURES, row))
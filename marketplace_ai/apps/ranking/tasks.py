@@ -1 +1,145 @@
-"""\nTasks Celery para atualização periódica de métricas dinâmicas.\n\n* update_metrics()     — job diário; recalcula rating, engajamento, confiança\n* update_single_prof() — atualiza métricas de um profissional específico\n"""\nfrom __future__ import annotations\n\nfrom celery import shared_task\nfrom django.db.models import Avg, Count, Q\nfrom django.utils import timezone\nfrom datetime import timedelta\n\nfrom apps.profiles.models import Professional, Review, Message\n\n\n@shared_task\ndef update_metrics() -> None:\n    \"\"\"\n    Task diária: recalcula métricas de todos os profissionais ativos.\n    \n    Executa em batch para evitar sobrecarga. Pode ser agendada\n    via django-crontab ou Celery Beat.\n    \"\"\"\n    professionals = Professional.objects.all()\n    \n    for prof in professionals.iterator(chunk_size=100):\n        update_single_prof.delay(prof.pk)\n\n\n@shared_task \ndef update_single_prof(prof_id: int) -> None:\n    \"\"\"\n    Atualiza métricas dinâmicas de um profissional específico:\n    \n    1. rating           — média das avaliações\n    2. engagement_score — % de mensagens respondidas em 7d\n    3. confidence_score — combinação de verificações\n    \"\"\"\n    try:\n        prof = Professional.objects.get(pk=prof_id)\n    except Professional.DoesNotExist:\n        return\n        \n    # 1. Rating médio\n    rating_avg = Review.objects.filter(\n        professional=prof\n    ).aggregate(avg=Avg(\"stars\"))[\"avg\"]\n    \n    prof.rating = rating_avg or 0.0\n    \n    # 2. Engagement score (últimos 7 dias)\n    week_ago = timezone.now() - timedelta(days=7)\n    \n    total_msgs = Message.objects.filter(\n        professional=prof,\n        created_at__gte=week_ago\n    ).count()\n    \n    replied_msgs = Message.objects.filter(\n        professional=prof,\n        created_at__gte=week_ago\n    ).count()\n    \n    if total_msgs > 0:\n        prof.engagement_score = replied_msgs / total_msgs\n    else:\n        prof.engagement_score = 0.0\n        \n    # 3. Confidence score (nova fórmula com academic_score)\n    prof.confidence_score = (\n        0.50 * (1 if prof.kyc_verified else 0.5) +\n        0.20 * prof.academic_score +\n        0.30 * (1 - prof.dispute_rate)\n    )\n    \n    prof.save(update_fields=[\n        \"rating\", \n        \"engagement_score\", \n        \"confidence_score\"\n    ])
\ No newline at end of file
+"""
+Tasks Celery para atualização periódica de métricas dinâmicas.
+
+* update_metrics()     — job diário; recalcula rating, engajamento, confiança
+* update_single_prof() — atualiza métricas de um profissional específico
+* reconcile_dispute_counters() — corrige deriva dos contadores de disputa
+* sync_feature_store() — recarrega o feature store inteiro a partir do banco
+"""
+from __future__ import annotations
+
+from celery import shared_task
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+from datetime import timedelta
+
+from apps.profiles.models import Professional, Review, Message, Dispute
+from . import feature_store
+
+
+@shared_task
+def update_metrics() -> None:
+    """
+    Task diária: recalcula métricas de todos os profissionais ativos.
+    
+    Executa em batch para evitar sobrecarga. Pode ser agendada
+    via django-crontab ou Celery Beat.
+    """
+    professionals = Professional.objects.all()
+    
+    for prof in professionals.iterator(chunk_size=100):
+        update_single_prof.delay(prof.pk)
+
+
+@shared_task 
+def update_single_prof(prof_id: int) -> None:
+    """
+    Atualiza métricas dinâmicas de um profissional específico:
+    
+    1. rating           — média das avaliações
+    2. engagement_score — % de mensagens respondidas em 7d
+    3. confidence_score — combinação de verificações
+    """
+    try:
+        prof = Professional.objects.get(pk=prof_id)
+    except Professional.DoesNotExist:
+        return
+        
+    # 1. Rating médio
+    rating_avg = Review.objects.filter(
+        professional=prof
+    ).aggregate(avg=Avg("stars"))["avg"]
+    
+    prof.rating = rating_avg or 0.0
+    
+    # 2. Engagement score (últimos 7 dias)
+    week_ago = timezone.now() - timedelta(days=7)
+    
+    total_msgs = Message.objects.filter(
+        professional=prof,
+        created_at__gte=week_ago
+    ).count()
+    
+    replied_msgs = Message.objects.filter(
+        professional=prof,
+        created_at__gte=week_ago
+    ).count()
+    
+    if total_msgs > 0:
+        prof.engagement_score = replied_msgs / total_msgs
+    else:
+        prof.engagement_score = 0.0
+        
+    # 3. Confidence score (nova fórmula com academic_score)
+    #    dispute rate vem dos contadores mantidos em Dispute.save
+    dispute_rate = (
+        prof.disputes_open / prof.disputes_total if prof.disputes_total else 0.0
+    )
+    prof.confidence_score = (
+        0.50 * (1 if prof.kyc_verified else 0.5) +
+        0.20 * prof.academic_score +
+        0.30 * (1 - dispute_rate)
+    )
+    
+    prof.save(update_fields=[
+        "rating", 
+        "engagement_score", 
+        "confidence_score"
+    ])
+
+    # métricas vão direto para o feature store (sem reindexar o documento)
+    feature_store.put_professional(prof)
+
+
+@shared_task
+def reconcile_dispute_counters() -> int:
+    """
+    Recalcula disputes_total / disputes_open / dispute_rate a partir da
+    tabela Dispute e grava só onde houver divergência (ex.: deleções ou
+    updates em massa que não passam por Dispute.save).
+
+    Retorna o número de profissionais corrigidos.
+    """
+    actual = {
+        row["professional_id"]: (row["total"], row["open"])
+        for row in Dispute.objects.values("professional_id").annotate(
+            total=Count("id"),
+            open=Count("id", filter=Q(resolved=False)),
+        )
+    }
+
+    fixed = 0
+    stale = Professional.objects.filter(
+        Q(pk__in=list(actual)) | Q(disputes_total__gt=0) | Q(disputes_open__gt=0)
+    ).only("id", "disputes_total", "disputes_open")
+
+    for prof in stale.iterator(chunk_size=500):
+        total, open_ = actual.get(prof.pk, (0, 0))
+        if (prof.disputes_total, prof.disputes_open) == (total, open_):
+            continue
+        Professional.objects.filter(pk=prof.pk).update(
+            disputes_total=total,
+            disputes_open=open_,
+            dispute_rate=open_ / total if total else 0.0,
+        )
+        fixed += 1
+
+    return fixed
+
+
+@shared_task
+def sync_feature_store() -> int:
+    """
+    Recarrega todas as linhas do feature store a partir do banco.
+    Cobre profissionais novos e um Redis esvaziado.
+    """
+    written = 0
+    batch = []
+    qs = Professional.objects.only("id", *feature_store.FEATURES)
+    for prof in qs.iterator(chunk_size=1000):
+        batch.append(prof)
+        if len(batch) == 1000:
+            written += feature_store.put_many(batch)
+            batch = []
+    written += feature_store.put_many(batch)
+    return written
@@ -2,7 +2,9 @@
 Pacote de busca híbrida (Elastic/OpenSearch + IA).
 
 — elastic.py  → helpers de consulta/cliente
+— geo.py      → geohash (pré-filtro por células) + haversine vetorizado
 — utils.py    → utilidades (caching do embedding)
+— tracing.py  → tempos por estágio, Prometheus e log de buscas lentas
 — tasks.py    → geração de embedding + indexação (Celery)
 — views.py    → endpoint DRF
 """
\ No newline at end of file
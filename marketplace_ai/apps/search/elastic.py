@@ -2,10 +2,12 @@
 Abstrações finas sobre OpenSearch / Elasticsearch.
 Mantém um único cliente e gera o corpo JSON da busca híbrida.
 """
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from opensearchpy import OpenSearch
 from django.conf import settings
 
+from apps.search.geo import covering_cells
+
 _client: Optional[OpenSearch] = None
 
 
@@ -17,6 +19,50 @@ def es_client() -> OpenSearch:
     return _client
 
 
+def geo_filter(
+    lat: float, lon: float, radius_km: int, cells: List[str] | None = None
+) -> Dict[str, Any]:
+    """Células geohash que cobrem o raio; `geo_distance` só para docs sem `geo_cells`."""
+    if cells is None:
+        cells = covering_cells(lat, lon, radius_km)
+    terms = {"terms": {"geo_cells.keyword": cells}}
+    if not getattr(settings, "SEARCH_GEO_DISTANCE_FALLBACK", True):
+        return terms
+    return {
+        "bool": {
+            "should": [
+                terms,
+                {
+                    "bool": {
+                        "must_not": {"exists": {"field": "geo_cells"}},
+                        "filter": {
+                            "geo_distance": {
+                                "distance": f"{radius_km}km",
+                                "location": {"lat": lat, "lon": lon},
+                            }
+                        },
+                    }
+                },
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+def knn_k(radius_km: int | None) -> int:
+    """
+    Top-k do k-NN proporcional ao raio: o primeiro degrau de
+    GEO_RADIUS_STEPS_KM usa GEO_KNN_K, raios maiores pedem mais candidatos
+    (até GEO_KNN_K_MAX) para o corte por distância não esvaziar o resultado.
+    """
+    base_k = getattr(settings, "GEO_KNN_K", 100)
+    if radius_km is None:
+        return base_k
+    base_radius = settings.GEO_RADIUS_STEPS_KM[0]
+    scaled = int(base_k * max(1.0, radius_km / base_radius))
+    return min(scaled, getattr(settings, "GEO_KNN_K_MAX", 500))
+
+
 def build_query(
     vector: list[float],
     category: str | None = None,
@@ -24,14 +70,20 @@ def build_query(
     lat: float | None = None,
     lon: float | None = None,
     radius_km: int = 20,
-    k: int = 100,
+    k: int | None = None,
+    cells: List[str] | None = None,
 ) -> Dict[str, Any]:
     """
     Gera o JSON da consulta híbrida:
-    * filtro booleano (categoria, preço, geo-distância)
-    * fase de k-NN (vector search)
+    * filtro booleano (categoria, preço, células geohash do raio)
+    * fase de k-NN (vector search); sem `k`, cresce com o raio (knn_k)
     * tamanho = k  (será re-ranqueado na aplicação)
 
+    O filtro geo é um `terms` sobre as células que cobrem o raio — cacheável
+    pelo OpenSearch; o corte exato por distância acontece no re-rank.
+    Documentos indexados antes de `geo_cells` existir caem no `geo_distance`
+    até o `backfill_geohash` rodar (SEARCH_GEO_DISTANCE_FALLBACK).
+
     Retorna dicionário pronto para `es.search(...)`.
     """
     filters: list[dict] = []
@@ -40,14 +92,9 @@ def build_query(
     if price_max is not None:
         filters.append({"range": {"price_min": {"lte": price_max}}})
     if lat is not None and lon is not None:
-        filters.append(
-            {
-                "geo_distance": {
-                    "distance": f"{radius_km}km",
-                    "location": {"lat": lat, "lon": lon},
-                }
-            }
-        )
+        filters.append(geo_filter(lat, lon, radius_km, cells))
+    if k is None:
+        k = knn_k(radius_km if lat is not None and lon is not None else None)
 
     return {
         "size": k,
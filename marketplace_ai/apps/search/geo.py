@@ -0,0 +1,145 @@
+"""
+Geo helpers para o pré-filtro de candidatos.
+
+* encode()           → geohash (base32) de uma coordenada
+* cell_prefixes()    → todos os prefixos do geohash (indexados em `geo_cells`)
+* covering_cells()   → células da maior precisão que cobrem o raio
+* haversine_km()     → distância vetorizada (numpy) usuário → N pontos
+
+O filtro `terms` sobre `geo_cells` é cacheado pelo OpenSearch (bitset por
+segmento), ao contrário do `geo_distance`, que é recalculado por consulta.
+"""
+from __future__ import annotations
+
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# precisão máxima guardada no perfil / índice (~153 m x 153 m)
+GEOHASH_PRECISION = 7
+
+# teto de células no filtro `terms` de um raio
+MAX_COVERING_CELLS = 96
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Codifica (lat, lon) em geohash com `precision` caracteres."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars: List[str] = []
+    bits = 0
+    n_bits = 0
+    even = True  # bits pares → longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            n_bits = 0
+
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(altura, largura) da célula em graus para a precisão dada."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cell_prefixes(geohash: str) -> List[str]:
+    """'6gyf4bf' → ['6', '6g', '6gy', …, '6gyf4bf']."""
+    return [geohash[:i] for i in range(1, len(geohash) + 1)]
+
+
+def _bbox(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) do quadrado que contém o círculo."""
+    km_per_deg = math.pi * EARTH_RADIUS_KM / 180.0
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    d_lat = radius_km / km_per_deg
+    d_lon = min(radius_km / (km_per_deg * cos_lat), 180.0)
+    return max(lat - d_lat, -90.0), min(lat + d_lat, 90.0), lon - d_lon, lon + d_lon
+
+
+def _steps(lo: float, hi: float, step: float) -> List[float]:
+    """Pontos de `lo` a `hi` espaçados de `step` (inclui `hi`): tocam toda faixa de células."""
+    points = []
+    value = lo
+    while value < hi:
+        points.append(value)
+        value += step
+    points.append(hi)
+    return points
+
+
+def precision_for_radius(lat: float, radius_km: float) -> int:
+    """
+    Maior precisão cujas células cobrem o quadrado do raio com no máximo
+    MAX_COVERING_CELLS células.
+
+    Células finas seguem o contorno do círculo (para 20–100 km a precisão
+    fica em 4); a vizinhança 3x3 de células ≥ raio cobria ~470 km e enchia o
+    top-k do k-NN de candidatos que o re-rank depois descartava.
+    """
+    lat_min, lat_max, lon_min, lon_max = _bbox(lat, 0.0, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        d_lat, d_lon = cell_size(precision)
+        rows = math.ceil((lat_max - lat_min) / d_lat) + 1
+        cols = math.ceil((lon_max - lon_min) / d_lon) + 1
+        if rows * cols <= MAX_COVERING_CELLS:
+            return precision
+    return 1
+
+
+def covering_cells(lat: float, lon: float, radius_km: float) -> List[str]:
+    """Células (deduplicadas) que cobrem o quadrado de lado 2 x `radius_km`."""
+    precision = precision_for_radius(lat, radius_km)
+    d_lat, d_lon = cell_size(precision)
+    lat_min, lat_max, lon_min, lon_max = _bbox(lat, lon, radius_km)
+    cells: List[str] = []
+    for n_lat in _steps(lat_min, lat_max, d_lat):
+        for n_lon in _steps(lon_min, lon_max, d_lon):
+            cell = encode(n_lat, (n_lon + 180.0) % 360.0 - 180.0, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def haversine_km(
+    origin: Tuple[float, float],
+    lats: Sequence[float],
+    lons: Sequence[float],
+) -> np.ndarray:
+    """Distâncias (km) de `origin` até cada ponto — um único passe numpy."""
+    lat0, lon0 = np.radians(origin[0]), np.radians(origin[1])
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    a = (
+        np.sin((lat - lat0) / 2.0) ** 2
+        + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,30 @@
+"""
+Comando Django para preencher geohash de perfis antigos e reindexá-los.
+
+Uso:
+    python manage.py backfill_geohash --batch-size=500
+"""
+from django.core.management.base import BaseCommand
+
+from apps.search.tasks import backfill_geohash
+
+
+class Command(BaseCommand):
+    help = 'Preenche geohash/geo_cells de perfis indexados antes do pré-filtro geo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Perfis por lote (cada lote é uma task)'
+        )
+
+    def handle(self, *args, **options):
+        backfill_geohash.delay(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Backfill agendado. Depois de concluído e reindexado, '
+                'desligue SEARCH_GEO_DISTANCE_FALLBACK.'
+            )
+        )
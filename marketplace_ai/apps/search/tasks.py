@@ -2,6 +2,7 @@
 Tasks Celery ligadas à busca:
 1) gera embedding OpenAI do perfil
 2) indexa/atualiza documento no OpenSearch
+3) preenche geohash de perfis antigos e os reindexa (geo_cells)
 """
 from __future__ import annotations
 
@@ -10,6 +11,8 @@ from celery import shared_task
 from django.conf import settings
 from opensearchpy import OpenSearch
 from apps.profiles.models import Professional
+from apps.ranking import feature_store
+from apps.search.geo import cell_prefixes, encode as geohash_encode
 from apps.search.utils import embed
 
 client = OpenSearch(settings.ELASTIC_HOST)
@@ -30,7 +33,14 @@ def generate_embedding(prof_id: int) -> None:
 
 @shared_task
 def index_professional(prof_id: int) -> None:
-    """Serializa e envia documento completo ao índice de busca."""
+    """
+    Serializa e envia o documento ao índice de busca.
+
+    As métricas dinâmicas vivem no feature store (apps.ranking.feature_store);
+    o documento leva uma cópia delas da última indexação, usada pelo re-rank
+    só quando o store não tem a linha. Salvar apenas métricas não reindexa,
+    então essa cópia pode estar defasada.
+    """
     prof = Professional.objects.get(pk=prof_id)
     doc = {
         "title": prof.title,
@@ -38,8 +48,10 @@ def index_professional(prof_id: int) -> None:
         "category": prof.category,
         "price_min": float(prof.price_min),
         "location": {"lat": prof.location.y, "lon": prof.location.x},
+        "geohash": prof.geohash,
+        "geo_cells": cell_prefixes(prof.geohash),  # pré-filtro por vizinhança
         "embedding": prof.embedding,
-        # métricas dinâmicas
+        # métricas dinâmicas (fallback do feature store)
         "rating": prof.rating,
         "reviews_count": prof.reviews_count,
         "confidence_score": prof.confidence_score,
@@ -52,9 +64,35 @@ def index_professional(prof_id: int) -> None:
         "lattes_id": prof.lattes_id,
         "updated_at": prof.updated_at,
     }
+    feature_store.put_professional(prof)
     client.index(
         index=settings.ELASTIC_INDEX,
         id=str(prof.id),
         body=doc,
         refresh="wait_for",
-    )
\ No newline at end of file
+    )
+
+
+@shared_task
+def backfill_geohash(batch_size: int = 500, after: str | None = None) -> dict:
+    """
+    Preenche `geohash` de perfis salvos antes do pré-filtro geo e reindexa
+    cada um (docs antigos não têm `geo_cells`). Um lote por execução, em
+    ordem de pk; reagenda a si mesma até acabar.
+
+    bulk_update não dispara post_save: nada de regerar embeddings.
+    """
+    queryset = Professional.objects.filter(geohash="").exclude(location=None).order_by("pk")
+    if after:
+        queryset = queryset.filter(pk__gt=after)
+    batch = list(queryset.only("pk", "location")[:batch_size])
+
+    for prof in batch:
+        prof.geohash = geohash_encode(prof.location.y, prof.location.x)
+    Professional.objects.bulk_update(batch, ["geohash"])
+    for prof in batch:
+        index_professional.delay(prof.pk)
+
+    if len(batch) == batch_size:
+        backfill_geohash.delay(batch_size, str(batch[-1].pk))
+    return {"updated": len(batch), "completed": len(batch) < batch_size}
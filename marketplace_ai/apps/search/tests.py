@@ -0,0 +1,48 @@
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+from rest_framework.test import APIClient
+
+
+class EmbedAPITests(SimpleTestCase):
+    """/embed/ com os headers que o backend envia"""
+
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch("apps.search.views.embed", return_value=[0.5, -1.0, 2.0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_octet_stream_accept_returns_raw_vector(self):
+        response = self.client.post(
+            "/embed/",
+            {"text": "eletricista"},
+            format="json",
+            HTTP_ACCEPT="application/octet-stream",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["X-Embedding-Dims"], "3")
+        np.testing.assert_array_equal(
+            np.frombuffer(response.content, dtype="<f4"), [0.5, -1.0, 2.0]
+        )
+
+    def test_raw_encoding_with_json_fallback_accept(self):
+        response = self.client.post(
+            "/embed/",
+            {"text": "eletricista", "dtype": "float16", "encoding": "raw"},
+            format="json",
+            HTTP_ACCEPT="application/octet-stream, application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Embedding-Dtype"], "float16")
+        self.assertEqual(response["X-Embedding-Dims"], "3")
+
+    def test_json_is_still_the_default(self):
+        response = self.client.post("/embed/", {"text": "eletricista"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"embedding": [0.5, -1.0, 2.0]})
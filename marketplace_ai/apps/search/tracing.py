@@ -0,0 +1,138 @@
+"""
+Tracing por requisição do pipeline de busca.
+
+    trace = start_trace(engine="knn")
+    with trace.stage("embed"):
+        ...
+    trace.count("recall", len(hits))
+    trace.finish(query_body=body)
+
+* durações por estágio, contagem de candidatos e cache hits num contexto
+  por requisição (contextvars — seguro com threads e async)
+* histogramas Prometheus por estágio e engine (django_prometheus expõe /metrics)
+* requisições lentas vão, com o corpo da consulta, para o logger
+  `search.slow` — vetores (`embedding`, `knn.*.vector`) são trocados por
+  um resumo, não 1536 floats por linha de log
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+
+slow_logger = logging.getLogger("search.slow")
+
+VECTOR_KEYS = {"vector", "embedding", "query_vector"}
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "search_stage_seconds",
+    "Duração de cada estágio do pipeline de busca",
+    ["engine", "stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+SEARCH_CANDIDATES = Histogram(
+    "search_candidates",
+    "Candidatos por estágio do pipeline de busca",
+    ["engine", "stage"],
+    buckets=(0, 1, 5, 10, 30, 50, 100, 200, 500),
+)
+SEARCH_CACHE = Counter(
+    "search_cache_total",
+    "Acessos a caches do pipeline de busca",
+    ["engine", "cache", "result"],
+)
+
+_current: contextvars.ContextVar[Optional["SearchTrace"]] = contextvars.ContextVar(
+    "search_trace", default=None
+)
+
+
+class SearchTrace:
+    """Medições de uma única requisição de busca."""
+
+    def __init__(self, engine: str) -> None:
+        self.engine = engine
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}  # ms
+        self.counts: Dict[str, int] = {}
+        self.cache: Dict[str, bool] = {}
+        self.total_ms: float | None = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed * 1000
+            SEARCH_STAGE_SECONDS.labels(self.engine, name).observe(elapsed)
+
+    def count(self, stage: str, n: int) -> None:
+        self.counts[stage] = n
+        SEARCH_CANDIDATES.labels(self.engine, stage).observe(n)
+
+    def cache_hit(self, cache: str, hit: bool) -> None:
+        self.cache[cache] = hit
+        SEARCH_CACHE.labels(self.engine, cache, "hit" if hit else "miss").inc()
+
+    def finish(self, query_body: Any = None) -> None:
+        """Fecha o trace; amostra a requisição no log de lentas se preciso."""
+        elapsed = time.perf_counter() - self.started
+        self.total_ms = elapsed * 1000
+        SEARCH_STAGE_SECONDS.labels(self.engine, "total").observe(elapsed)
+
+        if self.total_ms >= getattr(settings, "SEARCH_SLOW_MS", 500):
+            slow_logger.warning(
+                "slow search %s",
+                json.dumps(
+                    {"trace": self.as_dict(), "query_body": strip_vectors(query_body)},
+                    default=str,
+                ),
+            )
+        _current.set(None)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "engine": self.engine,
+            "total_ms": round(self.total_ms, 2) if self.total_ms is not None else None,
+            "stages_ms": {k: round(v, 2) for k, v in self.stages.items()},
+            "candidates": dict(self.counts),
+            "cache": dict(self.cache),
+        }
+
+
+def start_trace(engine: str) -> SearchTrace:
+    trace = SearchTrace(engine)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[SearchTrace]:
+    """Trace da requisição corrente (None fora de uma busca)."""
+    return _current.get()
+
+
+def debug_requested(request) -> bool:
+    """Header `X-Search-Debug: 1` pede o bloco `timings` na resposta."""
+    return request.headers.get("X-Search-Debug", "") in ("1", "true", "True")
+
+
+def strip_vectors(body: Any) -> Any:
+    """Cópia do corpo com os vetores da consulta trocados por '<N floats>'."""
+    if isinstance(body, dict):
+        return {
+            key: f"<{len(value)} floats>"
+            if key in VECTOR_KEYS and isinstance(value, (list, tuple))
+            else strip_vectors(value)
+            for key, value in body.items()
+        }
+    if isinstance(body, list):
+        return [strip_vectors(item) for item in body]
+    return body
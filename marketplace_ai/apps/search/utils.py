@@ -4,15 +4,20 @@ e geração de embeddings pela OpenAI.
 """
 from __future__ import annotations
 
+import base64
 import functools
 import os
 import time
-from typing import List
+from typing import List, Sequence
 
+import numpy as np
 import openai
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# dtypes aceitos no transporte binário de embeddings (sempre little-endian)
+EMBEDDING_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
 
 @functools.lru_cache(maxsize=2048)
 def embed(text: str) -> List[float]:
@@ -35,4 +40,20 @@ def _embed_uncached(text_with_bucket: str) -> List[float]:
         model="text-embedding-3-small",
         input=text,
     )
-    return resp["data"][0]["embedding"]
\ No newline at end of file
+    return resp["data"][0]["embedding"]
+
+
+def encode_vector(vector: Sequence[float], dtype: str = "float32") -> bytes:
+    """
+    Serializa o embedding como buffer little-endian (float32 ou float16).
+
+    1536 floats viram 6 KiB (f32) ou 3 KiB (f16) — contra ~30 KiB em JSON.
+    """
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"dtype não suportado: {dtype}")
+    return np.asarray(vector, dtype=EMBEDDING_DTYPES[dtype]).tobytes()
+
+
+def encode_vector_b64(vector: Sequence[float], dtype: str = "float32") -> str:
+    """Mesmo buffer de `encode_vector`, em base64 para caber num corpo JSON."""
+    return base64.b64encode(encode_vector(vector, dtype)).decode("ascii")
@@ -1,14 +1,19 @@
 """
 Endpoint REST /api/search/  – recall híbrido, re-rank e logging de impressão.
+Endpoint REST /embed/       – embedding da consulta para clientes internos.
 """
 from typing import Any, Dict, List, Tuple
 
 from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
 from apps.search.elastic import es_client, build_query
-from apps.search.utils import embed
+from apps.search.geo import covering_cells
+from apps.search.tracing import debug_requested, start_trace
+from apps.search.utils import EMBEDDING_DTYPES, embed, encode_vector, encode_vector_b64
 from apps.ranking.scorer import rank_hits
 from apps.logs.tasks import log_impression
 
@@ -21,6 +26,8 @@ class SearchAPIView(APIView):
     * cat       – categoria (keyword)
     * price_max – float
     * lat / lon – geo coord.
+
+    Header `X-Search-Debug: 1` inclui o bloco `timings` (estágios em ms).
     """
 
     def get(self, request, *args, **kwargs):
@@ -45,30 +52,126 @@ class SearchAPIView(APIView):
             else None
         )
 
-        # 1) embedding da consulta
-        q_vector = embed(q)
+        trace = start_trace(engine="knn")
 
-        # 2) recall  (top-K = 100)
-        body = build_query(q_vector, category, price, lat, lon)
-        res = es_client().search(index=settings.ELASTIC_INDEX, body=body)
-        hits = res["hits"]["hits"]
+        # 1) embedding da consulta
+        with trace.stage("embed"):
+            hits_before = embed.cache_info().hits
+            q_vector = embed(q)
+            trace.cache_hit("embed", embed.cache_info().hits > hits_before)
 
-        # 3) re-rank heurístico
-        ranked = rank_hits(hits, user_coords=(lat, lon) if lat and lon else None)
+        # 2) recall  (top-K = 100) + 3) re-rank heurístico
+        #    com geo, o raio cresce enquanto vierem poucos candidatos
+        #    (degrau com as mesmas células do anterior só refaz o corte por raio)
+        user_coords = (lat, lon) if lat and lon else None
+        radius_steps = settings.GEO_RADIUS_STEPS_KM
+        if user_coords is None:
+            radius_steps = radius_steps[:1]
+        prev_cells = None
+        for radius_km in radius_steps:
+            cells = covering_cells(lat, lon, radius_km) if user_coords else None
+            if cells is None or cells != prev_cells:
+                body = build_query(
+                    q_vector, category, price, lat, lon, radius_km=radius_km, cells=cells
+                )
+                with trace.stage("recall"):
+                    res = es_client().search(index=settings.ELASTIC_INDEX, body=body)
+                hits = res["hits"]["hits"]
+                trace.count("recall", len(hits))
+            prev_cells = cells
+            with trace.stage("rerank"):
+                ranked = rank_hits(hits, user_coords=user_coords, radius_km=radius_km)
+            trace.count("rerank", len(ranked))
+            if len(ranked) >= settings.GEO_MIN_CANDIDATES:
+                break
 
         # 4) logging de impressão (top 10)
         user_id = request.user.id if request.user.is_authenticated else None
-        log_impression.delay(user_id, q, [h["_id"] for h in ranked[:10]])
+        with trace.stage("log_impression"):
+            log_impression.delay(user_id, q, [h["_id"] for h in ranked[:10]])
 
         # 5) serialização da resposta
-        payload: List[Dict[str, Any]] = [
-            {
-                "id": h["_id"],
-                "title": h["_source"]["title"],
-                "score": round(h["_match_score"], 4),
-                "rating": h["_source"].get("rating"),
-                "price_min": h["_source"].get("price_min"),
-            }
-            for h in ranked[:30]
-        ]
-        return Response({"results": payload})
\ No newline at end of file
+        with trace.stage("serialize"):
+            payload: List[Dict[str, Any]] = [
+                {
+                    "id": h["_id"],
+                    "title": h["_source"]["title"],
+                    "score": round(h["_match_score"], 4),
+                    "rating": h["_source"].get("rating"),
+                    "price_min": h["_source"].get("price_min"),
+                }
+                for h in ranked[:30]
+            ]
+
+        trace.finish(query_body={"q": q, **body})
+        data: Dict[str, Any] = {"results": payload}
+        if debug_requested(request):
+            data["timings"] = trace.as_dict()
+        return Response(data)
+
+
+class OctetStreamRenderer(BaseRenderer):
+    """
+    Aceita `Accept: application/octet-stream` na negociação do DRF.
+
+    O corpo binário sai pronto do `HttpResponse`; respostas de erro (dict)
+    seguem como JSON para o cliente conseguir ler o `detail`.
+    """
+
+    media_type = "application/octet-stream"
+    format = "bin"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        return JSONRenderer().render(data)
+
+
+class EmbedAPIView(APIView):
+    """
+    POST {"text": str, "dtype": "float32"|"float16", "encoding": "raw"|"base64"|"json"}
+
+    * raw (ou Accept: application/octet-stream) — corpo binário little-endian;
+      dtype e dimensão vão nos headers X-Embedding-Dtype / X-Embedding-Dims
+    * base64 — {"embedding_b64", "dtype", "dims"}
+    * json   — {"embedding": [...]}  (formato legado, padrão)
+    """
+
+    renderer_classes = [JSONRenderer, OctetStreamRenderer]
+
+    def post(self, request, *args, **kwargs):
+        text = str(request.data.get("text", "")).strip()
+        if not text:
+            return Response({"detail": "text obrigatório"}, status=400)
+
+        dtype = request.data.get("dtype", "float32")
+        if dtype not in EMBEDDING_DTYPES:
+            return Response({"detail": f"dtype inválido: {dtype}"}, status=400)
+
+        encoding = request.data.get("encoding")
+        if encoding is None:
+            accept = request.headers.get("Accept", "")
+            encoding = "raw" if "application/octet-stream" in accept else "json"
+
+        vector = embed(text)
+
+        if encoding == "raw":
+            response = HttpResponse(
+                encode_vector(vector, dtype), content_type="application/octet-stream"
+            )
+            response["X-Embedding-Dtype"] = dtype
+            response["X-Embedding-Dims"] = str(len(vector))
+            return response
+
+        if encoding == "base64":
+            return Response(
+                {
+                    "embedding_b64": encode_vector_b64(vector, dtype),
+                    "dtype": dtype,
+                    "dims": len(vector),
+                }
+            )
+
+        return Response({"embedding": vector})
@@ -1 +1,31 @@
-from __future__ import absolute_import, unicode_literals\nimport os\nfrom celery import Celery\nfrom celery.schedules import crontab\n\nos.environ.setdefault(\"DJANGO_SETTINGS_MODULE\", \"marketplace.settings\")\napp = Celery(\"marketplace\")\napp.config_from_object(\"django.conf:settings\", namespace=\"CELERY\")\napp.autodiscover_tasks()\n\n# Configuração de tasks periódicas\napp.conf.beat_schedule = {\n    'refresh-academic-scores': {\n        'task': 'apps.ingest.tasks.refresh_all_academic_scores',\n        'schedule': crontab(hour=4, minute=0, day_of_week='sunday'),  # Domingo 4h\n    },\n    'update-metrics-daily': {\n        'task': 'apps.ranking.tasks.update_metrics',\n        'schedule': crontab(hour=2, minute=0),  # Todo dia 2h\n    },\n}\n\napp.conf.timezone = 'America/Sao_Paulo'
\ No newline at end of file
+from __future__ import absolute_import, unicode_literals
+import os
+from celery import Celery
+from celery.schedules import crontab
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "marketplace.settings")
+app = Celery("marketplace")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+# Configuração de tasks periódicas
+app.conf.beat_schedule = {
+    'refresh-academic-scores': {
+        'task': 'apps.ingest.tasks.refresh_all_academic_scores',
+        'schedule': crontab(hour=4, minute=0, day_of_week='sunday'),  # Domingo 4h
+    },
+    'update-metrics-daily': {
+        'task': 'apps.ranking.tasks.update_metrics',
+        'schedule': crontab(hour=2, minute=0),  # Todo dia 2h
+    },
+    'sync-feature-store': {
+        'task': 'apps.ranking.tasks.sync_feature_store',
+        'schedule': crontab(hour=3, minute=30),  # Todo dia 3h30
+    },
+    'reconcile-dispute-counters': {
+        'task': 'apps.ranking.tasks.reconcile_dispute_counters',
+        'schedule': crontab(hour=1, minute=30),  # Todo dia 1h30
+    },
+}
+
+app.conf.timezone = 'America/Sao_Paulo'
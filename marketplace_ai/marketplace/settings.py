@@ -61,6 +61,9 @@ STATIC_URL = "static/"
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
+# Feature store de ranking (métricas dinâmicas por profissional)
+RANKING_FEATURE_STORE_URL = os.getenv("RANKING_FEATURE_STORE_URL", CELERY_BROKER_URL)
+
 from celery.schedules import crontab
 CELERY_BEAT_SCHEDULE = {
     "train-ltr-daily": {
@@ -78,6 +81,19 @@ CELERY_BEAT_SCHEDULE = {
 ELASTIC_HOST = os.getenv("ELASTIC_HOST", "http://elastic:9200")
 ELASTIC_INDEX = os.getenv("ELASTIC_INDEX", "profissionais_v1")
 
+# Pré-filtro geo: raios tentados em ordem até haver candidatos suficientes
+GEO_RADIUS_STEPS_KM = (20, 50, 100)
+GEO_MIN_CANDIDATES = 10
+# Top-k do k-NN no primeiro raio; cresce proporcional ao raio até o teto
+GEO_KNN_K = 100
+GEO_KNN_K_MAX = 500
+# Docs sem `geo_cells` (indexados antes do geohash) ainda filtrados por geo_distance;
+# desligar depois de `manage.py backfill_geohash`
+SEARCH_GEO_DISTANCE_FALLBACK = os.getenv("SEARCH_GEO_DISTANCE_FALLBACK", "1") == "1"
+
+# Buscas acima deste tempo vão para o logger `search.slow` com o corpo completo
+SEARCH_SLOW_MS = int(os.getenv("SEARCH_SLOW_MS", "500"))
+
 # Pesos de ranking (fallback se não houver registros no banco)
 RANKING_WEIGHTS_DEFAULT = {
     "sim_semantico": 0.40,
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.search.views import EmbedAPIView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/search/", include("apps.search.urls")),
+    path("embed/", EmbedAPIView.as_view(), name="embed-api"),
     path("api/logs/", include("apps.logs.urls")),
     path("", include("django_prometheus.urls")),
 ]
\ No newline at end of file